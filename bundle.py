@@ -0,0 +1,222 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import colors
+import file_io
+import transfer
+import os
+import re
+import time
+import hashlib
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Directory within the archive and within Blender's colormanagement directory, into which the LUTs are extracted
+LUT_DIRECTORY = "custom"
+
+# Name of the archive entry that lists the SHA-256 of every other entry, in the format of sha256sum
+CHECKSUM_FILENAME = "SHA256SUMS"
+
+# Size of the chunks in which the LUTs are streamed into the archive
+CHUNK_SIZE = 2 ** 20
+
+# Colorspace of a false color view transform, following the section "Modifying the OCIO configuration" of the README
+OCIO_COLORSPACE = """  - !<ColorSpace>
+    name: {name}
+    family: display
+    equalitygroup:
+    bitdepth: 32f
+    description: |
+      {description}
+    isdata: false
+    allocation: lg2
+    allocationvars: [-12.473931188, 12.526068812]
+    from_reference: !<GroupTransform>
+        children:
+            - !<ColorSpaceTransform> {{src: Linear, dst: Filmic Log}}
+            - !<FileTransform> {{src: {file}, interpolation: best}}
+
+"""
+
+# Luminance grid of the worker processes, set by _init_worker()
+_luminance_grid = None
+
+
+def _init_worker(luminance_grid):
+    global _luminance_grid
+    _luminance_grid = luminance_grid
+
+
+def get_view_name(filename):
+    """
+    :param filename: Filename of a pre-defined colormap, e.g. ignis.spi3d
+    :return: Name of the view transform, e.g. False Color Ignis
+    """
+    return "False Color " + os.path.splitext(filename)[0].replace("_", " ").title()
+
+
+def get_lut_filename(filename, lut_format):
+    """
+    :param filename: Filename of a pre-defined colormap
+    :param lut_format: One of file_io.LUT_FORMATS
+    :return: Filename of the LUT in the given format
+    """
+    return os.path.splitext(filename)[0] + file_io.LUT_EXTENSIONS[lut_format]
+
+
+def _generate_lut(item):
+    """
+    Generates the LUT of a pre-defined colormap with the same transfer function as the default generator.
+    :param item: Tuple of the name of the dictionary in the colors module, the filename of the colormap, the LUT format
+        and the cube size
+    :return: Bytes of the LUT file
+    """
+    colormaps, filename, lut_format, cube_size = item
+    if colormaps == "colormaps":
+        transfer_function = transfer.ColormapTransfer(colors.colormaps[filename])
+    else:
+        transfer_function = transfer.EvTransfer(colors.ev_colormaps[filename])
+    return file_io.serialize_lut(transfer.evaluate_grid(transfer_function, _luminance_grid), cube_size, lut_format)
+
+
+def _find_line(lines, predicate, start=0):
+    for idx in range(start, len(lines)):
+        if predicate(lines[idx]):
+            return idx
+    return None
+
+
+def make_ocio_config(base_config, lut_files):
+    """
+    Adds a view transform to the sRGB display of Blender's OCIO configuration for every LUT. The LUTs are expected in
+    the directory LUT_DIRECTORY next to the configuration, which is added to the search path.
+    :param base_config: Content of the ocio.config that is shipped with Blender
+    :param lut_files: List of the filenames of the LUTs
+    :return: Content of the new ocio.config
+    """
+    lines = base_config.splitlines(keepends=True)
+    views = [(get_view_name(filename), filename) for filename in lut_files]
+
+    search_idx = _find_line(lines, lambda line: line.startswith("search_path:"))
+    if search_idx is None:
+        raise ValueError("The OCIO configuration doesn't define a search_path.")
+    search_paths = [path for path in lines[search_idx][len("search_path:"):].strip().strip('"').split(":") if path]
+    if LUT_DIRECTORY not in search_paths:
+        search_paths.append(LUT_DIRECTORY)
+    lines[search_idx] = f'search_path: "{":".join(search_paths)}"\n'
+
+    displays_idx = _find_line(lines, lambda line: line.rstrip() == "displays:")
+    srgb_idx = None
+    if displays_idx is not None:
+        srgb_idx = _find_line(lines, lambda line: line.rstrip() == "  sRGB:", displays_idx)
+    if srgb_idx is None:
+        raise ValueError("The OCIO configuration doesn't define the sRGB display.")
+    views_end = _find_line(lines, lambda line: not line.startswith("    - !<View>"), srgb_idx + 1)
+    views_end = len(lines) if views_end is None else views_end
+    lines[views_end:views_end] = [f"    - !<View> {{name: {name}, colorspace: {name}}}\n" for name, _ in views]
+
+    # Views are only shown, if they are listed in a non-empty active_views
+    active_idx = _find_line(lines, lambda line: line.startswith("active_views:"))
+    if active_idx is not None:
+        match = re.match(r"active_views:\s*\[(.*)\]", lines[active_idx])
+        active_views = [view.strip() for view in match.group(1).split(",") if view.strip()] if match else []
+        if active_views:
+            active_views += [name for name, _ in views if name not in active_views]
+            lines[active_idx] = f"active_views: [{', '.join(active_views)}]\n"
+
+    colorspaces_idx = _find_line(lines, lambda line: line.rstrip() == "colorspaces:")
+    if colorspaces_idx is None:
+        raise ValueError("The OCIO configuration doesn't define any colorspaces.")
+    colorspaces_end = _find_line(lines, lambda line: line[:1] not in ("", " ", "\n", "\r", "#"), colorspaces_idx + 1)
+    colorspaces_end = len(lines) if colorspaces_end is None else colorspaces_end
+    if not lines[colorspaces_end - 1].endswith("\n"):
+        lines[colorspaces_end - 1] += "\n"
+    lines[colorspaces_end:colorspaces_end] = [
+        OCIO_COLORSPACE.format(name=name,
+                               description=f"{name[len('False Color '):]} false color view transform",
+                               file=filename)
+        for name, filename in views]
+    return "".join(lines)
+
+
+def _write_entry(archive, name, content, date_time):
+    """
+    Streams content into a new entry of the archive and stores its SHA-256 as comment of the entry.
+    :return: SHA-256 as hex string
+    """
+    info = zipfile.ZipInfo(name, date_time)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    checksum = hashlib.sha256()
+    with archive.open(info, 'w') as entry:
+        for start in range(0, len(content), CHUNK_SIZE):
+            chunk = content[start:start + CHUNK_SIZE]
+            checksum.update(chunk)
+            entry.write(chunk)
+    info.comment = f"sha256:{checksum.hexdigest()}".encode("ascii")
+    return checksum.hexdigest()
+
+
+def save_bundle(file_path, ocio_config_path, lut_format="spi3d", workers=None):
+    """
+    Generates the LUTs of all pre-defined colormaps in a pool of worker processes and streams them into a zip archive,
+    together with an ocio.config that defines their view transforms and a SHA256SUMS file. The LUTs are stored in the
+    directory LUT_DIRECTORY, so the archive can be extracted into Blender's colormanagement directory. The LUTs are
+    written in the order of the colormaps, while the remaining ones are still being generated.
+    :param file_path: Path, including filename, where the archive should be saved
+    :param ocio_config_path: Path to the ocio.config that is shipped with Blender, which is extended by the view
+        transforms
+    :param lut_format: Either spi3d or cube, the formats supported by OCIO
+    :param workers: Number of worker processes, defaults to the number of processors. If 1, the LUTs are generated in
+        the current process.
+    :return: SHA-256 of the archive as hex string
+    """
+    if lut_format not in ("spi3d", "cube"):
+        raise ValueError(f"OCIO doesn't support LUTs in the {lut_format} format.")
+
+    cube_size = 65
+    items = [("colormaps", filename, lut_format, cube_size) for filename in colors.colormaps]
+    items += [("ev_colormaps", filename, lut_format, cube_size) for filename in colors.ev_colormaps]
+    lut_files = [get_lut_filename(filename, lut_format) for _, filename, _, _ in items]
+    with open(ocio_config_path, 'r') as infile:
+        ocio_config = make_ocio_config(infile.read(), lut_files)
+
+    date_time = time.localtime()[:6]
+    checksums = {}
+    # The archive is written to a non-seekable stream, the entries are therefore followed by data descriptors
+    archive_checksum = hashlib.sha256()
+    luminance_grid = transfer.get_luminance_grid(cube_size)
+    with file_io.open_atomic(file_path, binary=True, checksum=archive_checksum) as outfile, \
+            zipfile.ZipFile(outfile, 'w', zipfile.ZIP_DEFLATED) as archive, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(luminance_grid,)) as executor:
+        checksums["ocio.config"] = _write_entry(archive, "ocio.config", ocio_config.encode("utf-8"), date_time)
+        if workers == 1:
+            _init_worker(luminance_grid)
+            contents = map(_generate_lut, items)
+        else:
+            contents = executor.map(_generate_lut, items)
+        for lut_file, content in zip(lut_files, contents):
+            name = f"{LUT_DIRECTORY}/{lut_file}"
+            checksums[name] = _write_entry(archive, name, content, date_time)
+            print(f"Added {name}")
+        sums = "".join(f"{checksum}  {name}\n" for name, checksum in checksums.items())
+        _write_entry(archive, CHECKSUM_FILENAME, sums.encode("ascii"), date_time)
+    return archive_checksum.hexdigest()
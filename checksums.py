@@ -0,0 +1,141 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import file_io
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Filename of the checksum manifest, which is saved in the output directory of every run
+MANIFEST_FILENAME = "checksums.json"
+
+# Size of the chunks in which files are read for hashing. Larger chunks are hashed without holding the GIL.
+CHUNK_SIZE = 2 ** 20
+
+
+def hash_file(file_path):
+    """
+    :param file_path: Path to the file
+    :return: SHA-256 of the file as hex string
+    """
+    checksum = hashlib.sha256()
+    with open(file_path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(CHUNK_SIZE), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def make_entry(file_path, sha256, parameters):
+    """
+    :param file_path: Path to a saved file
+    :param sha256: SHA-256 of the file, as computed while it was saved
+    :param parameters: JSON serializable dictionary with the parameters the file was generated with
+    :return: Entry of the checksum manifest
+    """
+    return {"sha256": sha256, "size": os.path.getsize(file_path), "parameters": parameters}
+
+
+def get_manifest_path(directory):
+    """
+    :param directory: Output directory
+    :return: Path to the checksum manifest of the directory
+    """
+    return os.path.join(directory, MANIFEST_FILENAME)
+
+
+def load_checksum_manifest(file_path):
+    """
+    :param file_path: Path to the checksum manifest
+    :return: Dictionary with the entry of every file, keyed by the path relative to the directory of the manifest
+    """
+    with open(file_path, 'r', encoding="utf-8") as infile:
+        return json.load(infile)["files"]
+
+
+def update_checksum_manifest(entries):
+    """
+    Adds the entries of saved files to the checksum manifests of their directories. Entries of files that were saved
+    by earlier runs are kept, as long as the files still exist.
+    :param entries: Dictionary with the entry of every saved file, as returned by make_entry(), keyed by its path
+    :return: List of the paths of the updated manifests
+    """
+    directories = {}
+    for file_path, entry in entries.items():
+        directory, filename = os.path.split(os.path.abspath(file_path))
+        directories.setdefault(directory, {})[filename] = entry
+
+    manifest_paths = []
+    for directory, directory_entries in directories.items():
+        manifest_path = get_manifest_path(directory)
+        files = {}
+        if os.path.exists(manifest_path):
+            files = {name: entry for name, entry in load_checksum_manifest(manifest_path).items()
+                     if os.path.exists(os.path.join(directory, name))}
+        files.update(directory_entries)
+        content = {"created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "files": dict(sorted(files.items()))}
+        file_io.save_file([json.dumps(content, indent=2), "\n"], manifest_path)
+        manifest_paths.append(manifest_path)
+    return manifest_paths
+
+
+def _verify_file(item):
+    """
+    :param item: Tuple of the path to the deployed file and its entry in the checksum manifest
+    :return: Status of the file, either ok, missing, size or sha256
+    """
+    file_path, entry = item
+    if not os.path.exists(file_path):
+        return "missing"
+    # Comparing the sizes first avoids hashing truncated files
+    if os.path.getsize(file_path) != entry["size"]:
+        return "size"
+    return "ok" if hash_file(file_path) == entry["sha256"] else "sha256"
+
+
+def verify_directory(directory, manifest_path=None, workers=None):
+    """
+    Checks the files of a deployed directory against a checksum manifest. The files are hashed in a pool of threads,
+    hashlib releases the GIL while it hashes the chunks.
+    :param directory: Directory that contains the deployed files
+    :param manifest_path: Path to the checksum manifest, defaults to the manifest within the directory
+    :param workers: Number of threads, defaults to the default of ThreadPoolExecutor
+    :return: Dictionary with the status of every file of the manifest, see _verify_file()
+    """
+    if manifest_path is None:
+        manifest_path = get_manifest_path(directory)
+    files = load_checksum_manifest(manifest_path)
+    items = [(os.path.join(directory, name), entry) for name, entry in files.items()]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(files, executor.map(_verify_file, items)))
+
+
+def print_verification(results):
+    """
+    Prints the status of every file and a summary.
+    :param results: Dictionary with the status of every file, as returned by verify_directory()
+    """
+    messages = {"ok": "OK", "missing": "MISSING", "size": "FAILED (size differs)", "sha256": "FAILED (SHA-256 differs)"}
+    for name, status in results.items():
+        print(f"{name}: {messages[status]}")
+    failed = sum(status != "ok" for status in results.values())
+    print(f"{len(results) - failed} of {len(results)} files verified, {failed} failed")
@@ -83,6 +83,97 @@ def relative_luminance(red, green, blue):
     return 0.2126 * red + 0.7512 * green + 0.0722 * blue
 
 
+def denormalize_value(x, exponent_min, exponent_max):
+    """
+    Inverse of normalize_value().
+    :param x: Normalized value
+    :param exponent_min: Smallest exponent for the input values
+    :param exponent_max: Largest exponent for the input values
+    :return: Input value
+    """
+    return 2 ** (x * abs(exponent_max - exponent_min) + exponent_min)
+
+
+def lut_entry_luminance(red, green, blue):
+    """
+    Calculate the relative luminance that determines the color of a LUT entry. The LUT generators list the index of
+    the blue input in the second column of the spi3d files and the index of the green input in the third, therefore
+    the entry at the red, green and blue indices of a spi3d file holds the color for the luminance of red, blue and
+    green.
+    :param red: Red, value in range [0.0, 1.0]
+    :param green: Green, value in range [0.0, 1.0]
+    :param blue: Blue, value in range [0.0, 1.0]
+    :return: Relative luminance
+    """
+    return relative_luminance(red, blue, green)
+
+
+def srgb_to_linear(value):
+    """
+    Decode a value with the sRGB transfer function.
+    :param value: sRGB encoded value
+    :return: Linear value
+    """
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value):
+    """
+    Encode a value with the sRGB transfer function.
+    :param value: Linear value
+    :return: sRGB encoded value
+    """
+    return value * 12.92 if value <= 0.0031308 else 1.055 * value ** (1.0 / 2.4) - 0.055
+
+
+def srgb_to_lab(color):
+    """
+    Convert a color with sRGB primaries and transfer function to CIE L*a*b* with a D65 white point.
+    :param color: List or tuple of three value, red, green and blue
+    :return: L*, a* and b*
+    """
+    linear = [srgb_to_linear(c) for c in color]
+    x = (0.4124564 * linear[0] + 0.3575761 * linear[1] + 0.1804375 * linear[2]) / 0.95047
+    y = 0.2126729 * linear[0] + 0.7151522 * linear[1] + 0.0721750 * linear[2]
+    z = (0.0193339 * linear[0] + 0.1191920 * linear[1] + 0.9503041 * linear[2]) / 1.08883
+    fx, fy, fz = [t ** (1.0 / 3.0) if t > 216.0 / 24389.0 else (24389.0 / 27.0 * t + 16.0) / 116.0
+                  for t in (x, y, z)]
+    return [116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz)]
+
+
+def srgb_channels_to_lab(reds, greens, blues):
+    """
+    Convert many colors like srgb_to_lab(), with the same results. The conversion is done one step at a time for all
+    colors instead of one color at a time, which is several times faster for large numbers of colors.
+    :param reds: Red values of the colors
+    :param greens: Green values of the colors
+    :param blues: Blue values of the colors
+    :return: Lists of the L*, a* and b* values of the colors
+    """
+    # Same as srgb_to_linear(), without the function calls
+    reds, greens, blues = [[v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4 for v in channel]
+                           for channel in (reds, greens, blues)]
+    xs = [(0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / 0.95047 for r, g, b in zip(reds, greens, blues)]
+    ys = [0.2126729 * r + 0.7151522 * g + 0.0721750 * b for r, g, b in zip(reds, greens, blues)]
+    zs = [(0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / 1.08883 for r, g, b in zip(reds, greens, blues)]
+    fxs, fys, fzs = [[t ** (1.0 / 3.0) if t > 216.0 / 24389.0 else (24389.0 / 27.0 * t + 16.0) / 116.0 for t in ts]
+                     for ts in (xs, ys, zs)]
+    return ([116.0 * fy - 16.0 for fy in fys], [500.0 * (fx - fy) for fx, fy in zip(fxs, fys)],
+            [200.0 * (fy - fz) for fy, fz in zip(fys, fzs)])
+
+
+def delta_e(color_a, color_b):
+    """
+    Calculate the perceptual difference (CIE76 Delta E) between two sRGB colors.
+    :param color_a: List or tuple of three value, red, green and blue
+    :param color_b: List or tuple of three value, red, green and blue
+    :return: Delta E
+    """
+    lab_a = srgb_to_lab(color_a)
+    lab_b = srgb_to_lab(color_b)
+    return math.sqrt(sum((lab_a[i] - lab_b[i]) ** 2 for i in range(3)))
+
+
 def colormap_to_ev_blocks_equidistant(colormap, stops):
     """
     For a given number of stops, the colormap is divided into equal length segments. The colors are sampled at the
@@ -184,6 +275,13 @@ class ColorPoint:
         self.__color = color
         self.__replace_with_luminance = replace_with_luminance
 
+    @property
+    def replace_with_luminance(self):
+        """
+        :return: True, if the luminance is used as color instead of the color of the color point
+        """
+        return self.__replace_with_luminance
+
     def get_color(self, luminance=None):
         """
         Get the color of the color point. If luminance is passed and __replace_with_luminance is true, then the
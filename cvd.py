@@ -0,0 +1,120 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import colors
+import file_io
+import transfer
+import os
+
+# Simulation matrices for linear RGB with sRGB primaries, for a severity of 1.0. From: G. M. Machado, M. M. Oliveira
+# and L. A. F. Fernandes, "A Physiologically-based Model for Simulation of Color Vision Deficiency", IEEE Transactions
+# on Visualization and Computer Graphics, 2009.
+CVD_MATRICES = {"protanopia": [[0.152286, 1.052583, -0.204868],
+                               [0.114503, 0.786281, 0.099216],
+                               [-0.003882, -0.048116, 1.051998]],
+                "deuteranopia": [[0.367322, 0.860646, -0.227968],
+                                 [0.280085, 0.672501, 0.047413],
+                                 [-0.011820, 0.042940, 0.968881]],
+                "tritanopia": [[1.255528, -0.076749, -0.178779],
+                               [-0.078411, 0.930809, 0.147602],
+                               [0.004733, 0.691367, 0.303900]]}
+
+
+def simulate_values(values, deficiency):
+    """
+    Simulates how a color vision deficiency perceives sRGB colors.
+    :param values: Flat sequence of sRGB encoded red, green and blue values
+    :param deficiency: One of CVD_MATRICES
+    :return: Flat list of simulated sRGB encoded red, green and blue values
+    """
+    (m00, m01, m02), (m10, m11, m12), (m20, m21, m22) = CVD_MATRICES[deficiency]
+
+    # Many entries of a LUT share the same values, therefore each value is only decoded once
+    decoded = {value: colors.srgb_to_linear(value) for value in set(values)}
+    linear = [decoded[value] for value in values]
+
+    simulated = []
+    for red, green, blue in zip(linear[0::3], linear[1::3], linear[2::3]):
+        simulated.append(m00 * red + m01 * green + m02 * blue)
+        simulated.append(m10 * red + m11 * green + m12 * blue)
+        simulated.append(m20 * red + m21 * green + m22 * blue)
+    return [colors.linear_to_srgb(min(1.0, max(0.0, value))) for value in simulated]
+
+
+def simulate_lut(lut_path, output_dir, deficiencies=tuple(CVD_MATRICES), lut_format="spi3d"):
+    """
+    Saves a copy of a LUT for every color vision deficiency, with the colors replaced by their simulation. The files
+    are named after the LUT with the deficiency appended, e.g. `ignis_protanopia.spi3d`.
+    :param lut_path: Path to the LUT file in one of file_io.LUT_FORMATS
+    :param output_dir: Directory where the simulated LUTs are saved
+    :param deficiencies: Color vision deficiencies that are simulated
+    :param lut_format: One of file_io.LUT_FORMATS
+    :return: Dictionary with the SHA-256 of every saved file, keyed by its path
+    """
+    cube_size, table = file_io.load_lut(lut_path)
+    if lut_format == "hald":
+        # Fail before any file is written
+        file_io.get_hald_level(cube_size)
+    name = os.path.splitext(os.path.basename(lut_path))[0]
+    sha256 = {}
+    for deficiency in deficiencies:
+        file_path = os.path.join(output_dir, name + "_" + deficiency + file_io.LUT_EXTENSIONS[lut_format])
+        sha256[file_path] = file_io.save_lut(simulate_values(table, deficiency), cube_size, file_path, lut_format)
+        print(f"Saved {file_path}")
+    return sha256
+
+
+def get_transfer_functions():
+    """
+    Creates the transfer functions for all pre-defined colormaps, using the full colormap without centering.
+    :return: Dictionary of colormap names and transfer functions
+    """
+    transfer_functions = {name: transfer.ColormapTransfer(colormap) for name, colormap in colors.colormaps.items()}
+    transfer_functions.update({name: transfer.EvTransfer(ev_colormap)
+                               for name, ev_colormap in colors.ev_colormaps.items()})
+    return transfer_functions
+
+
+def print_report(exposure_values=transfer.DEFAULT_EXPOSURE_VALUES, deficiencies=tuple(CVD_MATRICES)):
+    """
+    Prints for every pre-defined colormap how well neighboring exposure values can be distinguished. For every band
+    between two neighboring exposure values the Delta E between the colors at both ends is listed for normal vision
+    and each simulated color vision deficiency, followed by the minimum over all bands.
+    :param exposure_values: Ascending exposure values that define the bands
+    :param deficiencies: Color vision deficiencies that are simulated
+    """
+    columns = ["normal"] + list(deficiencies)
+    bands = list(zip(exposure_values[:-1], exposure_values[1:]))
+    for name, transfer_function in get_transfer_functions().items():
+        values = [value for color in transfer.get_ev_colors(transfer_function, exposure_values) for value in color]
+        simulations = {"normal": values}
+        simulations.update({deficiency: simulate_values(values, deficiency) for deficiency in deficiencies})
+
+        delta_es = {column: [colors.delta_e(simulation[idx * 3:idx * 3 + 3], simulation[idx * 3 + 3:idx * 3 + 6])
+                             for idx in range(len(bands))]
+                    for column, simulation in simulations.items()}
+
+        print(name)
+        print("  EV band         " + "".join(f"{column:>14}" for column in columns))
+        for idx, (start, end) in enumerate(bands):
+            print(f"  {start:+6.2f} {end:+6.2f}   " + "".join(f"{delta_es[column][idx]:14.2f}" for column in columns))
+        print("  Minimum         " + "".join(f"{min(delta_es[column]):14.2f}" for column in columns))
@@ -20,20 +20,783 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
+import io
 import sys
-import importlib.util
+import gzip
+import mmap
+import bisect
+import zlib
+import hashlib
+import tempfile
+import contextlib
+import struct
+import operator
+import functools
+import itertools
+from array import array
 from unittest import mock
-from typing import List
+from typing import Iterable
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
 
-def save_file(content: List[str], file_path):
+# Header of the sidecar index: magic, cube size, size and modification time of the indexed spi3d file, order of the
+# axes from the outermost to the fastest changing one, followed by cube_size ** 2 + 1 scanline offsets.
+SPI3D_INDEX_MAGIC = b"SPI3DIDX"
+SPI3D_INDEX_HEADER = struct.Struct("<8sIQQ3B")
+
+# Header of the voxel index: magic, cube size, size and modification time of the indexed spi3d file, followed by
+# arrays with the luminance, entry index, byte offset and record length of every entry, sorted by the luminance.
+VOXEL_INDEX_MAGIC = b"SPI3DLUM"
+VOXEL_INDEX_HEADER = struct.Struct("<8sIQQ")
+
+# Common start of the headers of both indices, which contains the size and modification time of the spi3d file
+_INDEX_STAT_HEADER = struct.Struct("<8sIQQ")
+
+LUT_FORMATS = ("spi3d", "cube", "hald")
+
+# File extensions of the LUT formats. Hald CLUTs are saved as 16-bit PNG images.
+LUT_EXTENSIONS = {"spi3d": ".spi3d", "cube": ".cube", "hald": ".png"}
+
+# Type codes of the arrays for the supported data types of raw images
+RAW_DTYPES = {"float32": 'f', "uint8": 'B', "uint16": 'H'}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Axis along which the entries of each LUT format are grouped into planes, 0 for red and 2 for blue.
+LUT_PLANE_AXES = {"spi3d": 0, "cube": 2, "hald": 2}
+
+# Extension that is appended to the file path of gzip compressed files
+GZIP_EXTENSION = ".gz"
+
+# Name of the lock file that is created in locked output directories
+LOCK_FILENAME = ".lut_generator.lock"
+
+# Temporary files are created with restricted permissions, the saved files receive the permissions of open()
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class HashingWriter(io.BufferedIOBase):
+    """
+    Non-seekable binary stream that updates a hash with every written byte, before passing it on to another stream.
     """
-    Saves content as file. Overwrites existing file, if it exists.
-    :param content: List of strings to be written into the file
+    def __init__(self, stream, checksum):
+        """
+        :param stream: Binary stream into which the bytes are written
+        :param checksum: Hash object of hashlib
+        """
+        super().__init__()
+        self.stream = stream
+        self.checksum = checksum
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.checksum.update(data)
+        return self.stream.write(data)
+
+    def flush(self):
+        if not self.stream.closed:
+            self.stream.flush()
+
+    def close(self):
+        # The wrapped stream is closed by its owner
+        self.flush()
+        super().close()
+
+
+@contextlib.contextmanager
+def open_atomic(file_path, binary=False, compress=False, checksum=None):
+    """
+    Opens a temporary file next to the destination for writing. After the block has been left without an exception,
+    the temporary file is synced to the disk and atomically renamed to the destination, so readers see either the
+    previous or the complete new file. Otherwise the temporary file is removed and the destination is left unchanged.
+    :param file_path: Path, including filename, where the file should be saved
+    :param binary: If True, the file is opened in binary mode, otherwise in text mode
+    :param compress: If True, the content is compressed with gzip while it is written
+    :param checksum: Optional hash object of hashlib, which is updated with the bytes of the file while they are
+        written, i.e. after the compression. The file object isn't seekable in this case.
+    :return: File object
+    """
+    directory, filename = os.path.split(os.path.abspath(file_path))
+    descriptor, temp_path = tempfile.mkstemp(prefix=f".{filename}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(descriptor, 'wb') as raw_file:
+            stream = raw_file if checksum is None else HashingWriter(raw_file, checksum)
+            compressed_stream = stream
+            if compress:
+                # A fixed modification time keeps the output reproducible
+                name = filename[:-len(GZIP_EXTENSION)] if filename.endswith(GZIP_EXTENSION) else filename
+                compressed_stream = gzip.GzipFile(name, 'wb', fileobj=stream, mtime=0)
+            outfile = compressed_stream if binary else io.TextIOWrapper(compressed_stream)
+            yield outfile
+            # The wrappers are detached or closed without closing the raw file, which is synced first. Closing the
+            # GzipFile writes the gzip trailer.
+            if not binary:
+                outfile.flush()
+                outfile.detach()
+            if compress:
+                compressed_stream.close()
+            if stream is not raw_file:
+                stream.close()
+            raw_file.flush()
+            os.fsync(raw_file.fileno())
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+        raise
+    _sync_directory(directory)
+
+
+def _sync_directory(directory):
+    """
+    Syncs a directory to the disk, so a rename within it is persisted. Not supported on Windows.
+    :param directory: Path of the directory
+    """
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+@contextlib.contextmanager
+def lock_directory(directory):
+    """
+    Holds an exclusive lock of a directory, so concurrent generations that write into the same directory run one
+    after another. The lock is held on the file LOCK_FILENAME within the directory and released by the operating
+    system, if the process is terminated.
+    :param directory: Path of the directory
+    """
+    with open(os.path.join(directory, LOCK_FILENAME), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            # LK_LOCK gives up after 10 attempts, one second apart
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def lock_directories(directories):
+    """
+    Holds exclusive locks of several directories, see lock_directory(). The directories are created if they don't
+    exist and locked in a fixed order, so generations with overlapping directories can't deadlock.
+    :param directories: Iterable of directory paths, may be empty
+    """
+    with contextlib.ExitStack() as stack:
+        for directory in sorted({os.path.abspath(directory) for directory in directories}):
+            os.makedirs(directory, exist_ok=True)
+            stack.enter_context(lock_directory(directory))
+        yield
+
+
+def save_file(content: Iterable[str], file_path, compress=False):
+    """
+    Saves content as file. Overwrites existing file, if it exists. The file is replaced atomically, see open_atomic().
+    :param content: List of strings to be written into the file. Generators are written while they are consumed.
     :param file_path: Path, including filename, where file should be saved
+    :param compress: If True, the content is compressed with gzip while it is written
+    :return: SHA-256 of the saved file as hex string, computed while it is written
     """
-    with open(file_path, 'w') as outfile:
+    checksum = hashlib.sha256()
+    with open_atomic(file_path, compress=compress, checksum=checksum) as outfile:
         outfile.writelines(content)
+    return checksum.hexdigest()
+
+
+def format_lut_header(lut_format, cube_size):
+    """
+    Creates the header of a LUT file.
+    :param lut_format: One of LUT_FORMATS
+    :param cube_size: Number of entries per channel
+    :return: List of strings
+    """
+    if lut_format == "spi3d":
+        return ["SPILUT 1.0\n", "3 3\n", f"{cube_size} {cube_size} {cube_size}\n"]
+    elif lut_format == "cube":
+        return [f"LUT_3D_SIZE {cube_size}\n"]
+    raise ValueError(f"Unknown LUT format '{lut_format}'.")
+
+
+def format_lut_plane(lut_format, index, plane):
+    """
+    Creates the lines of a LUT file for one plane of entries along the axis given by LUT_PLANE_AXES. The spi3d format
+    lists the entries in the same order as the LUT generators, the cube format lists them with red changing fastest.
+    :param lut_format: One of LUT_FORMATS
+    :param index: Index of the plane
+    :param plane: Nested list of colors, indexed by the remaining two axes in red, green, blue order
+    :return: List of strings
+    """
+    if lut_format == "spi3d":
+        size = len(plane)
+        return [f"{index} {green} {blue} {plane[green][blue][0]:.8f} {plane[green][blue][1]:.8f} "
+                f"{plane[green][blue][2]:.8f}\n"
+                for blue in range(size) for green in range(size)]
+    elif lut_format == "cube":
+        return [f"{color[0]:.8f} {color[1]:.8f} {color[2]:.8f}\n"
+                for row in zip(*plane) for color in row]
+    raise ValueError(f"Unknown LUT format '{lut_format}'.")
+
+
+def get_hald_level(cube_size):
+    """
+    Determines the level of a Hald CLUT, which has level ** 2 entries per channel.
+    :param cube_size: Number of entries per channel
+    :return: Level
+    """
+    level = int(round(cube_size ** 0.5))
+    if level < 2 or level ** 2 != cube_size:
+        raise ValueError(f"A cube size of {cube_size} can't be saved as Hald CLUT, it has to be the square of the "
+                         f"level, e.g. 64 for level 8.")
+    return level
+
+
+def format_lut(planes: Iterable, cube_size, lut_format="spi3d", shaper=None, shaper_range=(0.0, 1.0)):
+    """
+    Creates the lines of a LUT file in a text format from its planes along the axis given by LUT_PLANE_AXES.
+    :param planes: Iterable of nested lists of colors, indexed by the remaining two axes in red, green, blue order
+    :param cube_size: Number of entries per channel
+    :param lut_format: Either "spi3d" or "cube"
+    :param shaper: Values of a 1D LUT that is applied to all channels before the 3D LUT. Only supported by the cube
+        format.
+    :param shaper_range: Ordered tuple of the input values of the first and last entry of the shaper
+    :return: Generator of strings
+    """
+    if shaper is not None:
+        if lut_format != "cube":
+            raise ValueError(f"The {lut_format} format doesn't support shaper LUTs.")
+        yield f"LUT_1D_SIZE {len(shaper)}\n"
+        yield f"LUT_1D_INPUT_RANGE {shaper_range[0]:.8f} {shaper_range[1]:.8f}\n"
+    yield from format_lut_header(lut_format, cube_size)
+    if shaper is not None:
+        yield from (f"{value:.8f} {value:.8f} {value:.8f}\n" for value in shaper)
+    for index, plane in enumerate(planes):
+        yield from format_lut_plane(lut_format, index, plane)
+
+
+def get_lut_planes(table, cube_size, axis):
+    """
+    Splits a flat array of LUT entries into planes.
+    :param table: Flat array of the LUT entries, as returned by load_lut()
+    :param cube_size: Number of entries per channel
+    :param axis: Axis that is constant within each plane, 0 for red and 2 for blue
+    :return: Generator of nested lists of colors, indexed by the remaining two axes in red, green, blue order
+    """
+    strides = (cube_size ** 2, cube_size, 1)
+    u_axis, v_axis = [i for i in range(3) if i != axis]
+    for index in range(cube_size):
+        starts = [[(index * strides[axis] + u * strides[u_axis] + v * strides[v_axis]) * 3 for v in range(cube_size)]
+                  for u in range(cube_size)]
+        yield [[table[start:start + 3] for start in row] for row in starts]
+
+
+def save_lut_planes(planes: Iterable, cube_size, file_path, lut_format="spi3d", shaper=None, shaper_range=(0.0, 1.0),
+                    compress=False):
+    """
+    Saves a LUT from its planes along the axis given by LUT_PLANE_AXES. The planes are written while they are
+    consumed, so they can be created one at a time.
+    :param planes: Iterable of nested lists of colors, indexed by the remaining two axes in red, green, blue order
+    :param cube_size: Number of entries per channel
+    :param file_path: Path, including filename, where the LUT should be saved
+    :param lut_format: One of LUT_FORMATS
+    :param shaper: Values of a 1D LUT that is applied before the 3D LUT. Only supported by the cube format.
+    :param shaper_range: Ordered tuple of the input values of the first and last entry of the shaper
+    :param compress: If True, the LUT is compressed with gzip while it is written. Not supported by Hald CLUTs,
+        which are already compressed.
+    :return: SHA-256 of the saved file as hex string
+    """
+    if lut_format == "hald":
+        if shaper is not None:
+            raise ValueError("Hald CLUTs don't support shaper LUTs.")
+        if compress:
+            raise ValueError("Hald CLUTs can't be compressed with gzip.")
+        flat_planes = (itertools.chain.from_iterable(itertools.chain.from_iterable(zip(*plane))) for plane in planes)
+        return _save_hald_planes(flat_planes, cube_size, file_path)
+    return save_file(format_lut(planes, cube_size, lut_format, shaper, shaper_range), file_path, compress)
+
+
+def save_lut(table, cube_size, file_path, lut_format="spi3d", shaper=None, shaper_range=(0.0, 1.0), compress=False):
+    """
+    Saves a LUT from a flat array of entries.
+    :param table: Flat array of the LUT entries, as returned by load_lut()
+    :param cube_size: Number of entries per channel
+    :param file_path: Path, including filename, where the LUT should be saved
+    :param lut_format: One of LUT_FORMATS
+    :param shaper: Values of a 1D LUT that is applied before the 3D LUT. Only supported by the cube format.
+    :param shaper_range: Ordered tuple of the input values of the first and last entry of the shaper
+    :param compress: If True, the LUT is compressed with gzip while it is written, see save_lut_planes()
+    :return: SHA-256 of the saved file as hex string
+    """
+    if lut_format == "hald" and shaper is None and not compress:
+        return _save_hald_planes(_get_hald_planes(table, cube_size), cube_size, file_path)
+    planes = get_lut_planes(table, cube_size, LUT_PLANE_AXES[lut_format])
+    return save_lut_planes(planes, cube_size, file_path, lut_format, shaper, shaper_range, compress)
+
+
+def serialize_lut(table, cube_size, lut_format="spi3d"):
+    """
+    Creates the content of a LUT file in memory, identical to the file saved by save_lut().
+    :param table: Flat array of the LUT entries, as returned by load_lut()
+    :param cube_size: Number of entries per channel
+    :param lut_format: One of LUT_FORMATS
+    :return: Bytes of the LUT file
+    """
+    if lut_format == "hald":
+        width, compressed = _compress_hald_planes(_get_hald_planes(table, cube_size), cube_size)
+        return _make_png(width, width, 16, compressed)
+    planes = get_lut_planes(table, cube_size, LUT_PLANE_AXES[lut_format])
+    return "".join(format_lut(planes, cube_size, lut_format)).encode("ascii")
+
+
+def save_spi1d(values, input_range, file_path, compress=False):
+    """
+    Saves a 1D LUT in the spi1d format, which applies the same values to all channels.
+    :param values: Output values of the entries
+    :param input_range: Ordered tuple of the input values of the first and last entry
+    :param file_path: Path, including filename, where the LUT should be saved
+    :param compress: If True, the LUT is compressed with gzip while it is written
+    :return: SHA-256 of the saved file as hex string
+    """
+    lines = ["Version 1\n",
+             f"From {input_range[0]:.8f} {input_range[1]:.8f}\n",
+             f"Length {len(values)}\n",
+             "Components 1\n",
+             "{\n"]
+    lines += [f"    {value:.8f}\n" for value in values]
+    lines.append("}\n")
+    return save_file(lines, file_path, compress)
+
+
+def _get_hald_planes(table, cube_size):
+    """
+    Reorders a flat array of LUT entries into planes of constant blue with red changing fastest, as required for Hald
+    CLUTs. The values are copied with strided slices, one row of constant green and blue at a time.
+    :param table: Flat array of the LUT entries, as returned by load_lut()
+    :param cube_size: Number of entries per channel
+    :return: Generator of flat arrays with the red, green and blue values of the entries of each plane
+    """
+    red_stride = cube_size ** 2 * 3
+    row_size = cube_size * 3
+    for blue in range(cube_size):
+        plane = array('d', bytes(8 * row_size * cube_size))
+        for green in range(cube_size):
+            start = (green * cube_size + blue) * 3
+            for channel in range(3):
+                plane[green * row_size + channel:(green + 1) * row_size:3] = \
+                    array('d', table[start + channel::red_stride])
+        yield plane
+
+
+def _save_hald_planes(planes, cube_size, file_path):
+    """
+    Saves the planes of constant blue of a LUT as Hald CLUT, a 16-bit PNG image with level ** 3 pixels per row. Every
+    plane fills level rows of the image.
+    :param planes: Iterable of flat sequences with the red, green and blue values of the entries of each plane, with
+        red changing fastest
+    :param cube_size: Number of entries per channel, the square of the level
+    :param file_path: Path, including filename, where the Hald CLUT should be saved
+    :return: SHA-256 of the saved file as hex string
+    """
+    width, compressed = _compress_hald_planes(planes, cube_size)
+    return _write_png(file_path, width, width, 16, compressed)
+
+
+def _compress_hald_planes(planes, cube_size):
+    """
+    Quantizes and compresses the planes of constant blue of a LUT as scanlines of a Hald CLUT.
+    :param planes: Iterable of flat sequences with the red, green and blue values of the entries of each plane, with
+        red changing fastest
+    :param cube_size: Number of entries per channel, the square of the level
+    :return: Width and height of the image and the zlib compressed scanlines
+    """
+    level = get_hald_level(cube_size)
+    width = level ** 3
+    row_size = width * 3 * 2
+    compressor = zlib.compressobj(6)
+    compressed = []
+    for values in planes:
+        values = array('d', values)
+        # The values are clipped and quantized by chained iterators, without a Python loop per value. Clipping is
+        # comparatively slow and only required if the plane exceeds the [0.0, 1.0] range.
+        if min(values) < 0.0 or max(values) > 1.0:
+            values = map(max, itertools.repeat(0.0), map(min, itertools.repeat(1.0), values))
+        quantized = array('H', map(round, map((65535.0).__mul__, values)))
+        if sys.byteorder == "little":
+            quantized.byteswap()
+        pixel_bytes = quantized.tobytes()
+        # Every row is prefixed with filter type 0, i.e. no filtering
+        compressed.append(compressor.compress(b"".join(b"\x00" + pixel_bytes[start:start + row_size]
+                                                       for start in range(0, len(pixel_bytes), row_size))))
+    compressed.append(compressor.flush())
+    return width, b"".join(compressed)
+
+
+@functools.lru_cache(maxsize=4)
+def _get_spi3d_indices(cube_size):
+    """
+    Index columns of a spi3d file written by format_lut(). The red index changes slowest and the green index fastest.
+    :param cube_size: Number of entries per channel
+    :return: Tuple of the red, green and blue index columns, as strings
+    """
+    indices = [str(idx) for idx in range(cube_size)]
+    plane_size = cube_size ** 2
+    reds = [index for index in indices for _ in range(plane_size)]
+    greens = indices * plane_size
+    blues = [index for _ in range(cube_size) for index in indices for _ in range(cube_size)]
+    return reds, greens, blues
+
+
+def _has_spi3d_layout(values, cube_size):
+    """
+    :param values: Tokens of the entries of a spi3d file
+    :param cube_size: Number of entries per channel
+    :return: True, if the entries are in the order in which format_lut() writes them
+    """
+    return all(values[column::6] == expected for column, expected in enumerate(_get_spi3d_indices(cube_size)))
+
+
+def load_lut(file_path):
+    """
+    Loads a LUT file in one of the LUT_FORMATS. The format is detected from the content of the file.
+    :param file_path: Path to the LUT file
+    :return: Cube size and flat array with the red, green and blue values of every entry. The entry for the red,
+        green and blue indices starts at ((red * cube_size + green) * cube_size + blue) * 3.
+    """
+    with open(file_path, 'r') as infile:
+        content = infile.read()
+
+    if content.startswith("SPILUT"):
+        tokens = content.split()
+        cube_size = int(tokens[4])
+        if int(tokens[5]) != cube_size or int(tokens[6]) != cube_size:
+            raise ValueError("Only spi3d files with the same size for all three dimensions are supported.")
+        values = tokens[7:]
+        if len(values) != cube_size ** 3 * 6:
+            raise ValueError(f"Expected {cube_size ** 3} entries in {file_path}.")
+        channels = values[3::6], values[4::6], values[5::6]
+        if _has_spi3d_layout(values, cube_size):
+            # The indices of files written by format_lut() don't have to be parsed and sorted, swapping the blue and
+            # green axes is enough
+            plane_size = cube_size ** 2
+            table = array('d', bytes(cube_size ** 3 * 3 * 8))
+            for channel in range(3):
+                file_values = array('d', map(float, channels[channel]))
+                for red in range(cube_size):
+                    for green in range(cube_size):
+                        start = (red * plane_size + green * cube_size) * 3 + channel
+                        file_start = red * plane_size + green
+                        table[start:start + cube_size * 3:3] = file_values[file_start:file_start + plane_size:cube_size]
+            return cube_size, table
+        reds, greens, blues = [map(int, values[i::6]) for i in range(3)]
+        indices = [(r * cube_size + g) * cube_size + b for r, g, b in zip(reds, greens, blues)]
+    else:
+        cube_size = None
+        data = []
+        for line in content.splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line[0].isalpha():
+                keyword, _, value = line.partition(" ")
+                if keyword == "LUT_3D_SIZE":
+                    cube_size = int(value)
+                elif keyword == "LUT_1D_SIZE":
+                    raise ValueError("Cube files with a 1D LUT are not supported.")
+                continue
+            data.append(line)
+        if cube_size is None:
+            raise ValueError(f"The file {file_path} is neither in the spi3d nor in the cube format.")
+        if len(data) != cube_size ** 3:
+            raise ValueError(f"Expected {cube_size ** 3} entries in {file_path}.")
+        values = " ".join(data).split()
+        # Red changes fastest in the cube format
+        indices = [(red * cube_size + green) * cube_size + blue
+                   for blue in range(cube_size) for green in range(cube_size) for red in range(cube_size)]
+        channels = values[0::3], values[1::3], values[2::3]
+
+    order = sorted(range(len(indices)), key=indices.__getitem__)
+    get_in_order = operator.itemgetter(*order)
+    if list(get_in_order(indices)) != list(range(cube_size ** 3)):
+        raise ValueError(f"The entries of {file_path} don't cover every index exactly once.")
+
+    table = array('d', bytes(cube_size ** 3 * 3 * 8))
+    for channel in range(3):
+        table[channel::3] = array('d', map(float, get_in_order(channels[channel])))
+    return cube_size, table
+
+
+class MappedImage:
+    """
+    Image file that is memory-mapped instead of being read into memory. Supported are the Portable Float Map (PFM)
+    format, the binary Portable Pixmap (PPM) format with 8 or 16 bits per channel and headerless raw data with
+    interleaved channels in little-endian byte order. Rows are exposed as views of the mapped file, without copying
+    the pixel data, if the byte order of the file matches the system. Use open_image() and create_image() to get
+    instances of this class.
+    """
+
+    def __init__(self, file_path, width, height, channels, typecode, offset, little_endian, bottom_up, writable):
+        self.file_path = file_path
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.typecode = typecode
+        self.bottom_up = bottom_up
+        self.__offset = offset
+        self.__row_size = width * channels * array(typecode).itemsize
+        self.__swap = array(typecode).itemsize > 1 and little_endian != (sys.byteorder == "little")
+
+        with open(file_path, 'r+b' if writable else 'rb') as infile:
+            if os.fstat(infile.fileno()).st_size < offset + self.__row_size * height:
+                raise ValueError(f"The file {file_path} is smaller than its image dimensions.")
+            self.__mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+
+    def close(self):
+        """
+        Unmaps the file. All views returned by get_rows() have to be released before.
+        """
+        self.__mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __get_range(self, first, last):
+        """
+        Byte range of a block of rows in the file.
+        :param first: Index of the first row, counted from the top
+        :param last: Index of the row after the last one, counted from the top
+        :return: Start and end of the byte range
+        """
+        if first < 0 or last > self.height or first > last:
+            raise IndexError(f"Rows {first} to {last} are outside of the image with height {self.height}.")
+        if self.bottom_up:
+            first, last = self.height - last, self.height - first
+        return self.__offset + first * self.__row_size, self.__offset + last * self.__row_size
+
+    def get_rows(self, first, last):
+        """
+        Gets the pixel values of a block of rows. The rows are in the order in which they are stored in the file,
+        which is from bottom to top if the bottom_up attribute is True.
+        :param first: Index of the first row, counted from the top
+        :param last: Index of the row after the last one, counted from the top
+        :return: View of the mapped file with the type code of the image or, if the byte order has to be swapped, an
+            array with a copy of the values
+        """
+        start, end = self.__get_range(first, last)
+        view = memoryview(self.__mmap)[start:end].cast(self.typecode)
+        if not self.__swap:
+            return view
+        values = array(self.typecode, view)
+        view.release()
+        values.byteswap()
+        return values
+
+    def set_rows(self, first, last, values, bottom_up=None):
+        """
+        Writes the pixel values of a block of rows into the mapped file.
+        :param first: Index of the first row, counted from the top
+        :param last: Index of the row after the last one, counted from the top
+        :param values: Array or view of pixel values with the type code of the image
+        :param bottom_up: Order of the rows in the values, defaults to the order of the file
+        """
+        if bottom_up is None:
+            bottom_up = self.bottom_up
+        values = array(self.typecode, values) if self.__swap or bottom_up != self.bottom_up else values
+        if self.__swap:
+            values.byteswap()
+        if bottom_up != self.bottom_up:
+            values = _flip_rows(values, self.width * self.channels)
+        start, end = self.__get_range(first, last)
+        self.__mmap[start:end] = memoryview(values).cast('B')
+
+    def flush(self):
+        self.__mmap.flush()
+
+
+def open_image(file_path, width=None, height=None, channels=3, dtype="float32", writable=False):
+    """
+    Opens an image as MappedImage. The format is selected by the `.pfm` and `.ppm` extensions, all other files are
+    treated as raw data.
+    :param file_path: Path to the image
+    :param width: Width of raw images
+    :param height: Height of raw images
+    :param channels: Number of channels of raw images
+    :param dtype: Data type of raw images, one of RAW_DTYPES
+    :param writable: Map the file for reading and writing
+    :return: MappedImage with the type code 'f' for floating point values and 'B' or 'H' for integer values
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    bottom_up = False
+    with open(file_path, 'rb') as infile:
+        if extension == ".pfm":
+            identifier = infile.readline().strip()
+            if identifier not in (b"PF", b"Pf"):
+                raise ValueError(f"The file {file_path} is not in the PFM format.")
+            channels = 3 if identifier == b"PF" else 1
+            width, height = [int(x) for x in infile.readline().split()]
+            little_endian = float(infile.readline()) < 0.0
+            typecode = 'f'
+            bottom_up = True
+        elif extension == ".ppm":
+            identifier, width, height, max_value = _read_ppm_header(infile)
+            if identifier != b"P6" or max_value not in (255, 65535):
+                raise ValueError("Only binary PPM files with 8 or 16 bits per channel are supported.")
+            channels = 3
+            little_endian = False
+            typecode = 'B' if max_value == 255 else 'H'
+        else:
+            if width is None or height is None:
+                raise ValueError("Width and height are required for raw images.")
+            little_endian = True
+            typecode = RAW_DTYPES[dtype]
+        offset = infile.tell()
+    return MappedImage(file_path, width, height, channels, typecode, offset, little_endian, bottom_up, writable)
+
+
+def create_image(file_path, width, height, channels=3, dtype="float32"):
+    """
+    Creates an image file of the required size and opens it as writable MappedImage. Files with a `.pfm` extension
+    are created as PFM, all other files as raw data. Overwrites existing file, if it exists.
+    :param file_path: Path, including filename, where the image should be saved
+    :param width: Width of the image
+    :param height: Height of the image
+    :param channels: Number of channels, 1 or 3 for PFM
+    :param dtype: Data type of raw images, one of RAW_DTYPES
+    :return: MappedImage
+    """
+    header = b""
+    if os.path.splitext(file_path)[1].lower() == ".pfm":
+        if channels not in (1, 3):
+            raise ValueError("PFM images have either one or three channels.")
+        scale = -1.0 if sys.byteorder == "little" else 1.0
+        header = f"{'PF' if channels == 3 else 'Pf'}\n{width} {height}\n{scale}\n".encode("ascii")
+        dtype = "float32"
+
+    with open(file_path, 'wb') as outfile:
+        outfile.write(header)
+        outfile.truncate(len(header) + width * height * channels * array(RAW_DTYPES[dtype]).itemsize)
+    return open_image(file_path, width, height, channels, dtype, writable=True)
+
+
+def save_png(file_path, width, height, data, bit_depth=8):
+    """
+    Saves an RGB image in the PNG format, tagged as sRGB.
+    :param file_path: Path, including filename, where the image should be saved
+    :param width: Width of the image
+    :param height: Height of the image
+    :param data: Sequence of integer pixel values with interleaved channels and the rows ordered from top to bottom
+    :param bit_depth: Bits per channel, either 8 or 16
+    :return: SHA-256 of the saved file as hex string
+    """
+    if bit_depth not in (8, 16):
+        raise ValueError(f"Unsupported bit depth {bit_depth} for PNG.")
+
+    values = array('B' if bit_depth == 8 else 'H', data)
+    if bit_depth == 16 and sys.byteorder == "little":
+        values.byteswap()
+    pixel_bytes = values.tobytes()
+
+    # Every row is prefixed with filter type 0, i.e. no filtering
+    row_size = width * 3 * bit_depth // 8
+    scanlines = b"".join(b"\x00" + pixel_bytes[start:start + row_size]
+                         for start in range(0, row_size * height, row_size))
+    return _write_png(file_path, width, height, bit_depth, zlib.compress(scanlines, 9))
+
+
+def _write_png(file_path, width, height, bit_depth, compressed):
+    """
+    Writes a PNG file with RGB pixels, tagged as sRGB.
+    :param file_path: Path, including filename, where the image should be saved
+    :param width: Width of the image
+    :param height: Height of the image
+    :param bit_depth: Bits per channel
+    :param compressed: zlib compressed scanlines
+    :return: SHA-256 of the saved file as hex string
+    """
+    checksum = hashlib.sha256()
+    with open_atomic(file_path, binary=True, checksum=checksum) as outfile:
+        outfile.write(_make_png(width, height, bit_depth, compressed))
+    return checksum.hexdigest()
+
+
+def _make_png(width, height, bit_depth, compressed):
+    """
+    Creates the content of a PNG file with RGB pixels, tagged as sRGB.
+    :param width: Width of the image
+    :param height: Height of the image
+    :param bit_depth: Bits per channel
+    :param compressed: zlib compressed scanlines
+    :return: Bytes of the PNG file
+    """
+    def make_chunk(chunk_type, content):
+        return (struct.pack(">I", len(content)) + chunk_type + content +
+                struct.pack(">I", zlib.crc32(chunk_type + content)))
+
+    return b"".join([PNG_SIGNATURE,
+                     make_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bit_depth, 2, 0, 0, 0)),
+                     make_chunk(b"sRGB", b"\x00"),
+                     make_chunk(b"IDAT", compressed),
+                     make_chunk(b"IEND", b"")])
+
+
+def _read_ppm_header(infile):
+    """
+    Reads the four whitespace separated header fields of a PPM file, skipping comments.
+    :param infile: File object positioned at the start of the file
+    :return: Identifier, width, height and maximum value
+    """
+    fields = []
+    field = b""
+    while len(fields) < 4:
+        char = infile.read(1)
+        if not char:
+            raise ValueError("Incomplete PPM header.")
+        if char == b"#" and not field:
+            infile.readline()
+        elif char.isspace():
+            if field:
+                fields.append(field)
+                field = b""
+        else:
+            field += char
+    return fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+
+
+def _flip_rows(data, row_length):
+    """
+    Reverses the order of the rows of an image, since PFM stores them from bottom to top.
+    :param data: Array of pixel values
+    :param row_length: Number of values per row
+    :return: Array with reversed row order
+    """
+    flipped = array(data.typecode if isinstance(data, array) else data.format)
+    for start in range(len(data) - row_length, -1, -row_length):
+        flipped.extend(data[start:start + row_length])
+    return flipped
 
 
 def load_viscm_colormap(file_path):
@@ -46,8 +809,355 @@ def load_viscm_colormap(file_path):
     :return:
     """
     sys.modules['matplotlib.colors'] = mock.MagicMock()
-    spec = importlib.util.spec_from_file_location("viscm", file_path)
-    viscm = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(viscm)
+    # The script is compiled from its source instead of being imported. An import would cache the bytecode in
+    # __pycache__, which is only validated by the size and the modification time in seconds of the script, so a
+    # script that is saved again within the same second with the same size would be loaded in its previous version.
+    with open(file_path, 'rb') as infile:
+        source = infile.read()
+    viscm = {"__name__": "viscm", "__file__": file_path}
+    exec(compile(source, file_path, "exec"), viscm)
+
+    return viscm["cm_data"]
+
+
+def get_spi3d_index_path(file_path):
+    """
+    Default location of the sidecar index of a spi3d file.
+    :param file_path: Path to the spi3d file
+    :return: Path to the sidecar index
+    """
+    return file_path + ".idx"
+
+
+def build_spi3d_index(file_path, index_path=None):
+    """
+    Scans a spi3d file once and saves a sidecar index with the byte offset of every scanline, i.e. every run of
+    cube_size consecutive entries that only differ in the fastest changing index. The order of the axes is detected
+    from the file, therefore the index works for any spi3d file that lists its entries in a regular order.
+    :param file_path: Path to the spi3d file
+    :param index_path: Path where the index is saved, defaults to the file path with an additional `.idx` extension
+    :return: Path to the saved index
+    """
+    if index_path is None:
+        index_path = get_spi3d_index_path(file_path)
+
+    with open(file_path, 'rb') as infile:
+        cube_size = _read_spi3d_header(infile)
+        entries = _iterate_spi3d_entries(infile)
+
+        # The axes are detected from the first entry and the first entries of the first two scanlines
+        head = [next(entries, None) for _ in range(cube_size + 1)]
+        head = [entry for entry in head if entry is not None]
+        axes = (0, 1, 2)
+        if cube_size > 1 and len(head) == cube_size + 1:
+            fast = [i for i in range(3) if head[0][1][i] != head[1][1][i]]
+            middle = [i for i in range(3) if head[0][1][i] != head[cube_size][1][i]]
+            if len(fast) != 1 or len(middle) != 1 or fast == middle:
+                raise ValueError(f"The entries of {file_path} are not listed in a regular order.")
+            axes = (3 - fast[0] - middle[0], middle[0], fast[0])
+
+        offsets = array('Q')
+        count = 0
+        for entry_offset, indices in itertools.chain(head, entries):
+            expected = (count // cube_size ** 2, count // cube_size % cube_size, count % cube_size)
+            if count >= cube_size ** 3 or any(indices[axis] != expected[pos] for pos, axis in enumerate(axes)):
+                raise ValueError(f"The entries of {file_path} are not listed in a regular order.")
+            if count % cube_size == 0:
+                offsets.append(entry_offset)
+            count += 1
+        offsets.append(infile.tell())
+
+    if count != cube_size ** 3:
+        raise ValueError(f"Expected {cube_size ** 3} entries in {file_path}, found {count}.")
+
+    if sys.byteorder != "little":
+        offsets.byteswap()
+
+    stat = os.stat(file_path)
+    with open_atomic(index_path, binary=True) as outfile:
+        outfile.write(SPI3D_INDEX_HEADER.pack(SPI3D_INDEX_MAGIC, cube_size, stat.st_size, stat.st_mtime_ns, *axes))
+        offsets.tofile(outfile)
+    return index_path
+
+
+def is_spi3d_index_current(file_path, index_path=None):
+    """
+    Checks if the sidecar index exists and still matches the size and modification time of the spi3d file.
+    :param file_path: Path to the spi3d file
+    :param index_path: Path to the index, defaults to the file path with an additional `.idx` extension
+    :return: True, if the index can be used
+    """
+    if index_path is None:
+        index_path = get_spi3d_index_path(file_path)
+    try:
+        with open(index_path, 'rb') as infile:
+            header = SPI3D_INDEX_HEADER.unpack(infile.read(SPI3D_INDEX_HEADER.size))
+    except (OSError, struct.error):
+        return False
+    stat = os.stat(file_path)
+    return header[0] == SPI3D_INDEX_MAGIC and header[2] == stat.st_size and header[3] == stat.st_mtime_ns
+
+
+def refresh_index_stat(file_path, index_path):
+    """
+    Updates the size and modification time of the spi3d file in the header of an index, after its entries have been
+    rewritten in place without changing any byte offsets.
+    :param file_path: Path to the spi3d file
+    :param index_path: Path to the sidecar index or voxel index
+    """
+    stat = os.stat(file_path)
+    with open(index_path, 'r+b') as indexfile:
+        magic, cube_size, _, _ = _INDEX_STAT_HEADER.unpack(indexfile.read(_INDEX_STAT_HEADER.size))
+        indexfile.seek(0)
+        indexfile.write(_INDEX_STAT_HEADER.pack(magic, cube_size, stat.st_size, stat.st_mtime_ns))
+
+
+def get_voxel_index_path(file_path):
+    """
+    Default location of the voxel index of a spi3d file.
+    :param file_path: Path to the spi3d file
+    :return: Path to the voxel index
+    """
+    return file_path + ".lum"
+
+
+def build_voxel_index(file_path, luminance_grid, index_path=None):
+    """
+    Scans a spi3d file once and saves a voxel index, which lists the entries sorted by the luminance that determines
+    their color, together with the byte offset and length of their record in the file. The entries within a range of
+    luminance can therefore be found by bisection and rewritten in place.
+    :param file_path: Path to the spi3d file
+    :param luminance_grid: Flat array with the relative luminance of every entry, as returned by
+        transfer.get_luminance_grid()
+    :param index_path: Path where the index is saved, defaults to the file path with an additional `.lum` extension
+    :return: Path to the saved index
+    """
+    if index_path is None:
+        index_path = get_voxel_index_path(file_path)
+
+    with open(file_path, 'rb') as infile:
+        cube_size = _read_spi3d_header(infile)
+        if len(luminance_grid) != cube_size ** 3:
+            raise ValueError(f"The luminance grid doesn't match the cube size {cube_size} of {file_path}.")
+        offsets = array('Q', bytes(8 * cube_size ** 3))
+        lengths = array('B', bytes(cube_size ** 3))
+        found = bytearray(cube_size ** 3)
+        offset = infile.tell()
+        for line in iter(infile.readline, b""):
+            values = line.split()
+            if values:
+                red, green, blue = (int(x) for x in values[:3])
+                entry = (red * cube_size + green) * cube_size + blue
+                if found[entry] or len(line) > 255:
+                    raise ValueError(f"The entries of {file_path} can't be indexed.")
+                found[entry] = 1
+                offsets[entry] = offset
+                lengths[entry] = len(line)
+            offset += len(line)
+    if not all(found):
+        raise ValueError(f"The entries of {file_path} don't cover every index exactly once.")
+
+    entries = array('I', sorted(range(cube_size ** 3), key=luminance_grid.__getitem__))
+    luminances = array('d', map(luminance_grid.__getitem__, entries))
+    offsets = array('Q', map(offsets.__getitem__, entries))
+    lengths = array('B', map(lengths.__getitem__, entries))
+    if sys.byteorder != "little":
+        for values in (luminances, entries, offsets):
+            values.byteswap()
+
+    stat = os.stat(file_path)
+    with open_atomic(index_path, binary=True) as outfile:
+        outfile.write(VOXEL_INDEX_HEADER.pack(VOXEL_INDEX_MAGIC, cube_size, stat.st_size, stat.st_mtime_ns))
+        for values in (luminances, entries, offsets, lengths):
+            values.tofile(outfile)
+    return index_path
+
+
+def is_voxel_index_current(file_path, index_path=None):
+    """
+    Checks if the voxel index exists and still matches the size and modification time of the spi3d file.
+    :param file_path: Path to the spi3d file
+    :param index_path: Path to the index, defaults to the file path with an additional `.lum` extension
+    :return: True, if the index can be used
+    """
+    if index_path is None:
+        index_path = get_voxel_index_path(file_path)
+    try:
+        with open(index_path, 'rb') as infile:
+            header = VOXEL_INDEX_HEADER.unpack(infile.read(VOXEL_INDEX_HEADER.size))
+    except (OSError, struct.error):
+        return False
+    stat = os.stat(file_path)
+    return header[0] == VOXEL_INDEX_MAGIC and header[2] == stat.st_size and header[3] == stat.st_mtime_ns
+
+
+class VoxelIndex:
+    """
+    Entries of a spi3d file sorted by luminance, loaded from the voxel index
+    """
+
+    def __init__(self, file_path, index_path=None):
+        if index_path is None:
+            index_path = get_voxel_index_path(file_path)
+        if not is_voxel_index_current(file_path, index_path):
+            raise ValueError(f"The index {index_path} is missing or outdated. Rebuild it with build_voxel_index().")
+
+        with open(index_path, 'rb') as infile:
+            self.cube_size = VOXEL_INDEX_HEADER.unpack(infile.read(VOXEL_INDEX_HEADER.size))[1]
+            count = self.cube_size ** 3
+            self.luminances = array('d')
+            self.entries = array('I')
+            self.offsets = array('Q')
+            self.lengths = array('B')
+            for values in (self.luminances, self.entries, self.offsets, self.lengths):
+                values.fromfile(infile, count)
+        if sys.byteorder != "little":
+            for values in (self.luminances, self.entries, self.offsets):
+                values.byteswap()
+
+    def get_range(self, low, high):
+        """
+        Finds the entries with a luminance within the closed interval.
+        :param low: Smallest luminance
+        :param high: Largest luminance
+        :return: Start and end of the range of positions in the sorted arrays
+        """
+        return bisect.bisect_left(self.luminances, low), bisect.bisect_right(self.luminances, high)
+
+
+def _iterate_spi3d_entries(infile):
+    """
+    Iterates over the remaining lines of a spi3d file that has been opened in binary mode.
+    :param infile: File object positioned after the header
+    :return: Generator of (byte offset, indices) tuples
+    """
+    offset = infile.tell()
+    for line in iter(infile.readline, b""):
+        if line.strip():
+            yield offset, [int(x) for x in line.split()[:3]]
+        offset += len(line)
+
+
+def _read_spi3d_header(infile):
+    """
+    Reads the header of a spi3d file that has been opened in binary mode.
+    :param infile: File object positioned at the start of the file
+    :return: Cube size
+    """
+    if not infile.readline().startswith(b"SPILUT"):
+        raise ValueError("The file is not in the spi3d format.")
+    infile.readline()
+    sizes = [int(x) for x in infile.readline().split()]
+    if len(sizes) != 3 or sizes[0] != sizes[1] or sizes[0] != sizes[2]:
+        raise ValueError("Only spi3d files with the same size for all three dimensions are supported.")
+    return sizes[0]
+
+
+class Spi3dReader:
+    """
+    Random access to the entries of a spi3d file through its sidecar index. Every request seeks directly to the
+    required scanlines, instead of parsing the whole file.
+    """
+
+    def __init__(self, file_path, index_path=None):
+        if index_path is None:
+            index_path = get_spi3d_index_path(file_path)
+        if not is_spi3d_index_current(file_path, index_path):
+            raise ValueError(f"The index {index_path} is missing or outdated. Rebuild it with build_spi3d_index().")
+
+        with open(index_path, 'rb') as infile:
+            header = SPI3D_INDEX_HEADER.unpack(infile.read(SPI3D_INDEX_HEADER.size))
+            self.cube_size = header[1]
+            self.axes = header[4:]
+            self.__offsets = array('Q')
+            self.__offsets.fromfile(infile, self.cube_size ** 2 + 1)
+        if sys.byteorder != "little":
+            self.__offsets.byteswap()
+
+        self.__file = open(file_path, 'rb')
+
+    def close(self):
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __read_entries(self, first_scanline, last_scanline):
+        """
+        Reads a contiguous run of scanlines with a single seek.
+        :param first_scanline: Index of the first scanline
+        :param last_scanline: Index of the scanline after the last one that is read
+        :return: List of (indices, color) tuples
+        """
+        start = self.__offsets[first_scanline]
+        self.__file.seek(start)
+        data = self.__file.read(self.__offsets[last_scanline] - start)
+        entries = []
+        for line in data.splitlines():
+            values = line.split()
+            if values:
+                entries.append(((int(values[0]), int(values[1]), int(values[2])),
+                                (float(values[3]), float(values[4]), float(values[5]))))
+        return entries
+
+    def get_scanline(self, outer, middle):
+        """
+        Reads the cube_size entries that share the indices of the two slower changing axes.
+        :param outer: Index on the outermost axis
+        :param middle: Index on the middle axis
+        :return: List of colors, ordered by the index on the fastest changing axis
+        """
+        scanline = outer * self.cube_size + middle
+        return [color for _, color in self.__read_entries(scanline, scanline + 1)]
+
+    def get_voxel(self, red, green, blue):
+        """
+        Reads the color of a single entry.
+        :param red: Red index
+        :param green: Green index
+        :param blue: Blue index
+        :return: Color
+        """
+        indices = (red, green, blue)
+        if any(i < 0 or i >= self.cube_size for i in indices):
+            raise IndexError(f"Indices {indices} are outside of the cube with size {self.cube_size}.")
+        return self.get_scanline(indices[self.axes[0]], indices[self.axes[1]])[indices[self.axes[2]]]
+
+    def get_plane(self, axis, index):
+        """
+        Reads all entries with the given index on one axis. Planes along the outermost axis are read with a single
+        seek, planes along the middle axis with one seek per scanline.
+        :param axis: 0 for red, 1 for green and 2 for blue
+        :param index: Index on the axis
+        :return: Nested list of colors, indexed by the remaining two axes in red, green, blue order
+        """
+        size = self.cube_size
+        if index < 0 or index >= size:
+            raise IndexError(f"Index {index} is outside of the cube with size {size}.")
+        if axis == self.axes[0]:
+            entries = self.__read_entries(index * size, (index + 1) * size)
+        elif axis == self.axes[1]:
+            entries = []
+            for outer in range(size):
+                entries.extend(self.__read_entries(outer * size + index, outer * size + index + 1))
+        else:
+            entries = [entry for outer in range(size)
+                       for entry in self.__read_entries(outer * size, (outer + 1) * size)
+                       if entry[0][axis] == index]
+
+        u_axis, v_axis = [i for i in range(3) if i != axis]
+        plane = [[None] * size for _ in range(size)]
+        for indices, color in entries:
+            plane[indices[u_axis]][indices[v_axis]] = color
+        return plane
 
-    return viscm.cm_data
+    def get_slab(self, red):
+        """
+        Reads all entries with the given red index.
+        :param red: Red index
+        :return: Nested list of colors, indexed by green and blue
+        """
+        return self.get_plane(0, red)
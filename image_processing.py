@@ -0,0 +1,569 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import colors
+import file_io
+import interpolation
+import collections
+import queue
+import threading
+import functools
+import math
+import os
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+# Number of entries of the pre-sampled colors for integer and float images, indexed by the quantized luminance
+INTEGER_TABLE_SIZE = 65536
+
+# Largest values of the integer array type codes of file_io.MappedImage
+INTEGER_MAX_VALUES = {'B': 255, 'H': 65535}
+
+# State of the worker processes, set once by _init_worker() instead of being sent with every tile
+_worker_state = {}
+
+
+def _init_worker(state):
+    _worker_state.clear()
+    _worker_state.update(state)
+
+
+def allocate_lg2(values, exponent_min, exponent_max):
+    """
+    Applies the `allocation: lg2` transform, that colors.normalize_value() assumes, to scene linear values and clips
+    the results to the [0.0, 1.0] range.
+    :param values: Scene linear values
+    :param exponent_min: Smallest exponent for the input values
+    :param exponent_max: Largest exponent for the input values
+    :return: List of normalized values
+    """
+    low = 2 ** exponent_min
+    high = 2 ** exponent_max
+    scale = 1.0 / abs(exponent_max - exponent_min)
+    log2 = math.log2
+    # Comparing with the bounds is faster than calling min() for every value
+    return [((log2(value) - exponent_min) * scale if value < high else 1.0) if value > low else 0.0 for value in values]
+
+
+def make_luminance_tables(max_value, input_exp_range=(-12.473931189, 4.026068812), table_size=INTEGER_TABLE_SIZE):
+    """
+    Creates one table per channel that contains the contribution of each integer value to the quantized luminance.
+    The lg2 allocation and the weight of the channel are applied when creating the tables, therefore the index into
+    the color table returned by make_color_table() is the sum of the three table values.
+    :param max_value: Largest integer value, which corresponds to 1.0
+    :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+    :param table_size: Number of entries of the color table
+    :return: Tables for red, green and blue
+    """
+    allocated = allocate_lg2([value / max_value for value in range(max_value + 1)],
+                             input_exp_range[0], input_exp_range[1])
+    scale = (table_size - 1) / colors.lut_entry_luminance(1.0, 1.0, 1.0)
+    weights = (colors.lut_entry_luminance(scale, 0.0, 0.0),
+               colors.lut_entry_luminance(0.0, scale, 0.0),
+               colors.lut_entry_luminance(0.0, 0.0, scale))
+    tables = [array('l', [int(round(weight * value)) for value in allocated]) for weight in weights]
+
+    # Rounding the contributions separately must not exceed the last index
+    overflow = tables[0][-1] + tables[1][-1] + tables[2][-1] - (table_size - 1)
+    if overflow > 0:
+        tables[0] = array('l', [max(0, value - overflow) for value in tables[0]])
+    return tables
+
+
+def make_color_table(get_color, table_size=INTEGER_TABLE_SIZE, max_value=None):
+    """
+    Pre-samples the colors for the quantized luminances of make_luminance_tables().
+    :param get_color: Function that returns the color for a normalized relative luminance
+    :param table_size: Number of entries
+    :param max_value: If None, the colors are packed as 32-bit float RGB values. Otherwise they are quantized to
+        unsigned 16-bit integers with max_value corresponding to 1.0.
+    :return: List of packed colors in native byte order
+    """
+    max_luminance = colors.lut_entry_luminance(1.0, 1.0, 1.0)
+    samples = [get_color(idx * max_luminance / (table_size - 1)) for idx in range(table_size)]
+    if max_value is None:
+        color_struct = struct.Struct("=3f")
+        return [color_struct.pack(*color) for color in samples]
+    color_struct = struct.Struct("=3H")
+    return [color_struct.pack(*[int(round(min(1.0, max(0.0, c)) * max_value)) for c in color]) for color in samples]
+
+
+def map_integer_pixels(pixels, channels, luminance_tables, color_table, typecode='f'):
+    """
+    Maps 8 or 16 bit integer pixels to false colors, using only table lookups and integer additions per pixel.
+    :param pixels: Array of integer pixel values with one or three channels
+    :param channels: Number of channels
+    :param luminance_tables: Tables created by make_luminance_tables()
+    :param color_table: Table created by make_color_table()
+    :param typecode: 'f' for colors packed as floats, 'H' for colors quantized to 16-bit integers
+    :return: Array of RGB pixel values
+    """
+    red_table, green_table, blue_table = luminance_tables
+    if channels == 1:
+        indices = [red_table[value] + green_table[value] + blue_table[value] for value in pixels]
+    else:
+        indices = [red_table[red] + green_table[green] + blue_table[blue]
+                   for red, green, blue in zip(pixels[0::3], pixels[1::3], pixels[2::3])]
+    return array(typecode, b"".join([color_table[idx] for idx in indices]))
+
+
+def map_float_pixels(pixels, channels, color_table, input_exp_range=(-12.473931189, 4.026068812), typecode='f'):
+    """
+    Maps scene linear float pixels to false colors through the pre-sampled colors. The relative luminance of the
+    allocated values is rounded to the nearest entry of the color table, which moves the boundaries of constant color
+    bands by at most half an entry, i.e. less than 0.0002 stops for the default table size and input range.
+    :param pixels: Array of scene linear pixel values with one or three channels
+    :param channels: Number of channels
+    :param color_table: Table created by make_color_table()
+    :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+    :param typecode: 'f' for colors packed as floats, 'H' for colors quantized to 16-bit integers
+    :return: Array of RGB pixel values
+    """
+    allocated = allocate_lg2(pixels, input_exp_range[0], input_exp_range[1])
+    scale = (len(color_table) - 1) / colors.lut_entry_luminance(1.0, 1.0, 1.0)
+    if channels == 1:
+        indices = [int(value * (len(color_table) - 1) + 0.5) for value in allocated]
+    else:
+        red_weight = colors.lut_entry_luminance(scale, 0.0, 0.0)
+        green_weight = colors.lut_entry_luminance(0.0, scale, 0.0)
+        blue_weight = colors.lut_entry_luminance(0.0, 0.0, scale)
+        indices = [int(red * red_weight + green * green_weight + blue * blue_weight + 0.5)
+                   for red, green, blue in zip(allocated[0::3], allocated[1::3], allocated[2::3])]
+    return array(typecode, b"".join([color_table[idx] for idx in indices]))
+
+
+def _get_color_table():
+    """
+    :return: Color table of the worker state, which is created from its get_color function on first use
+    """
+    if "color_table" not in _worker_state:
+        _worker_state["color_table"] = make_color_table(_worker_state["get_color"])
+    return _worker_state["color_table"]
+
+
+def _get_integer_tables(typecode):
+    """
+    Returns the luminance and color tables of the worker state for an integer type code, creating them on first use.
+    :param typecode: Type code of the integer pixel array
+    :return: Luminance tables and color table
+    """
+    key = ("integer_tables", typecode)
+    if key not in _worker_state:
+        luminance_tables = make_luminance_tables(INTEGER_MAX_VALUES[typecode], _worker_state["input_exp_range"])
+        _worker_state[key] = luminance_tables, _get_color_table()
+    return _worker_state[key]
+
+
+def _apply_lut_to_tile(pixels, channels, typecode):
+    """
+    Applies the LUT of the worker state to a tile of pixels.
+    :param pixels: Array or view of scene linear pixel values with one or three channels
+    :param channels: Number of channels
+    :param typecode: Type code of the pixel values
+    :return: Array of RGB pixel values
+    """
+    if typecode in INTEGER_MAX_VALUES:
+        return map_integer_pixels(pixels, channels, *_get_integer_tables(typecode))
+    if "color_table" in _worker_state:
+        return map_float_pixels(pixels, channels, _worker_state["color_table"], _worker_state["input_exp_range"])
+
+    table = _worker_state["table"]
+    cube_size = _worker_state["cube_size"]
+    method = _worker_state["method"]
+    exponent_min, exponent_max = _worker_state["input_exp_range"]
+
+    allocated = allocate_lg2(pixels, exponent_min, exponent_max)
+    if channels == 1:
+        rgb = zip(allocated, allocated, allocated)
+    else:
+        rgb = zip(allocated[0::3], allocated[1::3], allocated[2::3])
+
+    result = array('f')
+    for red, green, blue in rgb:
+        result.extend(interpolation.sample_table(table, cube_size, red, green, blue, method))
+    return result
+
+
+def _get_mapped_image(file_path, width, height, channels, dtype, writable):
+    """
+    Returns the mapped image of the worker state for the arguments, opening it on first use.
+    """
+    key = ("image", file_path, width, height, channels, dtype, writable)
+    if key not in _worker_state:
+        _worker_state[key] = file_io.open_image(file_path, width, height, channels, dtype, writable)
+    return _worker_state[key]
+
+
+def _close_mapped_images():
+    for key in [key for key in _worker_state if key[0] == "image"]:
+        _worker_state.pop(key).close()
+
+
+def process_tile(function, image, output, first, last):
+    """
+    Processes a tile of complete rows. The pixel values are read from a view of the input image and written into the
+    output image, both of which are memory-mapped, therefore only the result of the tile is held in memory.
+    :param function: Function that is called with the pixels, number of channels and type code of a tile and returns
+        an array of RGB pixel values
+    :param image: Input MappedImage
+    :param output: Output MappedImage
+    :param first: Index of the first row of the tile
+    :param last: Index of the row after the last one of the tile
+    """
+    pixels = image.get_rows(first, last)
+    try:
+        result = function(pixels, image.channels, image.typecode)
+    finally:
+        if isinstance(pixels, memoryview):
+            pixels.release()
+    output.set_rows(first, last, result, bottom_up=image.bottom_up)
+
+
+def _process_tile_of_files(function, image_args, output_path, first, last):
+    """
+    Processes a tile in a worker process, which maps the input and output image files itself.
+    """
+    image = _get_mapped_image(*image_args, writable=False)
+    output = _get_mapped_image(output_path, image.width, image.height, 3, "float32", writable=True)
+    process_tile(function, image, output, first, last)
+
+
+def process_tiles(function, state, image_args, output_path, workers=None, tile_rows=32):
+    """
+    Splits an image into tiles of complete rows and processes them in a pool of worker processes. The workers map
+    the input and output image files, so no pixel data is sent between the processes.
+    :param function: Function that is called with the pixels, number of channels and type code of a tile and returns
+        an array of RGB pixel values
+    :param state: Dictionary that is made available to the function in each worker process
+    :param image_args: Path, width, height, number of channels and data type of the input image for
+        file_io.open_image()
+    :param output_path: Path, including filename, where the RGB image is saved as PFM or raw float image
+    :param workers: Number of worker processes, defaults to the number of processors. If 1, the tiles are processed
+        in the current process.
+    :param tile_rows: Number of rows per tile
+    """
+    with file_io.open_image(*image_args) as image:
+        width, height = image.width, image.height
+    file_io.create_image(output_path, width, height, 3).close()
+
+    tiles = [(start, min(height, start + tile_rows)) for start in range(0, height, tile_rows)]
+    if workers == 1:
+        _init_worker(state)
+        try:
+            for first, last in tiles:
+                _process_tile_of_files(function, image_args, output_path, first, last)
+        finally:
+            _close_mapped_images()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(state,)) as executor:
+            list(executor.map(_process_tile_of_files,
+                              [function] * len(tiles),
+                              [image_args] * len(tiles),
+                              [output_path] * len(tiles),
+                              *zip(*tiles)))
+
+
+def _sample_grey(table, cube_size, method, y):
+    """
+    Samples a LUT at the grey input value with the given normalized relative luminance.
+    """
+    value = y / colors.lut_entry_luminance(1.0, 1.0, 1.0)
+    return interpolation.sample_table(table, cube_size, value, value, value, method)
+
+
+def apply_lut(lut_path, image_path, output_path, width=None, height=None, method="tetrahedral", workers=None,
+              dtype="float32", input_exp_range=(-12.473931189, 4.026068812), exact=False):
+    """
+    Applies a false color LUT to a scene linear image. The lg2 allocation is applied to the image first, in the same
+    way as OpenColorIO does it before sampling the LUT. Images are mapped through tables that are pre-sampled along the
+    grey axis of the LUT, which assumes that the color of the LUT only depends on the luminance, like for all LUTs
+    created by the generators. Sampling the LUT for every float pixel instead runs at about 60k to 70k pixels per
+    second and worker process with tetrahedral interpolation, compared to about 1M pixels per second for the tables,
+    i.e. an 8K image takes about 8 minutes instead of half a minute per process. Pre-sampling the tables takes about a
+    second, so float images with fewer pixels than the tables have entries are sampled directly.
+    :param lut_path: Path to the LUT file in one of file_io.LUT_FORMATS
+    :param image_path: Path to the PFM, PPM or raw image
+    :param output_path: Path, including filename, where the false color image is saved as PFM or raw float image
+    :param width: Width of raw images
+    :param height: Height of raw images
+    :param method: Either "trilinear" or "tetrahedral"
+    :param workers: Number of worker processes, defaults to the number of processors
+    :param dtype: Data type of raw images, one of file_io.RAW_DTYPES
+    :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+    :param exact: If True, the LUT is sampled for every pixel of float images, see map_float_pixels() for the
+        difference
+    """
+    # The output is created before the input is read, which would truncate the input
+    if os.path.abspath(output_path) == os.path.abspath(image_path):
+        raise ValueError(f"Applying the LUT to {image_path} would overwrite the input image.")
+    cube_size, table = file_io.load_lut(lut_path)
+    image_args = (image_path, width, height, 3, dtype)
+    with file_io.open_image(*image_args) as image:
+        typecode = image.typecode
+        pixel_count = image.width * image.height
+    state = {"table": table, "cube_size": cube_size, "method": method, "input_exp_range": input_exp_range}
+    if typecode in INTEGER_MAX_VALUES or (not exact and pixel_count >= INTEGER_TABLE_SIZE):
+        state["color_table"] = make_color_table(functools.partial(_sample_grey, table, cube_size, method))
+    process_tiles(_apply_lut_to_tile, state, image_args, output_path, workers)
+
+
+def render_pixels(pixels, channels, transfer_function, input_exp_range=(-12.473931189, 4.026068812)):
+    """
+    Evaluates a false color transfer function directly for every pixel, without sampling a LUT. The result matches
+    the spi3d files of the LUT generators, as they are applied by OpenColorIO.
+    :param pixels: Array of scene linear pixel values with one or three channels
+    :param channels: Number of channels
+    :param transfer_function: Function that returns the color for the relative luminance of the normalized input
+    :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+    :return: Array of RGB pixel values
+    """
+    allocated = allocate_lg2(pixels, input_exp_range[0], input_exp_range[1])
+    if channels == 1:
+        luminances = [colors.lut_entry_luminance(value, value, value) for value in allocated]
+    else:
+        luminances = list(map(colors.lut_entry_luminance, allocated[0::3], allocated[1::3], allocated[2::3]))
+
+    result = array('f')
+    for y in luminances:
+        result.extend(transfer_function(y))
+    return result
+
+
+def _render_tile(pixels, channels, typecode):
+    """
+    Renders a tile of pixels with the transfer function of the worker state.
+    :param pixels: Array or view of scene linear pixel values with one or three channels
+    :param channels: Number of channels
+    :param typecode: Type code of the pixel values
+    :return: Array of RGB pixel values
+    """
+    if typecode in INTEGER_MAX_VALUES:
+        return map_integer_pixels(pixels, channels, *_get_integer_tables(typecode))
+    if not _worker_state["exact"]:
+        return map_float_pixels(pixels, channels, _get_color_table(), _worker_state["input_exp_range"])
+    return render_pixels(pixels, channels, _worker_state["transfer_function"], _worker_state["input_exp_range"])
+
+
+def _render_frame(image_path, output_path, width, height, tile_rows=32):
+    """
+    Renders one frame of a sequence with the transfer function of the worker state. The input and output images
+    are memory-mapped and processed in tiles of complete rows.
+    :param image_path: Path to the PFM, PPM or raw image
+    :param output_path: Path, including filename, where the false color image is saved
+    :param width: Width of raw images
+    :param height: Height of raw images
+    :param tile_rows: Number of rows per tile
+    :return: Output path
+    """
+    with file_io.open_image(image_path, width, height, dtype=_worker_state["dtype"]) as image:
+        with file_io.create_image(output_path, image.width, image.height, 3) as output:
+            for first in range(0, image.height, tile_rows):
+                process_tile(_render_tile, image, output, first, min(image.height, first + tile_rows))
+    return output_path
+
+
+def render_sequence(transfer_function, image_paths, output_dir, width=None, height=None, workers=None, prefetch=2,
+                    dtype="float32", input_exp_range=(-12.473931189, 4.026068812), exact=False):
+    """
+    Renders false color versions of a sequence of scene linear images with the transfer function, without sampling a
+    LUT. Frames are distributed to a pool of worker processes, which load, render and save them. Only a bounded
+    number of frames is queued ahead of the worker processes. The pixels are mapped through a table of the transfer
+    function, pre-sampled at the quantized luminances of make_color_table(), at about 1M pixels per second and worker
+    process. Evaluating the transfer function for every float pixel instead runs at about 200k to 300k pixels per
+    second, depending on the colormap, i.e. a 4K frame takes about 8 instead of 30 to 45 seconds per process.
+    :param transfer_function: Function that returns the color for the relative luminance of the normalized input
+    :param image_paths: Paths to the PFM, PPM or raw images
+    :param output_dir: Directory where the false color images are saved with the filenames of the input images. PPM
+        images are saved as PFM, all other images in their input format or as raw 32-bit float data.
+    :param width: Width of raw images
+    :param height: Height of raw images
+    :param workers: Number of worker processes, defaults to the number of processors
+    :param prefetch: Number of frames that are queued in addition to the ones being rendered
+    :param dtype: Data type of raw images, one of file_io.RAW_DTYPES
+    :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+    :param exact: If True, the transfer function is evaluated for every pixel of float images, see map_float_pixels()
+        for the difference
+    """
+    state = {"transfer_function": transfer_function, "get_color": transfer_function, "dtype": dtype,
+             "input_exp_range": input_exp_range, "exact": exact}
+    workers = workers or os.cpu_count() or 1
+    pending = collections.deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(state,)) as executor:
+        for image_path in image_paths:
+            filename, extension = os.path.splitext(os.path.basename(image_path))
+            if extension.lower() == ".ppm":
+                extension = ".pfm"
+            output_path = os.path.join(output_dir, filename + extension)
+            if os.path.abspath(output_path) == os.path.abspath(image_path):
+                raise ValueError(f"Rendering {image_path} would overwrite the input image.")
+            pending.append(executor.submit(_render_frame, image_path, output_path, width, height))
+            if len(pending) >= workers + prefetch:
+                print(f"Saved {pending.popleft().result()}")
+        while pending:
+            print(f"Saved {pending.popleft().result()}")
+
+
+# Raw video pixel formats supported by filter_stream(), with the type code of their values
+STREAM_PIXEL_FORMATS = {"rgb48le": 'H', "rgbf32le": 'f'}
+
+
+def _read_frames(instream, frame_size, frames):
+    """
+    Reads fixed size frames until the end of the stream and puts them into the queue, followed by None. If the stream
+    ends within a frame or can't be read, the queue ends with the exception instead.
+    """
+    end = None
+    try:
+        while True:
+            frame = instream.read(frame_size)
+            if not frame:
+                break
+            if len(frame) < frame_size:
+                end = ValueError(f"The stream ended within a frame, only {len(frame)} of {frame_size} bytes were "
+                                 f"read.")
+                break
+            frames.put(frame)
+    except Exception as e:
+        end = e
+    finally:
+        frames.put(end)
+
+
+def _write_frames(outstream, frames, errors):
+    """
+    Writes the frames from the queue to the stream until it receives None. If writing fails, e.g. because the
+    receiving process has exited, the exception is appended to errors and the remaining frames are discarded, so
+    putting frames into the queue never blocks.
+    """
+    while True:
+        frame = frames.get()
+        if frame is None:
+            break
+        if errors:
+            continue
+        try:
+            outstream.write(frame)
+            outstream.flush()
+        except Exception as e:
+            errors.append(e)
+
+
+def _filter_frame(frame):
+    """
+    Applies false colors to a frame of a stream with the tables or the transfer function of the worker state.
+    :param frame: Bytes of the frame with interleaved RGB values in little-endian byte order
+    :return: Bytes of the false color frame in the same pixel format
+    """
+    typecode = _worker_state["typecode"]
+    pixels = array(typecode, frame)
+    if sys.byteorder != "little":
+        pixels.byteswap()
+    if typecode in INTEGER_MAX_VALUES:
+        result = map_integer_pixels(pixels, 3, _worker_state["luminance_tables"], _worker_state["color_table"],
+                                    typecode)
+    elif _worker_state["exact"]:
+        result = render_pixels(pixels, 3, _worker_state["transfer_function"], _worker_state["input_exp_range"])
+    else:
+        result = map_float_pixels(pixels, 3, _worker_state["color_table"], _worker_state["input_exp_range"])
+    if sys.byteorder != "little":
+        result.byteswap()
+    return result.tobytes()
+
+
+def filter_stream(transfer_function, width, height, pixel_format, instream, outstream,
+                  input_exp_range=(-12.473931189, 4.026068812), workers=None, exact=False):
+    """
+    Applies false colors to a stream of raw video frames, e.g. piped from and to ffmpeg. Frames are read and written
+    by separate threads with a queue of two frames each, so that reading, processing and writing overlap. The frames
+    are distributed to a pool of worker processes, the results are written in the order of the input frames. The
+    output has the same pixel format as the input. The frames before a truncated last frame are written, before the
+    truncation is raised as ValueError. If writing fails, the exception of the writer is raised.
+    Both pixel formats are mapped through tables of the pre-sampled transfer function, at about 1M pixels per second
+    and worker process, i.e. about two seconds for a 1080p frame.
+    :param transfer_function: Function that returns the color for the relative luminance of the normalized input
+    :param width: Width of the frames
+    :param height: Height of the frames
+    :param pixel_format: One of STREAM_PIXEL_FORMATS
+    :param instream: Binary stream of frames with interleaved RGB values in little-endian byte order
+    :param outstream: Binary stream to which the false color frames are written
+    :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+    :param workers: Number of worker processes, defaults to the number of processors. If 1, the frames are processed
+        in the current process.
+    :param exact: If True, the transfer function is evaluated for every pixel of rgbf32le frames, see
+        map_float_pixels() for the difference
+    """
+    typecode = STREAM_PIXEL_FORMATS[pixel_format]
+    frame_size = width * height * 3 * array(typecode).itemsize
+    state = {"typecode": typecode, "transfer_function": transfer_function, "input_exp_range": input_exp_range,
+             "exact": exact}
+    if typecode in INTEGER_MAX_VALUES:
+        max_value = INTEGER_MAX_VALUES[typecode]
+        state["luminance_tables"] = make_luminance_tables(max_value, input_exp_range)
+        state["color_table"] = make_color_table(transfer_function, max_value=max_value)
+    elif not exact:
+        state["color_table"] = make_color_table(transfer_function)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(state)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(state,))
+        # The workers are started before the reader thread. Forked workers close their copy of stdin, which blocks
+        # forever, if the reader thread holds the lock of stdin while the workers are forked.
+        executor.submit(os.getpid).result()
+
+    input_frames = queue.Queue(maxsize=2)
+    output_frames = queue.Queue(maxsize=2)
+    reader = threading.Thread(target=_read_frames, args=(instream, frame_size, input_frames), daemon=True)
+    write_errors = []
+    writer = threading.Thread(target=_write_frames, args=(outstream, output_frames, write_errors), daemon=True)
+    reader.start()
+    writer.start()
+
+    # Frames that are processed by the workers, in the order of the stream
+    pending = collections.deque()
+    try:
+        end = None
+        while not write_errors:
+            frame = input_frames.get()
+            if frame is None or isinstance(frame, Exception):
+                end = frame
+                break
+            if executor is None:
+                output_frames.put(_filter_frame(frame))
+                continue
+            pending.append(executor.submit(_filter_frame, frame))
+            if len(pending) >= workers + 1:
+                output_frames.put(pending.popleft().result())
+        while pending and not write_errors:
+            output_frames.put(pending.popleft().result())
+        if end is not None and not write_errors:
+            raise end
+    finally:
+        output_frames.put(None)
+        writer.join()
+        if executor is not None:
+            executor.shutdown()
+    if write_errors:
+        raise write_errors[0]
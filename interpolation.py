@@ -0,0 +1,149 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+
+INTERPOLATION_METHODS = ("trilinear", "tetrahedral")
+
+
+def get_sample_positions(source_size, target_size):
+    """
+    Calculates where the entries of a target axis are located on a source axis, if both span the same value range.
+    :param source_size: Number of entries on the source axis
+    :param target_size: Number of entries on the target axis
+    :return: List of (lower source index, upper source index, factor) tuples, one for each target entry
+    """
+    positions = []
+    for idx in range(target_size):
+        x = idx * (source_size - 1) / max(1, target_size - 1)
+        lower = min(int(math.floor(x)), source_size - 1)
+        upper = min(lower + 1, source_size - 1)
+        positions.append((lower, upper, x - lower))
+    return positions
+
+
+def trilinear(c000, c001, c010, c011, c100, c101, c110, c111, fx, fy, fz):
+    """
+    Trilinear interpolation between the eight corners of a cell. The first digit of a corner refers to the x axis,
+    the second to the y axis and the third to the z axis.
+    :param fx: Factor in [0.0, 1.0] along the x axis
+    :param fy: Factor in [0.0, 1.0] along the y axis
+    :param fz: Factor in [0.0, 1.0] along the z axis
+    :return: Interpolated color
+    """
+    color = []
+    for i in range(3):
+        c00 = c000[i] + (c001[i] - c000[i]) * fz
+        c01 = c010[i] + (c011[i] - c010[i]) * fz
+        c10 = c100[i] + (c101[i] - c100[i]) * fz
+        c11 = c110[i] + (c111[i] - c110[i]) * fz
+        c0 = c00 + (c01 - c00) * fy
+        c1 = c10 + (c11 - c10) * fy
+        color.append(c0 + (c1 - c0) * fx)
+    return color
+
+
+def tetrahedral(c000, c001, c010, c011, c100, c101, c110, c111, fx, fy, fz):
+    """
+    Tetrahedral interpolation between the eight corners of a cell. The cell is split into six tetrahedra along its
+    diagonal from c000 to c111 and only the four corners of the tetrahedron containing the sample are used. The
+    first digit of a corner refers to the x axis, the second to the y axis and the third to the z axis.
+    :param fx: Factor in [0.0, 1.0] along the x axis
+    :param fy: Factor in [0.0, 1.0] along the y axis
+    :param fz: Factor in [0.0, 1.0] along the z axis
+    :return: Interpolated color
+    """
+    if fx >= fy:
+        if fy >= fz:
+            a, b, c, w = c100, c110, c111, (fx, fy, fz)
+        elif fx >= fz:
+            a, b, c, w = c100, c101, c111, (fx, fz, fy)
+        else:
+            a, b, c, w = c001, c101, c111, (fz, fx, fy)
+    else:
+        if fz >= fy:
+            a, b, c, w = c001, c011, c111, (fz, fy, fx)
+        elif fz >= fx:
+            a, b, c, w = c010, c011, c111, (fy, fz, fx)
+        else:
+            a, b, c, w = c010, c110, c111, (fy, fx, fz)
+    return [c000[i] + (a[i] - c000[i]) * w[0] + (b[i] - a[i]) * w[1] + (c[i] - b[i]) * w[2] for i in range(3)]
+
+
+def resample_plane(lower_plane, upper_plane, factor, source_size, target_size, method="tetrahedral"):
+    """
+    Interpolates one plane of a resampled LUT from the two neighboring planes of the source LUT.
+    :param lower_plane: Source plane below the target plane, indexed by the remaining two axes
+    :param upper_plane: Source plane above the target plane, indexed by the remaining two axes
+    :param factor: Distance of the target plane from the lower plane, relative to the distance between the planes
+    :param source_size: Cube size of the source LUT
+    :param target_size: Cube size of the resampled LUT
+    :param method: Either "trilinear" or "tetrahedral"
+    :return: Target plane, indexed by the remaining two axes
+    """
+    if method not in INTERPOLATION_METHODS:
+        raise ValueError(f"Unknown interpolation method '{method}'.")
+    interpolate = tetrahedral if method == "tetrahedral" else trilinear
+    positions = get_sample_positions(source_size, target_size)
+
+    plane = []
+    for u0, u1, fu in positions:
+        lower_row_0, lower_row_1 = lower_plane[u0], lower_plane[u1]
+        upper_row_0, upper_row_1 = upper_plane[u0], upper_plane[u1]
+        plane.append([interpolate(lower_row_0[v0], lower_row_0[v1], lower_row_1[v0], lower_row_1[v1],
+                                  upper_row_0[v0], upper_row_0[v1], upper_row_1[v0], upper_row_1[v1],
+                                  factor, fu, fv)
+                      for v0, v1, fv in positions])
+    return plane
+
+
+def sample_table(table, cube_size, red, green, blue, method="tetrahedral"):
+    """
+    Samples a LUT at arbitrary input values.
+    :param table: Flat array of the LUT entries, as returned by file_io.load_lut()
+    :param cube_size: Number of entries per channel of the LUT
+    :param red: Red, value in range [0.0, 1.0]
+    :param green: Green, value in range [0.0, 1.0]
+    :param blue: Blue, value in range [0.0, 1.0]
+    :param method: Either "trilinear" or "tetrahedral"
+    :return: Interpolated color
+    """
+    interpolate = tetrahedral if method == "tetrahedral" else trilinear
+    scale = cube_size - 1
+    corners = []
+    factors = []
+    for value in (red, green, blue):
+        x = min(max(value, 0.0), 1.0) * scale
+        lower = min(int(x), scale - 1)
+        corners.append(lower)
+        factors.append(x - lower)
+
+    stride_g = cube_size * 3
+    stride_r = cube_size * stride_g
+    base = corners[0] * stride_r + corners[1] * stride_g + corners[2] * 3
+
+    def entry(offset):
+        return table[base + offset:base + offset + 3]
+
+    return interpolate(entry(0), entry(3), entry(stride_g), entry(stride_g + 3),
+                       entry(stride_r), entry(stride_r + 3), entry(stride_r + stride_g),
+                       entry(stride_r + stride_g + 3), factors[0], factors[1], factors[2])
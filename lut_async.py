@@ -0,0 +1,157 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import file_io
+import transfer
+import asyncio
+import weakref
+from array import array
+
+
+def _evaluate_slab(transfer_function, luminances):
+    """
+    Evaluates a transfer function for a slab of the luminance grid in a worker of the executor.
+    """
+    slab = array('d')
+    for y in luminances:
+        slab.extend(transfer_function(y))
+    return slab
+
+
+def _format_slab(transfer_function, luminances, cube_size, lut_format, index):
+    """
+    Evaluates a transfer function for a plane of the luminance grid and formats the lines of the plane.
+    """
+    slab = _evaluate_slab(transfer_function, luminances)
+    row_size = cube_size * 3
+    plane = [[slab[start:start + 3] for start in range(row_start, row_start + row_size, 3)]
+             for row_start in range(0, len(slab), row_size)]
+    return "".join(file_io.format_lut_plane(lut_format, index, plane)).encode("ascii")
+
+
+def _get_slab(luminance_grid, cube_size, axis, index):
+    """
+    :return: Relative luminance of the entries with the given index along the axis, ordered by the remaining two axes
+    """
+    if axis == 0:
+        return luminance_grid[index * cube_size ** 2:(index + 1) * cube_size ** 2]
+    elif axis == 2:
+        return luminance_grid[index::cube_size]
+    raise ValueError(f"Unsupported axis {axis}.")
+
+
+class AsyncLutGenerator:
+    """
+    Generates LUTs without blocking the event loop. The work is split into slabs of constant red or blue, which are
+    evaluated one after another by an executor, so a cancelled generation stops after the current slab.
+    """
+    def __init__(self, executor=None, max_concurrent=2):
+        """
+        :param executor: Executor of concurrent.futures that evaluates the slabs, defaults to the executor of the
+            event loop. A ProcessPoolExecutor evaluates generations in parallel, but requires picklable transfer
+            functions, which applies to those of transfer.py.
+        :param max_concurrent: Number of generations that run at once, further generations wait until one is done
+        """
+        self.executor = executor
+        self.max_concurrent = max_concurrent
+        # Semaphores are bound to the event loop that uses them first
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphores[loop]
+
+    async def _get_luminance_grid(self, cube_size, matrix, input_exp_range):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, transfer.get_luminance_grid, cube_size, matrix,
+                                          input_exp_range)
+
+    async def generate(self, transfer_function, cube_size=65, matrix=None,
+                       input_exp_range=(-12.473931189, 4.026068812)):
+        """
+        Generates a LUT as flat array of entries, see LutGeneratorBase.generate_table().
+        :param transfer_function: Function that returns the color for the relative luminance of the normalized input
+        :param cube_size: Number of entries per channel
+        :param matrix: Optional 3x3 matrix, given as list of rows, that is applied to the scene linear values before
+            the allocation
+        :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+        :return: Flat array with the red, green and blue values of every entry
+        """
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            luminance_grid = await self._get_luminance_grid(cube_size, matrix, input_exp_range)
+            table = array('d')
+            for index in range(cube_size):
+                slab = _get_slab(luminance_grid, cube_size, 0, index)
+                table.extend(await loop.run_in_executor(self.executor, _evaluate_slab, transfer_function, slab))
+            return table
+
+    async def stream(self, transfer_function, cube_size=65, lut_format="spi3d", matrix=None,
+                     input_exp_range=(-12.473931189, 4.026068812)):
+        """
+        Generates a LUT and yields the content of the file in chunks, one plane at a time for the spi3d and cube
+        formats. Hald CLUTs are compressed as a whole and yielded as a single chunk, once all slabs are evaluated.
+        :param transfer_function: Function that returns the color for the relative luminance of the normalized input
+        :param cube_size: Number of entries per channel
+        :param lut_format: One of file_io.LUT_FORMATS
+        :param matrix: Optional 3x3 matrix, given as list of rows, that is applied to the scene linear values before
+            the allocation
+        :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+        :return: Asynchronous iterator of bytes, which add up to the same content as file_io.save_lut() writes
+        """
+        if lut_format == "hald":
+            table = await self.generate(transfer_function, cube_size, matrix, input_exp_range)
+            loop = asyncio.get_running_loop()
+            yield await loop.run_in_executor(self.executor, file_io.serialize_lut, table, cube_size, lut_format)
+            return
+
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            luminance_grid = await self._get_luminance_grid(cube_size, matrix, input_exp_range)
+            yield "".join(file_io.format_lut_header(lut_format, cube_size)).encode("ascii")
+            axis = file_io.LUT_PLANE_AXES[lut_format]
+            for index in range(cube_size):
+                slab = _get_slab(luminance_grid, cube_size, axis, index)
+                yield await loop.run_in_executor(self.executor, _format_slab, transfer_function, slab, cube_size,
+                                                 lut_format, index)
+
+
+_default_generator = AsyncLutGenerator()
+
+
+async def generate_lut_async(transfer_function, cube_size=65, matrix=None,
+                             input_exp_range=(-12.473931189, 4.026068812)):
+    """
+    Generates a LUT as flat array of entries with the default executor of the event loop, see
+    AsyncLutGenerator.generate().
+    """
+    return await _default_generator.generate(transfer_function, cube_size, matrix, input_exp_range)
+
+
+def stream_lut_async(transfer_function, cube_size=65, lut_format="spi3d", matrix=None,
+                     input_exp_range=(-12.473931189, 4.026068812)):
+    """
+    Generates a LUT and yields the content of the file in chunks with the default executor of the event loop, see
+    AsyncLutGenerator.stream().
+    """
+    return _default_generator.stream(transfer_function, cube_size, lut_format, matrix, input_exp_range)
@@ -20,15 +20,35 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import bundle
+import checksums
 import colors
+import cvd
 import file_io
-import mapping
+import image_processing
+import interpolation
+import lut_tools
+import manifest
+import memo
+import metrics
+import progress
+import server
+import shader
+import swatches
+import sweep
+import transfer
+import watch
 import argparse
+import json
 import os
-import bisect
+import sys
+import time
 from typing import List
 from abc import ABC, abstractmethod
 
+# Luminance grids are shared by all generations of the process, e.g. the regenerations of --watch
+_luminance_grid_memo = memo.Memo(max_bytes=64 * 2 ** 20)
+
 
 class LutGeneratorBase(ABC):
     """
@@ -39,9 +59,159 @@ class LutGeneratorBase(ABC):
         self.test = test
 
     @abstractmethod
-    def save_spi3d(self):
+    def get_transfer_functions(self):
         pass
 
+    def save_lut(self, lut_format="spi3d", cube_size=65, shaper_size=None, matrix=None, observer=None, compress=False):
+        """
+        Generate and save a lookup table for every transfer function of the generator.
+        :param lut_format: One of file_io.LUT_FORMATS
+        :param cube_size: Number of entries per channel
+        :param shaper_size: If set, the `allocation: lg2` transform is baked into a 1D shaper LUT with this number of
+            entries, so the lookup tables can be applied to scene linear values without an OCIO configuration. The
+            shaper is embedded in cube files and saved as separate spi1d file next to spi3d files.
+        :param matrix: Optional 3x3 matrix, given as list of rows, that is applied to the scene linear values before
+            the allocation
+        :param observer: Optional progress.GenerationObserver that receives the progress of every lookup table and
+            can cancel the generation. A cancelled or failed lookup table leaves the previous file unchanged.
+        :param compress: If True, the lookup tables are compressed with gzip while they are written and the extension
+            file_io.GZIP_EXTENSION is appended to their filenames
+        :return: Dictionary with the SHA-256 of every saved file, keyed by its path
+        """
+        sha256 = {}
+        for filename, transfer_function in self.get_transfer_functions():
+            if observer is None:
+                table = self.generate_table(transfer_function, cube_size, matrix)
+                file_path = self.get_file_path(self.output, filename, lut_format)
+                sha256.update(self._save_table(table, cube_size, file_path, lut_format, shaper_size, compress))
+            else:
+                sha256.update(self._save_observed(transfer_function, filename, lut_format, cube_size, shaper_size,
+                                                  matrix, observer, compress))
+        return sha256
+
+    def save_spi3d(self, cube_size=65, shaper_size=None, matrix=None, observer=None, compress=False):
+        """
+        Generate and save a lookup table in the spi3d format for every transfer function of the generator. Kept for
+        callers written before save_lut() supported other formats.
+        :param cube_size: Number of entries per channel
+        :param shaper_size: See save_lut()
+        :param matrix: See save_lut()
+        :param observer: See save_lut()
+        :param compress: See save_lut()
+        :return: Dictionary with the SHA-256 of every saved file, keyed by its path
+        """
+        return self.save_lut("spi3d", cube_size, shaper_size, matrix, observer, compress)
+
+    def _save_table(self, table, cube_size, file_path, lut_format, shaper_size, compress, progress=None):
+        planes = file_io.get_lut_planes(table, cube_size, file_io.LUT_PLANE_AXES[lut_format])
+        if progress is not None:
+            progress.start_phase("write", cube_size)
+            planes = progress.iterate(planes)
+
+        suffix = file_io.GZIP_EXTENSION if compress else ""
+        sha256 = {}
+        if shaper_size is None:
+            sha256[file_path + suffix] = file_io.save_lut_planes(planes, cube_size, file_path + suffix, lut_format,
+                                                                 compress=compress)
+        elif lut_format == "cube":
+            shaper_range, shaper = self.generate_shaper(shaper_size)
+            sha256[file_path + suffix] = file_io.save_lut_planes(planes, cube_size, file_path + suffix, lut_format,
+                                                                 shaper, shaper_range, compress)
+        else:
+            shaper_range, shaper = self.generate_shaper(shaper_size)
+            sha256[file_path + suffix] = file_io.save_lut_planes(planes, cube_size, file_path + suffix, lut_format,
+                                                                 compress=compress)
+            shaper_path = os.path.splitext(file_path)[0] + ".spi1d" + suffix
+            sha256[shaper_path] = file_io.save_spi1d(shaper, shaper_range, shaper_path, compress)
+        return sha256
+
+    def _save_observed(self, transfer_function, filename, lut_format, cube_size, shaper_size, matrix, observer,
+                       compress):
+        start = time.perf_counter()
+        tracker = progress.ProgressTracker(observer, filename)
+        file_path = self.get_file_path(self.output, filename, lut_format)
+        observer.on_start(filename, cube_size)
+        table = self.generate_table(transfer_function, cube_size, matrix, progress=tracker)
+        sha256 = self._save_table(table, cube_size, file_path, lut_format, shaper_size, compress, tracker)
+        observer.on_complete(filename, list(sha256), time.perf_counter() - start)
+        return sha256
+
+    def save_shader(self, language, cube_size=65):
+        """
+        Save the transfer functions of the generator as shader code instead of lookup tables. Every shader is checked
+        on the CPU against the lookup table that would have been generated.
+        :param language: One of shader.SHADER_LANGUAGES
+        :param cube_size: Number of entries per channel of the lookup tables used for the check
+        :return: Dictionary with the SHA-256 of every saved shader, keyed by its path
+        """
+        sha256 = {}
+        for filename, transfer_function in self.get_transfer_functions():
+            program = shader.ShaderProgram(filename, transfer_function)
+            error = shader.check_shader_program(program, self.generate_table(transfer_function, cube_size), cube_size)
+            file_path = os.path.join(self.output, os.path.splitext(filename)[0] + shader.SHADER_EXTENSIONS[language])
+            sha256[file_path] = file_io.save_file(shader.format_shader(program, language), file_path)
+            print(f"Saved {file_path}, largest difference to the LUT: {error:.8f}")
+        return sha256
+
+    @staticmethod
+    def generate_table(transfer_function, cube_size=65, matrix=None, input_exp_range=(-12.473931189, 4.026068812),
+                       progress=None):
+        """
+        Generates the false color 3D LUT for Blender based on the given transfer function, as flat array of entries.
+        :param transfer_function: Function that returns the color for the relative luminance of the normalized input
+        :param cube_size: [0, cube_size-1] is the range of input samples per channel in the generated LUT
+        :param matrix: Optional 3x3 matrix, given as list of rows. The normalized input of every entry is converted
+            back to scene linear values, transformed by the matrix and normalized again.
+        :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+        :param progress: Optional progress.ProgressTracker that receives the luminance and evaluate phases
+        :return: Flat array with the red, green and blue values of every entry, in the same layout as
+            file_io.load_lut() returns
+        """
+        grid_config = memo.GridConfig(cube_size,
+                                      tuple(tuple(row) for row in matrix) if matrix is not None else None,
+                                      tuple(input_exp_range))
+        luminance_grid = _luminance_grid_memo.get_luminance_grid(grid_config, progress)
+        return transfer.evaluate_grid(transfer_function, luminance_grid, progress, cube_size)
+
+    @staticmethod
+    def generate_shaper(shaper_size, input_exp_range=(-12.473931189, 4.026068812)):
+        """
+        Samples the `allocation: lg2` transform as 1D LUT for scene linear values from 0.0 up to the largest value
+        of the input range. Since the entries are evenly spaced, values below the first entry after 0.0 are only
+        approximated by linear interpolation, which requires enough entries for the darkest exposure values.
+        :param shaper_size: Number of entries
+        :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+        :return: Tuple of the input range and the list of normalized values
+        """
+        shaper_range = (0.0, 2 ** input_exp_range[1])
+        inputs = [shaper_range[1] * idx / (shaper_size - 1) for idx in range(shaper_size)]
+        return shaper_range, image_processing.allocate_lg2(inputs, input_exp_range[0], input_exp_range[1])
+
+    @staticmethod
+    def generate_spi3d(transfer_function, cube_size=65):
+        """
+        Generates the false color 3D LUT for Blender based on the given transfer function.
+        :param transfer_function: Function that returns the color for the relative luminance of the normalized input
+        :param cube_size: [0, cube_size-1] is the range of input samples per channel in the generated LUT
+        :return: Generated LUT as list of strings
+        """
+        table = LutGeneratorBase.generate_table(transfer_function, cube_size)
+        return list(file_io.format_lut(file_io.get_lut_planes(table, cube_size, file_io.LUT_PLANE_AXES["spi3d"]),
+                                       cube_size))
+
+    @staticmethod
+    def get_file_path(output, name, lut_format):
+        """
+        Creates the path of a generated LUT. The extension of the name is replaced for other formats than spi3d.
+        :param output: Output directory
+        :param name: Filename of the LUT
+        :param lut_format: One of file_io.LUT_FORMATS
+        :return: Path
+        """
+        if lut_format != "spi3d":
+            name = os.path.splitext(name)[0] + file_io.LUT_EXTENSIONS[lut_format]
+        return os.path.join(output, name)
+
     @staticmethod
     def generate_spi3d_from_colormap(colormap,
                                      cube_size=65,
@@ -58,36 +228,8 @@ class LutGeneratorBase(ABC):
         :param centered: The input value for middle grey is mapped to the center of the colormap, if set to True
         :return: Generated LUT as list of strings
         """
-        lut = ["SPILUT 1.0\n", "3 3\n", f"{cube_size} {cube_size} {cube_size}\n"]
-        for in_red in range(0, cube_size):
-            for in_green in range(0, cube_size):
-                for in_blue in range(0, cube_size):
-                    red = in_red / (cube_size - 1)
-                    green = in_green / (cube_size - 1)
-                    blue = in_blue / (cube_size - 1)
-                    y = colors.relative_luminance(red, green, blue)
-
-                    low_clip = colors.normalize_value(2 ** unclipped_exp_range[0],
-                                                      input_exp_range[0],
-                                                      input_exp_range[1])
-                    high_clip = colors.normalize_value(2 ** unclipped_exp_range[1],
-                                                       input_exp_range[0],
-                                                       input_exp_range[1])
-                    if y < low_clip:
-                        color = colors.get_color(colormap, 0.0)
-                    elif y > high_clip:
-                        color = colors.get_color(colormap, 1.0)
-                    else:
-                        if centered:
-                            mapped = mapping.map_to_colormap_range(y,
-                                                                   input_exp_range[0],
-                                                                   input_exp_range[1])
-                        else:
-                            mapped = y
-                        color = colors.get_color(colormap, mapped)
-
-                    lut.append(f"{in_red} {in_blue} {in_green} {color[0]:.8f} {color[1]:.8f} {color[2]:.8f}\n")
-        return lut
+        transfer_function = transfer.ColormapTransfer(colormap, input_exp_range, unclipped_exp_range, centered)
+        return LutGeneratorBase.generate_spi3d(transfer_function, cube_size)
 
     @staticmethod
     def generate_spi3d_from_evs(ev_colormap: List[colors.ColorPoint],
@@ -100,40 +242,8 @@ class LutGeneratorBase(ABC):
         :param input_exp_range: Ordered tuple of the two exponents defining the input value range
         :return: Generated LUT as list of strings
         """
-        ev_colormap = sorted(ev_colormap, key=lambda x: x.coordinate)
-        coordinates = []
-        for ev_to_color in ev_colormap:
-            ev_to_color.coordinate = colors.normalize_value(2 ** ev_to_color.coordinate * 0.18,
-                                                            input_exp_range[0],
-                                                            input_exp_range[1])
-            coordinates.append(ev_to_color.coordinate)  # Required for bisect
-
-        lut = ["SPILUT 1.0\n", "3 3\n", f"{cube_size} {cube_size} {cube_size}\n"]
-        for in_red in range(0, cube_size):
-            for in_green in range(0, cube_size):
-                for in_blue in range(0, cube_size):
-                    red = in_red / (cube_size - 1)
-                    green = in_green / (cube_size - 1)
-                    blue = in_blue / (cube_size - 1)
-                    y = colors.relative_luminance(red, green, blue)
-
-                    idx_right_neighbor = bisect.bisect(coordinates, y)
-
-                    if idx_right_neighbor == 0:
-                        color = ev_colormap[idx_right_neighbor].get_color(y)
-                    elif idx_right_neighbor == len(coordinates):
-                        color = ev_colormap[idx_right_neighbor - 1].get_color(y)
-                    else:
-                        idx_left_neighbor = idx_right_neighbor - 1
-                        factor = ((y - coordinates[idx_left_neighbor]) /
-                                  (coordinates[idx_right_neighbor] - coordinates[idx_left_neighbor]))
-
-                        color = colors.interpolate(ev_colormap[idx_left_neighbor].get_color(y),
-                                                   ev_colormap[idx_right_neighbor].get_color(y),
-                                                   factor)
-
-                    lut.append(f"{in_red} {in_blue} {in_green} {color[0]:.8f} {color[1]:.8f} {color[2]:.8f}\n")
-        return lut
+        transfer_function = transfer.EvTransfer(ev_colormap, input_exp_range)
+        return LutGeneratorBase.generate_spi3d(transfer_function, cube_size)
 
     @staticmethod
     def print_colormap(name, colormap):
@@ -159,17 +269,22 @@ class LutGeneratorSingleLutBase(LutGeneratorBase):
         pass
 
     @abstractmethod
-    def generate_lut(self):
+    def get_transfer_function(self):
         pass
 
-    def save_spi3d(self):
+    def generate_lut(self, cube_size=65):
+        """
+        Generates the lookup table for the transfer function of the generator.
+        :param cube_size: Number of entries per channel
+        :return: Flat array of the lookup table entries
+        """
+        return self.generate_table(self.get_transfer_function(), cube_size)
+
+    def get_transfer_functions(self):
         """
-        Generate and save the lookup table in the spi3d format.
-        :return:
+        :return: List with the filename and transfer function of the lookup table
         """
-        lut = self.generate_lut()
-        file_path = os.path.join(self.output, self.name)
-        file_io.save_file(lut, file_path)
+        return [(self.name, self.get_transfer_function())]
 
 
 class LutGeneratorColormapBase(LutGeneratorSingleLutBase):
@@ -184,10 +299,10 @@ class LutGeneratorColormapBase(LutGeneratorSingleLutBase):
     def get_colormap(self):
         pass
 
-    def generate_lut(self):
+    def get_transfer_function(self):
         """
-        Generates the lookup table for the given colormap.
-        :return: Lookup table in the spi3d format
+        Creates the transfer function for the given colormap.
+        :return: Transfer function
         """
         colormap = self.get_colormap()
 
@@ -195,9 +310,9 @@ class LutGeneratorColormapBase(LutGeneratorSingleLutBase):
             self.print_colormap(self.name, colormap)
 
         if self.centered:
-            return self.generate_spi3d_from_colormap(colormap, centered=True)
+            return transfer.ColormapTransfer(colormap, centered=True)
         else:
-            return self.generate_spi3d_from_colormap(colormap, centered=False)
+            return transfer.ColormapTransfer(colormap, centered=False)
 
 
 class LutGeneratorColormapBlocksBase(LutGeneratorSingleLutBase):
@@ -214,11 +329,11 @@ class LutGeneratorColormapBlocksBase(LutGeneratorSingleLutBase):
     def get_colormap(self):
         pass
 
-    def generate_lut(self):
+    def get_transfer_function(self):
         """
-        Generates the lookup table for the given colormap by converting it into an exposure value based colormap with
-        segments of constant color between the exposure values.
-        :return: Lookup table in the spi3d format
+        Creates the transfer function for the given colormap by converting it into an exposure value based colormap
+        with segments of constant color between the exposure values.
+        :return: Transfer function
         """
         colormap = self.get_colormap()
 
@@ -226,17 +341,17 @@ class LutGeneratorColormapBlocksBase(LutGeneratorSingleLutBase):
             ev_colormap = colors.colormap_to_ev_blocks_equidistant(colormap, self.exposure_values)
             if self.test:
                 self.print_colormap(self.name, ev_colormap)
-            return self.generate_spi3d_from_evs(ev_colormap)
+            return transfer.EvTransfer(ev_colormap)
         elif self.block_type == "centered":
             ev_colormap = colors.colormap_to_ev_blocks_centered(colormap, self.exposure_values)
             if self.test:
                 self.print_colormap(self.name, ev_colormap)
-            return self.generate_spi3d_from_evs(ev_colormap)
+            return transfer.EvTransfer(ev_colormap)
         elif self.block_type == "stretched":
             ev_colormap = colors.colormap_to_ev_blocks_stretched(colormap, self.exposure_values)
             if self.test:
                 self.print_colormap(self.name, ev_colormap)
-            return self.generate_spi3d_from_evs(ev_colormap)
+            return transfer.EvTransfer(ev_colormap)
 
 
 class LutGeneratorDefault(LutGeneratorBase):
@@ -246,24 +361,22 @@ class LutGeneratorDefault(LutGeneratorBase):
     def __init__(self, output, test):
         super().__init__(output, test)
 
-    def save_spi3d(self):
+    def get_transfer_functions(self):
         """
-        Generate and save a lookup table in the spi3d format for every pre-defined colormap.
-        :return:
+        Creates the transfer functions for every pre-defined colormap.
+        :return: List with the filename and transfer function of every lookup table
         """
+        transfer_functions = []
         for filename, colormap in colors.colormaps.items():
             if self.test:
                 self.print_colormap(filename, colormap)
-            lut = self.generate_spi3d_from_colormap(colormap)
-            file_path = os.path.join(self.output, filename)
-            file_io.save_file(lut, file_path)
+            transfer_functions.append((filename, transfer.ColormapTransfer(colormap)))
 
         for filename, ev_colormap in colors.ev_colormaps.items():
             if self.test:
                 self.print_colormap(filename, ev_colormap)
-            lut = self.generate_spi3d_from_evs(ev_colormap)
-            file_path = os.path.join(self.output, filename)
-            file_io.save_file(lut, file_path)
+            transfer_functions.append((filename, transfer.EvTransfer(ev_colormap)))
+        return transfer_functions
 
 
 class LutGeneratorViscm(LutGeneratorColormapBase):
@@ -335,16 +448,17 @@ class LutGeneratorEvColormap(LutGeneratorSingleLutBase):
         """
         return colors.ev_colormaps[self.name]
 
-    def generate_lut(self):
+    def get_transfer_function(self):
         """
-        Generates the lookup table for the given colormap.
+        Creates the transfer function for the given colormap.
+        :return: Transfer function
         """
         colormap = self.get_colormap()
 
         if self.test:
             self.print_colormap(self.name, colormap)
 
-        return self.generate_spi3d_from_evs(colormap)
+        return transfer.EvTransfer(colormap)
 
 
 class LutGeneratorFactory:
@@ -404,30 +518,288 @@ class LutGeneratorFactory:
                                                     args.name,
                                                     args.centered)
 
+    @staticmethod
+    def make_source_lut_generator(args):
+        """
+        Makes a lookup table generator for the colormap that has been selected with the --colormap, --ev-colormap or
+        --viscm argument of a command that evaluates transfer functions directly.
+        :param args: Arguments
+        :return: Lookup table generator
+        """
+        source_args = argparse.Namespace(**vars(args))
+        if args.colormap is not None:
+            source_args.sub = "colormap"
+            source_args.name = args.colormap
+        elif args.ev_colormap is not None:
+            source_args.sub = "ev-colormap"
+            source_args.name = args.ev_colormap
+        else:
+            source_args.sub = "viscm"
+            source_args.path = args.viscm
+            source_args.name = os.path.basename(args.viscm)
+        return LutGeneratorFactory.make_lut_generator(source_args)
 
-def main(args):
-    lut_generator = LutGeneratorFactory.make_lut_generator(args)
-    lut_generator.save_spi3d()
+    @staticmethod
+    def make_source_lut_generators(args):
+        """
+        Makes the lookup table generators for a command that accepts the --all argument in addition to --colormap,
+        --ev-colormap or --viscm. With --all a generator is made for every pre-defined colormap.
+        :param args: Arguments
+        :return: List of lookup table generators
+        """
+        if not args.all:
+            return [LutGeneratorFactory.make_source_lut_generator(args)]
 
+        lut_generators = []
+        for name in colors.colormaps:
+            source_args = argparse.Namespace(**{**vars(args), "colormap": name, "ev_colormap": None})
+            lut_generators.append(LutGeneratorFactory.make_source_lut_generator(source_args))
+        for name in colors.ev_colormaps:
+            source_args = argparse.Namespace(**{**vars(args), "colormap": None, "ev_colormap": name})
+            lut_generators.append(LutGeneratorFactory.make_source_lut_generator(source_args))
+        return lut_generators
 
-def parse_args():
-    parser = argparse.ArgumentParser(prog="False Color LUT Generator",
-                                     description="Generates spi3d lookup tables for Blender's color management")
 
-    parser.add_argument("-o",
-                        "--output",
-                        type=str,
-                        help="Output directory for the generated LUTs",
-                        required=True)
-    parser.add_argument("-t",
-                        "--test",
-                        help="Print used colormap(s) to the console",
-                        dest="test",
-                        action="store_true",
-                        required=False)
+def watch_generation(args):
+    """
+    Generates the lookup tables of the viscm or run command and generates them again, whenever the viscm scripts or
+    the manifest have been saved. For manifests only the jobs that have changed or use a changed viscm script are run
+    again. Runs until it is interrupted.
+    :param args: Arguments
+    """
+    if args.sub == "viscm":
+        def get_paths():
+            return [args.path]
+
+        def regenerate(changed_paths):
+            main(argparse.Namespace(**{**vars(args), "watch": False}))
+    else:
+        previous_jobs = []
+
+        def get_paths():
+            return [args.path] + manifest.get_viscm_paths(previous_jobs)
+
+        def regenerate(changed_paths):
+            jobs, _ = manifest.load_manifest(args.path, args.output)
+            for path in changed_paths:
+                manifest.invalidate_source(("viscm", path))
+            affected = [job for job in jobs if job not in previous_jobs or job["source"][1] in changed_paths]
+            previous_jobs[:] = jobs
+            if affected:
+                reports = manifest.run_manifest(affected, 1)
+                update_job_checksums(affected, reports)
+                manifest.print_report(reports)
+
+    def generate(changed_paths):
+        start = time.perf_counter()
+        try:
+            regenerate(changed_paths)
+        except Exception as e:
+            # A script or manifest that is saved in an invalid state shouldn't stop the watch
+            print(f"{type(e).__name__}: {e}")
+        else:
+            print(f"Generated in {time.perf_counter() - start:.2f}s, waiting for changes")
 
-    parent_parser = argparse.ArgumentParser(add_help=False)
-    group = parent_parser.add_mutually_exclusive_group(required=True)
+    def on_change(changed_paths):
+        print(f"Changed: {', '.join(changed_paths)}")
+        generate(changed_paths)
+
+    generate(get_paths())
+    try:
+        watch.watch_files(get_paths, on_change, debounce=args.debounce)
+    except KeyboardInterrupt:
+        pass
+
+
+def update_job_checksums(jobs, reports):
+    """
+    Adds the files saved by the jobs of a manifest to the checksum manifests of their output directories.
+    :param jobs: List of jobs, as returned by manifest.load_manifest()
+    :param reports: Report entries of the jobs, as returned by manifest.run_manifest()
+    """
+    job_parameters = {job["name"]: manifest.get_job_parameters(job) for job in jobs}
+    checksums.update_checksum_manifest({file_path: checksums.make_entry(file_path, sha256,
+                                                                        job_parameters[report["name"]])
+                                        for report in reports for file_path, sha256 in report["sha256"].items()})
+
+
+def get_run_parameters(args, cube_size=None):
+    """
+    Collects the arguments that determine the generated LUTs, for the checksum manifest.
+    :param args: Parsed arguments
+    :param cube_size: Number of entries per channel of the LUTs, if it isn't one of the arguments
+    :return: JSON serializable dictionary with the command and its arguments
+    """
+    excluded = ("sub", "output", "test", "progress", "metrics", "watch", "debounce", "lock", "hald_level")
+    parameters = {"command": args.sub or "default"}
+    if cube_size is not None:
+        parameters["cube_size"] = cube_size
+    parameters.update((key, value) for key, value in sorted(vars(args).items())
+                      if key not in excluded and value is not None and value is not False)
+    return parameters
+
+
+def update_checksums(sha256, parameters):
+    """
+    Adds saved files to the checksum manifests of their directories.
+    :param sha256: Dictionary with the SHA-256 of every saved file, keyed by its path
+    :param parameters: JSON serializable dictionary with the parameters the files were generated with
+    """
+    checksums.update_checksum_manifest({file_path: checksums.make_entry(file_path, file_sha256, parameters)
+                                        for file_path, file_sha256 in sha256.items()})
+
+
+def main(args):
+    if args.watch:
+        watch_generation(args)
+    elif args.sub == "index":
+        lut_tools.index_spi3d(args.path, args.index_path, args.voxel, args.ev)
+    elif args.sub == "resample":
+        output_path = os.path.join(args.output, args.name)
+        sha256 = lut_tools.resample_spi3d(args.path,
+                                          output_path,
+                                          args.cube_size,
+                                          args.method,
+                                          args.format)
+        update_checksums({output_path: sha256}, get_run_parameters(args))
+    elif args.sub == "diff":
+        if not lut_tools.diff_luts(args.path[0], args.path[1], args.tolerance, args.worst, args.method):
+            sys.exit(1)
+    elif args.sub == "apply":
+        image_processing.apply_lut(args.lut,
+                                   args.image,
+                                   os.path.join(args.output, args.name),
+                                   args.width,
+                                   args.height,
+                                   args.method,
+                                   args.workers,
+                                   args.dtype,
+                                   exact=args.exact)
+    elif args.sub == "render":
+        lut_generator = LutGeneratorFactory.make_source_lut_generator(args)
+        image_processing.render_sequence(lut_generator.get_transfer_function(),
+                                         args.images,
+                                         args.output,
+                                         args.width,
+                                         args.height,
+                                         args.workers,
+                                         args.prefetch,
+                                         args.dtype,
+                                         exact=args.exact)
+    elif args.sub == "filter":
+        lut_generator = LutGeneratorFactory.make_source_lut_generator(args)
+        image_processing.filter_stream(lut_generator.get_transfer_function(),
+                                       args.width,
+                                       args.height,
+                                       args.pixel_format,
+                                       sys.stdin.buffer,
+                                       sys.stdout.buffer,
+                                       workers=args.workers,
+                                       exact=args.exact)
+    elif args.sub == "simulate-cvd":
+        deficiencies = args.deficiency or list(cvd.CVD_MATRICES)
+        sha256 = {}
+        for lut_path in args.lut:
+            sha256.update(cvd.simulate_lut(lut_path, args.output, deficiencies, args.format))
+        update_checksums(sha256, get_run_parameters(args))
+        cvd.print_report(args.ev, deficiencies)
+    elif args.sub == "sweep":
+        # Only used for loading the colormap, the modes are part of the variants
+        source_args = argparse.Namespace(output=args.output, test=args.test, colormap=args.colormap,
+                                         ev_colormap=args.ev_colormap, viscm=args.viscm, centered=False,
+                                         blocks_equidistant=None, blocks_centered=None, blocks_stretched=None)
+        lut_generator = LutGeneratorFactory.make_source_lut_generator(source_args)
+        block_stops = [(mode, stops) for mode in sweep.BLOCK_MODES
+                       for stops in getattr(args, mode.replace("-", "_")) or []]
+        modes = args.mode or ([] if block_stops else ["not-centered"])
+        variants = sweep.make_variants(args.input_exp_range or [(-12.473931189, 4.026068812)],
+                                       args.unclipped_exp_range or [],
+                                       modes,
+                                       block_stops,
+                                       args.ev_colormap is not None)
+        sha256 = sweep.run_sweep(args.name or lut_generator.name,
+                                 lut_generator.get_colormap(),
+                                 variants,
+                                 args.output,
+                                 args.cube_size,
+                                 args.format)
+        update_checksums(sha256, get_run_parameters(args))
+    elif args.sub == "patch":
+        lut_generator = LutGeneratorFactory.make_source_lut_generator(args)
+        old_transfer_function = lut_generator.get_transfer_function()
+        if args.ev_colormap is not None:
+            new_ev_colormap = lut_tools.move_stops(old_transfer_function.ev_colormap, args.move_stop)
+            new_transfer_function = transfer.EvTransfer(new_ev_colormap)
+        else:
+            lut_generator.exposure_values = lut_tools.move_stop_values(lut_generator.exposure_values, args.move_stop)
+            new_transfer_function = lut_generator.get_transfer_function()
+        sha256 = lut_tools.patch_spi3d(args.path, old_transfer_function, new_transfer_function)
+        update_checksums({args.path: sha256}, get_run_parameters(args))
+    elif args.sub == "run":
+        jobs, workers = manifest.load_manifest(args.path, args.output)
+        with file_io.lock_directories([job["output"] for job in jobs] if args.lock else []):
+            reports = manifest.run_manifest(jobs, args.workers or workers)
+            update_job_checksums(jobs, reports)
+        manifest.print_report(reports)
+        if args.metrics is not None:
+            cache_counters = {"table": {"hits": sum(report["cached"] for report in reports),
+                                        "misses": sum(not report["cached"] for report in reports)}}
+            metrics.save_metrics(metrics.format_metrics(metrics.get_report_luts(reports, jobs), cache_counters,
+                                                        metrics.get_peak_rss()), args.metrics)
+        if args.report is not None:
+            file_io.save_file([json.dumps(reports, indent=2), "\n"], args.report)
+        if any(report["status"] == "failed" for report in reports):
+            sys.exit(1)
+    elif args.sub == "verify":
+        results = checksums.verify_directory(args.path, args.manifest, args.workers)
+        checksums.print_verification(results)
+        if any(status != "ok" for status in results.values()):
+            sys.exit(1)
+    elif args.sub == "bundle":
+        sha256 = bundle.save_bundle(args.path, args.ocio_config, args.format, args.workers)
+        update_checksums({args.path: sha256}, get_run_parameters(args))
+        print(f"Saved {args.path} with SHA-256 {sha256}")
+    elif args.sub == "serve":
+        server.serve(args.host, args.port, args.socket, args.cache_size * 2 ** 20, args.viscm_dir)
+    elif args.sub == "swatches":
+        for lut_generator in LutGeneratorFactory.make_source_lut_generators(args):
+            sha256 = swatches.save_swatches(lut_generator.name,
+                                            lut_generator.get_transfer_function(),
+                                            args.output,
+                                            args.ev,
+                                            args.size,
+                                            args.strip_width)
+            update_checksums(sha256, get_run_parameters(args))
+    else:
+        lut_generator = LutGeneratorFactory.make_lut_generator(args)
+        if args.emit_shader is not None:
+            sha256 = lut_generator.save_shader(args.emit_shader)
+            update_checksums(sha256, get_run_parameters(args))
+        else:
+            cube_size = args.hald_level ** 2 if args.format == "hald" else 65
+            observers = []
+            if args.progress:
+                observers.append(progress.ProgressBar())
+            if args.metrics is not None:
+                observers.append(metrics.MetricsObserver())
+            observer = progress.ObserverGroup(observers) if observers else None
+            with file_io.lock_directories([args.output] if args.lock else []):
+                sha256 = lut_generator.save_lut(args.format, cube_size, args.shaper_size, args.matrix, observer,
+                                                args.gzip)
+                update_checksums(sha256, get_run_parameters(args, cube_size))
+            if args.metrics is not None:
+                memo_counters = _luminance_grid_memo.get_stats()["counters"]
+                cache_counters = {kind: counter for kind, counter in memo_counters.items()
+                                  if counter["hits"] or counter["misses"]}
+                metrics.save_metrics(metrics.format_metrics(observers[-1].luts, cache_counters,
+                                                            metrics.get_peak_rss()), args.metrics)
+
+
+def add_mode_arguments(group):
+    """
+    Adds the mutually exclusive arguments that select how a colormap is mapped to the input values.
+    :param group: Mutually exclusive argument group
+    """
     group.add_argument("--centered",
                        help="Use the given colormap for a smooth gradient of colors. This options shifts the input "
                             "values, in order to map middle grey to the center of the colormap. The input also "
@@ -471,6 +843,104 @@ def parse_args():
                             "colormap, e.g. "
                             "'-10.0, -9.99, -7.5, -5.0, -2.5, -1.0, -0.1, 0.1, 1.0, 2.5, 5.0, 6.49, 6.50'")
 
+
+def add_source_arguments(group):
+    """
+    Adds the mutually exclusive arguments that select the colormap of commands that evaluate transfer functions
+    directly.
+    :param group: Mutually exclusive argument group
+    """
+    group.add_argument("--colormap",
+                       choices=colors.colormaps.keys(),
+                       help="Name of the pre-defined colormap")
+    group.add_argument("--ev-colormap",
+                       choices=colors.ev_colormaps.keys(),
+                       help="Name of the pre-defined exposure value colormap")
+    group.add_argument("--viscm",
+                       type=str,
+                       help="Path to the viscm generated colormap stored as python script")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="False Color LUT Generator",
+                                     description="Generates spi3d lookup tables for Blender's color management")
+
+    parser.add_argument("-o",
+                        "--output",
+                        type=str,
+                        help="Output directory for the generated LUTs. Required for generating LUTs.",
+                        required=False)
+    parser.add_argument("-t",
+                        "--test",
+                        help="Print used colormap(s) to the console",
+                        dest="test",
+                        action="store_true",
+                        required=False)
+    parser.add_argument("-f",
+                        "--format",
+                        choices=file_io.LUT_FORMATS,
+                        default="spi3d",
+                        help="File format of the generated, resampled and simulated LUTs. Hald CLUTs are saved as "
+                             "16-bit PNG images.",
+                        required=False)
+    parser.add_argument("--hald-level",
+                        type=int,
+                        choices=[8, 12, 16],
+                        help="Level of generated Hald CLUTs, which have level ** 2 entries per channel. Defaults to 8.",
+                        required=False)
+    parser.add_argument("--shaper-size",
+                        type=int,
+                        help="Bake the 'allocation: lg2' transform into a 1D shaper LUT with the given number of "
+                             "entries, e.g. 65536, so the generated LUTs can be applied to scene linear values "
+                             "without an OCIO configuration. The shaper is embedded in cube files and saved as spi1d "
+                             "file next to spi3d files.",
+                        required=False)
+    parser.add_argument("--matrix",
+                        type=lambda s: [float(x) for x in s.split(',')],
+                        help="Comma separated 3x3 matrix in row-major order, that is applied to the scene linear "
+                             "values before the allocation, e.g. a view or look transform. It is baked into the "
+                             "generated LUTs.",
+                        required=False)
+    parser.add_argument("--emit-shader",
+                        choices=shader.SHADER_LANGUAGES,
+                        help="Save the transfer function as GLSL or OSL shader function instead of generating the "
+                             "LUT. The shader is checked against the LUT on the CPU before it is saved.",
+                        required=False)
+    parser.add_argument("--gzip",
+                        help="Compress the generated LUTs with gzip while they are written. The extension .gz is "
+                             "appended to the filenames.",
+                        action="store_true")
+    parser.add_argument("--lock",
+                        help="Lock the output directory while the LUTs are written, so concurrent generations into the "
+                             "same directory run one after another",
+                        action="store_true")
+    parser.add_argument("--progress",
+                        help="Show a progress bar with the estimated remaining time on stderr, while the LUTs are "
+                             "generated",
+                        action="store_true")
+    parser.add_argument("--metrics",
+                        help="Path of a file into which the metrics of the generation are written in the OpenMetrics "
+                             "text format after every run, e.g. for the textfile collector of the node exporter",
+                        required=False)
+    parser.add_argument("--watch",
+                        help="Generate the LUTs of the viscm or run command again, whenever the viscm scripts or the "
+                             "manifest are saved",
+                        action="store_true")
+    parser.add_argument("--debounce",
+                        type=float,
+                        default=0.3,
+                        help="Time in seconds without further changes, before the LUTs are generated again after a "
+                             "change is detected by --watch",
+                        required=False)
+
+    parent_parser = argparse.ArgumentParser(add_help=False)
+    add_mode_arguments(parent_parser.add_mutually_exclusive_group(required=True))
+
+    # Arguments for commands that evaluate the transfer function of any colormap directly
+    source_parser = argparse.ArgumentParser(add_help=False)
+    add_source_arguments(source_parser.add_mutually_exclusive_group(required=True))
+    add_mode_arguments(source_parser.add_mutually_exclusive_group(required=False))
+
     subparser = parser.add_subparsers(help="Select a specific colormap for the LUT creation.", dest="sub")
     parser_viscm = subparser.add_parser("viscm",
                                         parents=[parent_parser],
@@ -505,7 +975,402 @@ def parse_args():
                                     help="Name of the pre-defined exposure value colormap",
                                     required=True)
 
-    return parser.parse_args()
+    parser_index = subparser.add_parser("index",
+                                        help="Build a sidecar index for random access to the entries of a spi3d "
+                                             "file and print selected entries.")
+    parser_index.add_argument("-p",
+                              "--path",
+                              type=str,
+                              help="Path to the spi3d file",
+                              required=True)
+    parser_index.add_argument("--index-path",
+                              type=str,
+                              help="Path of the sidecar index. Defaults to the spi3d path with an additional '.idx' "
+                                   "extension.",
+                              required=False)
+    parser_index.add_argument("--voxel",
+                              type=lambda s: [int(x) for x in s.split(',')],
+                              help="Print the entry at the given red, green and blue indices, e.g. '32, 32, 32'. "
+                                   "Can be used multiple times.",
+                              action="append",
+                              default=[])
+    parser_index.add_argument("--ev",
+                              type=lambda s: [float(x) for x in s.split(',')],
+                              help="Print the grey entries closest to the given exposure values, e.g. "
+                                   "'-10.0, 0.0, 6.5'",
+                              default=[])
+
+    parser_resample = subparser.add_parser("resample",
+                                           help="Resample an existing spi3d file to a different cube size.")
+    parser_resample.add_argument("-p",
+                                 "--path",
+                                 type=str,
+                                 help="Path to the spi3d file",
+                                 required=True)
+    parser_resample.add_argument("-n",
+                                 "--name",
+                                 type=str,
+                                 help="Name of the resampled LUT. Will be used as output filename.",
+                                 required=True)
+    parser_resample.add_argument("-s",
+                                 "--cube-size",
+                                 type=int,
+                                 help="Cube size of the resampled LUT",
+                                 required=True)
+    parser_resample.add_argument("-m",
+                                 "--method",
+                                 choices=interpolation.INTERPOLATION_METHODS,
+                                 default="tetrahedral",
+                                 help="Interpolation method used for the resampling",
+                                 required=False)
+
+    parser_diff = subparser.add_parser("diff",
+                                       help="Compare two LUT files numerically. Exits with status 1, if the "
+                                            "difference exceeds the tolerance.")
+    parser_diff.add_argument("path",
+                             type=str,
+                             nargs=2,
+                             help="Paths to the reference LUT and the LUT that is compared with it")
+    parser_diff.add_argument("--tolerance",
+                             type=float,
+                             default=0.0,
+                             help="Largest absolute error of a channel that is still considered to be equal",
+                             required=False)
+    parser_diff.add_argument("--worst",
+                             type=int,
+                             default=10,
+                             help="Number of entries with the largest differences that are printed",
+                             required=False)
+    parser_diff.add_argument("-m",
+                             "--method",
+                             choices=interpolation.INTERPOLATION_METHODS,
+                             default="tetrahedral",
+                             help="Interpolation method used, if the cube sizes of the LUTs differ",
+                             required=False)
+
+    parser_apply = subparser.add_parser("apply",
+                                        help="Apply a LUT to a scene linear image in order to preview the false "
+                                             "colors.")
+    parser_apply.add_argument("-l",
+                              "--lut",
+                              type=str,
+                              help="Path to the LUT file",
+                              required=True)
+    parser_apply.add_argument("-i",
+                              "--image",
+                              type=str,
+                              help="Path to the scene linear image, either as PFM (.pfm), as PPM (.ppm) with 8 or 16 "
+                                   "bits per channel or as raw data with interleaved RGB channels in little-endian "
+                                   "byte order",
+                              required=True)
+    parser_apply.add_argument("-n",
+                              "--name",
+                              type=str,
+                              help="Name of the false color image. Will be used as output filename. Saved as PFM, if "
+                                   "it has the '.pfm' extension, otherwise as raw 32-bit float data.",
+                              required=True)
+    parser_apply.add_argument("--width",
+                              type=int,
+                              help="Width of raw images",
+                              required=False)
+    parser_apply.add_argument("--height",
+                              type=int,
+                              help="Height of raw images",
+                              required=False)
+    parser_apply.add_argument("--dtype",
+                              choices=file_io.RAW_DTYPES.keys(),
+                              default="float32",
+                              help="Data type of raw images. Integer images are mapped through pre-sampled tables.",
+                              required=False)
+    parser_apply.add_argument("-m",
+                              "--method",
+                              choices=interpolation.INTERPOLATION_METHODS,
+                              default="tetrahedral",
+                              help="Interpolation method used for sampling the LUT",
+                              required=False)
+    parser_apply.add_argument("-w",
+                              "--workers",
+                              type=int,
+                              help="Number of worker processes. Defaults to the number of processors.",
+                              required=False)
+    parser_apply.add_argument("--exact",
+                              help="Sample the LUT for every pixel of float images, instead of mapping them through a "
+                                   "table of the LUT sampled at 65536 luminances along its grey axis. About fifteen "
+                                   "times slower.",
+                              action="store_true")
+
+    parser_render = subparser.add_parser("render",
+                                         parents=[source_parser],
+                                         help="Render false color versions of scene linear images with the colormap, "
+                                              "without sampling a LUT.")
+    parser_render.add_argument("images",
+                               type=str,
+                               nargs="+",
+                               help="Paths to the scene linear images, either as PFM (.pfm), as PPM (.ppm) with 8 or "
+                                    "16 bits per channel or as raw data with interleaved RGB channels in little-endian "
+                                    "byte order. The false color images are saved in the output directory with the "
+                                    "same filenames. PPM images are saved as PFM, raw images as 32-bit float data.")
+    parser_render.add_argument("--width",
+                               type=int,
+                               help="Width of raw images",
+                               required=False)
+    parser_render.add_argument("--height",
+                               type=int,
+                               help="Height of raw images",
+                               required=False)
+    parser_render.add_argument("--dtype",
+                               choices=file_io.RAW_DTYPES.keys(),
+                               default="float32",
+                               help="Data type of raw images. Integer images are mapped through pre-sampled tables.",
+                               required=False)
+    parser_render.add_argument("-w",
+                               "--workers",
+                               type=int,
+                               help="Number of worker processes. Defaults to the number of processors.",
+                               required=False)
+    parser_render.add_argument("--prefetch",
+                               type=int,
+                               default=2,
+                               help="Number of frames that are queued in addition to the ones being rendered",
+                               required=False)
+    parser_render.add_argument("--exact",
+                               help="Evaluate the colormap for every pixel of float images, instead of mapping them "
+                                    "through a table of the colormap sampled at 65536 luminances. About four times "
+                                    "slower.",
+                               action="store_true")
+
+    parser_filter = subparser.add_parser("filter",
+                                         parents=[source_parser],
+                                         help="Apply false colors to raw video frames read from stdin and write them "
+                                              "to stdout, e.g. within a ffmpeg pipeline.")
+    parser_filter.add_argument("--width",
+                               type=int,
+                               help="Width of the frames",
+                               required=True)
+    parser_filter.add_argument("--height",
+                               type=int,
+                               help="Height of the frames",
+                               required=True)
+    parser_filter.add_argument("--pixel-format",
+                               choices=image_processing.STREAM_PIXEL_FORMATS.keys(),
+                               default="rgb48le",
+                               help="Pixel format of the input and output frames",
+                               required=False)
+    parser_filter.add_argument("-w",
+                               "--workers",
+                               type=int,
+                               help="Number of worker processes. Defaults to the number of processors.",
+                               required=False)
+    parser_filter.add_argument("--exact",
+                               help="Evaluate the colormap for every pixel of rgbf32le frames, instead of mapping them "
+                                    "through a table of the colormap sampled at 65536 luminances. About four times "
+                                    "slower.",
+                               action="store_true")
+
+    parser_cvd = subparser.add_parser("simulate-cvd",
+                                      help="Simulate color vision deficiencies for LUTs and print how well "
+                                           "neighboring exposure values of every pre-defined colormap can be "
+                                           "distinguished.")
+    parser_cvd.add_argument("-l",
+                            "--lut",
+                            type=str,
+                            help="Path to a LUT file. A simulated copy is saved in the output directory for every "
+                                 "color vision deficiency. Can be used multiple times.",
+                            action="append",
+                            default=[])
+    parser_cvd.add_argument("-d",
+                            "--deficiency",
+                            choices=cvd.CVD_MATRICES.keys(),
+                            help="Color vision deficiency that is simulated. Can be used multiple times. Defaults to "
+                                 "all of them.",
+                            action="append")
+    parser_cvd.add_argument("--ev",
+                            type=lambda s: [float(x) for x in s.split(',')],
+                            default=transfer.DEFAULT_EXPOSURE_VALUES,
+                            help="Ascending exposure values that define the bands of the report, e.g. "
+                                 "'-10.0, -7.5, -5.0, -2.5, -1.0, 0.0, 1.0, 2.5, 5.0, 6.5'")
+
+    parser_sweep = subparser.add_parser("sweep",
+                                        help="Generate LUTs for every combination of exposure ranges, modes and "
+                                             "stops of a colormap, together with a JSON index of the variants.")
+    add_source_arguments(parser_sweep.add_mutually_exclusive_group(required=True))
+    parser_sweep.add_argument("--input-exp-range",
+                              type=lambda s: tuple(float(x) for x in s.split(',')),
+                              help="Two exponents defining the input value range, e.g. '-12.473931189, 4.026068812'. "
+                                   "Can be used multiple times. Defaults to the range of the OCIO configuration.",
+                              action="append")
+    parser_sweep.add_argument("--unclipped-exp-range",
+                              type=lambda s: tuple(float(x) for x in s.split(',')),
+                              help="Two exponents defining the input value range that won't be clipped, e.g. "
+                                   "'-10.0, 4.0'. Can be used multiple times. Only applies to the not-centered and "
+                                   "centered modes. Defaults to the input range.",
+                              action="append")
+    parser_sweep.add_argument("--mode",
+                              choices=sweep.CONTINUOUS_MODES,
+                              help="Mode of the colormap, same as --not-centered and --centered. Can be used multiple "
+                                   "times. Defaults to not-centered, unless stops are given.",
+                              action="append")
+    for block_mode in sweep.BLOCK_MODES:
+        parser_sweep.add_argument(f"--{block_mode}",
+                                  type=lambda s: [float(x) for x in s.split(',')],
+                                  help=f"Exposure values of the blocks, same as for --{block_mode}. Can be used "
+                                       f"multiple times.",
+                                  action="append")
+    parser_sweep.add_argument("-n",
+                              "--name",
+                              type=str,
+                              help="Prefix of the filenames, defaults to the name of the colormap")
+    parser_sweep.add_argument("-s",
+                              "--cube-size",
+                              type=int,
+                              default=65,
+                              help="Number of entries per channel of the LUTs")
+
+    parser_patch = subparser.add_parser("patch",
+                                        help="Move stops of the colormap a spi3d file was generated from and rewrite "
+                                             "only the entries whose color changes.")
+    parser_patch.add_argument("path",
+                              type=str,
+                              help="Path to the spi3d file")
+    add_source_arguments(parser_patch.add_mutually_exclusive_group(required=True))
+    add_mode_arguments(parser_patch.add_mutually_exclusive_group(required=False))
+    parser_patch.add_argument("--move-stop",
+                              type=lambda s: tuple(float(x) for x in s.split(',')),
+                              help="Old and new exposure value of a stop, e.g. '-2.5, -3.0'. Can be used multiple "
+                                   "times.",
+                              action="append",
+                              required=True)
+
+    parser_run = subparser.add_parser("run",
+                                      help="Run the LUT jobs of a JSON manifest in a single process with shared "
+                                           "caches and a pool of workers.")
+    parser_run.add_argument("path",
+                            type=str,
+                            help="Path to the manifest")
+    parser_run.add_argument("-w",
+                            "--workers",
+                            type=int,
+                            help="Number of worker processes. Defaults to the value of the manifest or the number of "
+                                 "processors.",
+                            required=False)
+    parser_run.add_argument("--report",
+                            type=str,
+                            help="Path where the status, files and duration of every job are saved as JSON",
+                            required=False)
+
+    parser_verify = subparser.add_parser("verify",
+                                         help="Check the LUTs of a deployed directory against the SHA-256 and sizes "
+                                              "of the checksum manifest that was saved by the generation.")
+    parser_verify.add_argument("path",
+                               type=str,
+                               help="Path to the deployed directory")
+    parser_verify.add_argument("--manifest",
+                               type=str,
+                               help=f"Path to the checksum manifest. Defaults to {checksums.MANIFEST_FILENAME} within "
+                                    "the directory.",
+                               required=False)
+    parser_verify.add_argument("-w",
+                               "--workers",
+                               type=int,
+                               help="Number of threads that hash the files in parallel",
+                               required=False)
+
+    parser_bundle = subparser.add_parser("bundle",
+                                         help="Generate the LUTs of every pre-defined colormap in parallel and stream "
+                                              "them into a zip archive, together with an ocio.config that defines "
+                                              "their view transforms and the checksums of all files.")
+    parser_bundle.add_argument("path",
+                               type=str,
+                               help="Path where the zip archive is saved")
+    parser_bundle.add_argument("--ocio-config",
+                               type=str,
+                               help="Path to the ocio.config that is shipped with Blender, to which the view "
+                                    "transforms are added",
+                               required=True)
+    parser_bundle.add_argument("-w",
+                               "--workers",
+                               type=int,
+                               help="Number of worker processes. Defaults to the number of processors.",
+                               required=False)
+
+    parser_serve = subparser.add_parser("serve",
+                                        help="Run a local HTTP service that generates LUTs on request and keeps the "
+                                             "most recently requested ones in memory.")
+    parser_serve.add_argument("--host",
+                              type=str,
+                              default="127.0.0.1",
+                              help="Host name or address to listen on")
+    parser_serve.add_argument("--port",
+                              type=int,
+                              default=8765,
+                              help="Port to listen on")
+    parser_serve.add_argument("--socket",
+                              type=str,
+                              help="Path of a Unix socket to listen on instead of the host and port",
+                              required=False)
+    parser_serve.add_argument("--cache-size",
+                              type=int,
+                              default=256,
+                              help="Largest total size of the cached LUTs in MiB")
+    parser_serve.add_argument("--viscm-dir",
+                              type=str,
+                              help="Directory of the viscm scripts that can be requested with the viscm parameter. "
+                                   "Loading a viscm script runs it, so viscm scripts can't be requested without it.",
+                              required=False)
+
+    parser_swatches = subparser.add_parser("swatches",
+                                           help="Save PNG swatches of the colors at exposure values and a legend "
+                                                "strip of the colormap.")
+    swatches_group = parser_swatches.add_mutually_exclusive_group(required=True)
+    add_source_arguments(swatches_group)
+    swatches_group.add_argument("--all",
+                                help="Save the swatches of every pre-defined colormap",
+                                action="store_true")
+    add_mode_arguments(parser_swatches.add_mutually_exclusive_group(required=False))
+    parser_swatches.add_argument("--ev",
+                                 type=lambda s: [float(x) for x in s.split(',')],
+                                 help="Exposure values of the swatches, e.g. "
+                                      "'-10.0, -7.5, -5.0, -2.5, -1.0, 0.0, 1.0, 2.5, 5.0, 6.5'. By default a swatch "
+                                      "is saved for every band of constant color, if the colormap consists of them, "
+                                      "otherwise for the exposure values of the README.")
+    parser_swatches.add_argument("--size",
+                                 type=int,
+                                 default=20,
+                                 help="Width and height of the swatches in pixels")
+    parser_swatches.add_argument("--strip-width",
+                                 type=int,
+                                 default=512,
+                                 help="Width of the legend strip in pixels")
+
+    args = parser.parse_args()
+    if args.sub in (None, "viscm", "colormap", "ev-colormap", "resample", "apply", "render", "swatches", "sweep") and \
+            args.output is None:
+        parser.error("the following arguments are required: -o/--output")
+    if args.shaper_size is not None and (args.format == "hald" or args.shaper_size < 2):
+        parser.error("--shaper-size requires the spi3d or cube format and at least 2 entries")
+    if args.matrix is not None:
+        if len(args.matrix) != 9:
+            parser.error("--matrix requires 9 values")
+        args.matrix = [args.matrix[0:3], args.matrix[3:6], args.matrix[6:9]]
+    if args.sub == "patch":
+        if any(len(move) != 2 for move in args.move_stop):
+            parser.error("--move-stop requires the old and new exposure value")
+        if args.ev_colormap is None and all(getattr(args, f"blocks_{block_type}") is None
+                                            for block_type in ("equidistant", "centered", "stretched")):
+            parser.error("patch requires --ev-colormap or one of the block modes")
+    if args.sub == "bundle" and args.format == "hald":
+        parser.error("bundle requires the spi3d or cube format, OCIO doesn't support Hald CLUTs")
+    if args.gzip and args.format == "hald":
+        parser.error("Hald CLUTs are saved as PNG images, which are already compressed")
+    if args.hald_level is not None and args.format != "hald":
+        parser.error("--hald-level requires -f hald")
+    if args.hald_level is None:
+        args.hald_level = 8
+    if args.watch and args.sub not in ("viscm", "run"):
+        parser.error("--watch requires the viscm or run command")
+    if args.sub == "simulate-cvd" and args.lut and args.output is None:
+        parser.error("the argument -o/--output is required for saving simulated LUTs")
+    return args
 
 
 if __name__ == "__main__":
@@ -0,0 +1,394 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import colors
+import file_io
+import interpolation
+import mapping
+import transfer
+import bisect
+import collections
+import hashlib
+import heapq
+import math
+import operator
+import os
+import time
+from array import array
+
+
+def index_spi3d(file_path, index_path=None, voxels=(), exposure_values=(),
+                input_exp_range=(-12.473931189, 4.026068812)):
+    """
+    Ensures that the sidecar index of a spi3d file is up to date and prints the requested entries.
+    :param file_path: Path to the spi3d file
+    :param index_path: Path to the sidecar index, defaults to the file path with an additional `.idx` extension
+    :param voxels: Red, green and blue indices of the entries that shall be printed
+    :param exposure_values: Exposure values for which the closest grey entry shall be printed
+    :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+    """
+    if not file_io.is_spi3d_index_current(file_path, index_path):
+        index_path = file_io.build_spi3d_index(file_path, index_path)
+        print(f"Saved index {index_path}")
+
+    with file_io.Spi3dReader(file_path, index_path) as reader:
+        for red, green, blue in voxels:
+            color = reader.get_voxel(red, green, blue)
+            print(f"{red} {green} {blue} {color[0]:.8f} {color[1]:.8f} {color[2]:.8f}")
+        for ev in exposure_values:
+            idx = mapping.map_ev_to_cube_index(ev, reader.cube_size, input_exp_range[0], input_exp_range[1])
+            color = reader.get_voxel(idx, idx, idx)
+            print(f"EV {ev:+.2f}: {idx} {idx} {idx} {color[0]:.8f} {color[1]:.8f} {color[2]:.8f}")
+
+
+def resample_spi3d(file_path, output_path, cube_size, method="tetrahedral", lut_format="spi3d"):
+    """
+    Resamples a spi3d file to a different cube size. The resampled LUT is created and written one plane at a time,
+    so only two planes of the source LUT are kept in memory.
+    :param file_path: Path to the source spi3d file
+    :param output_path: Path, including filename, where the resampled LUT is saved
+    :param cube_size: Cube size of the resampled LUT
+    :param method: Either "trilinear" or "tetrahedral"
+    :param lut_format: One of file_io.LUT_FORMATS
+    :return: SHA-256 of the saved file as hex string
+    """
+    if cube_size < 2:
+        raise ValueError("The cube size has to be at least 2.")
+    if lut_format == "hald":
+        file_io.get_hald_level(cube_size)
+    if not file_io.is_spi3d_index_current(file_path):
+        file_io.build_spi3d_index(file_path)
+
+    with file_io.Spi3dReader(file_path) as reader:
+        axis = file_io.LUT_PLANE_AXES[lut_format]
+        planes = {}
+
+        def get_plane(idx):
+            if idx not in planes:
+                # Planes are requested in ascending order, older planes won't be used again
+                for old_idx in [i for i in planes if i < idx - 1]:
+                    del planes[old_idx]
+                planes[idx] = reader.get_plane(axis, idx)
+            return planes[idx]
+
+        def generate_planes():
+            for lower, upper, factor in interpolation.get_sample_positions(reader.cube_size, cube_size):
+                yield interpolation.resample_plane(get_plane(lower), get_plane(upper), factor,
+                                                   reader.cube_size, cube_size, method)
+
+        return file_io.save_lut_planes(generate_planes(), cube_size, output_path, lut_format)
+
+
+def _get_delta_es(table_a, table_b, indices):
+    """
+    Calculates the Delta E between the entries of two LUTs. The colors are converted one channel at a time, which is
+    much faster than converting every entry on its own.
+    :param table_a: Flat array of the entries of the reference LUT
+    :param table_b: Flat array of the entries of the compared LUT, with the same cube size
+    :param indices: Indices of the entries
+    :return: Dictionary with the Delta E of every entry
+    """
+    labs_a, labs_b = [colors.srgb_channels_to_lab(*[[channel[idx] for idx in indices]
+                                                    for channel in (table[0::3], table[1::3], table[2::3])])
+                      for table in (table_a, table_b)]
+    return dict(zip(indices, map(math.dist, zip(*labs_a), zip(*labs_b))))
+
+
+def _count_ev_bins(red_green_evs, blue_evs, min_ev, max_ev):
+    """
+    Counts the entries of a LUT per exposure value. The exposure value of an entry is the sum of the contributions of
+    its red and green indices and of its blue index and increases with the blue index, therefore the borders between
+    the exposure values are found by bisection instead of calculating the exposure value of every entry.
+    :param red_green_evs: Contribution of every pair of red and green indices to the exposure value, including the
+        offset, with the green index changing fastest
+    :param blue_evs: Contribution of every blue index, in ascending order
+    :param min_ev: Smallest exposure value, lower ones are counted as this one
+    :param max_ev: Largest exposure value, higher ones are counted as this one
+    :return: Dictionary with the number of entries of every exposure value from min_ev to max_ev
+    """
+    counts = dict.fromkeys(range(min_ev, max_ev + 1), 0)
+    size = len(blue_evs)
+    for ev_base in red_green_evs:
+        last_ev = math.floor(ev_base + blue_evs[-1])
+        start = 0
+        for ev in range(math.floor(ev_base + blue_evs[0]), last_ev):
+            # First blue index with an exposure value above ev. Rounding may move it by one in either direction.
+            end = bisect.bisect_left(blue_evs, ev + 1 - ev_base, start)
+            while end > start and ev_base + blue_evs[end - 1] >= ev + 1:
+                end -= 1
+            while end < size and ev_base + blue_evs[end] < ev + 1:
+                end += 1
+            counts[min(max(ev, min_ev), max_ev)] += end - start
+            start = end
+        counts[min(max(last_ev, min_ev), max_ev)] += size - start
+    return counts
+
+
+def diff_luts(file_path_a, file_path_b, tolerance=0.0, worst_count=10, method="tetrahedral",
+              input_exp_range=(-12.473931189, 4.026068812)):
+    """
+    Compares two LUT files and prints the maximum and mean error, the entries with the largest differences and a
+    histogram showing at which exposure values the differences occur. The entries of the first LUT are the reference,
+    the second LUT is interpolated if the cube sizes differ.
+    :param file_path_a: Path to the reference LUT file
+    :param file_path_b: Path to the LUT file that is compared with the reference
+    :param tolerance: Largest absolute error of a channel that is still considered to be equal
+    :param worst_count: Number of entries with the largest differences that are printed
+    :param method: Interpolation method used if the cube sizes differ, either "trilinear" or "tetrahedral"
+    :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+    :return: True, if no absolute error exceeds the tolerance
+    """
+    cube_size, table_a = file_io.load_lut(file_path_a)
+    cube_size_b, table_b = file_io.load_lut(file_path_b)
+    if cube_size_b != cube_size:
+        scale = cube_size - 1
+        table_b = [value for red in range(cube_size) for green in range(cube_size) for blue in range(cube_size)
+                   for value in interpolation.sample_table(table_b, cube_size_b, red / scale, green / scale,
+                                                           blue / scale, method)]
+
+    # Per channel absolute errors, combined to the largest error per entry
+    errors = [list(map(abs, map(operator.sub, table_a[channel::3], table_b[channel::3]))) for channel in range(3)]
+    entry_errors = list(map(max, *errors))
+    differing = [idx for idx, error in enumerate(entry_errors) if error > tolerance]
+
+    delta_es = _get_delta_es(table_a, table_b, differing)
+
+    # Exposure value of every entry, based on the luminance that determines its color. The luminance is a weighted
+    # sum of the channels, therefore the contributions of each channel are only calculated once.
+    scale = cube_size - 1
+    ev_offset = round(input_exp_range[0] - math.log2(0.18), 6)
+    ev_scale = input_exp_range[1] - input_exp_range[0]
+    min_ev = math.floor(ev_offset)
+    max_ev = math.floor(ev_offset + ev_scale * colors.lut_entry_luminance(1.0, 1.0, 1.0))
+    red_evs = [ev_offset + ev_scale * colors.lut_entry_luminance(i / scale, 0.0, 0.0) for i in range(cube_size)]
+    green_evs = [ev_scale * colors.lut_entry_luminance(0.0, i / scale, 0.0) for i in range(cube_size)]
+    blue_evs = [ev_scale * colors.lut_entry_luminance(0.0, 0.0, i / scale) for i in range(cube_size)]
+
+    red_green_evs = [red_ev + green_ev for red_ev in red_evs for green_ev in green_evs]
+    differing_evs = [min(max(math.floor(red_green_evs[idx // cube_size] + blue_evs[idx % cube_size]), min_ev), max_ev)
+                     for idx in differing]
+    ev_delta_es = collections.defaultdict(list)
+    for ev, value in zip(differing_evs, delta_es.values()):
+        ev_delta_es[ev].append(value)
+    # Entries, differing entries, sum and max of Delta E
+    bins = {ev: (count, len(ev_delta_es[ev]), sum(ev_delta_es[ev]), max(ev_delta_es[ev], default=0.0))
+            for ev, count in _count_ev_bins(red_green_evs, blue_evs, min_ev, max_ev).items()}
+
+    entry_count = cube_size ** 3
+    print(f"Compared {file_path_a} ({cube_size}^3) with {file_path_b} ({cube_size_b}^3)")
+    print(f"Differing entries: {len(differing)} of {entry_count}")
+    print(f"Max Delta E: {max(delta_es.values(), default=0.0):.6f}, "
+          f"mean Delta E: {sum(delta_es.values()) / entry_count:.6f}")
+    print(f"Max absolute error: {max(entry_errors):.8f}, "
+          f"mean absolute error: {sum(map(sum, errors)) / len(table_a):.8f}")
+
+    if differing:
+        print("Largest differences (red green blue: Delta E, reference color -> compared color):")
+        for idx in heapq.nlargest(worst_count, differing, key=lambda i: (delta_es[i], entry_errors[i])):
+            red, green, blue = idx // cube_size ** 2, idx // cube_size % cube_size, idx % cube_size
+            color_a = " ".join(f"{x:.8f}" for x in table_a[idx * 3:idx * 3 + 3])
+            color_b = " ".join(f"{x:.8f}" for x in table_b[idx * 3:idx * 3 + 3])
+            print(f"  {red} {green} {blue}: {delta_es[idx]:.6f}, {color_a} -> {color_b}")
+
+        print("Differences per exposure value (EV range: differing entries / entries, mean and max Delta E):")
+        for ev, (count, diff_count, delta_e_sum, delta_e_max) in bins.items():
+            if count:
+                print(f"  [{ev:+d}, {ev + 1:+d}): {diff_count} / {count}, "
+                      f"{delta_e_sum / max(1, diff_count):.6f}, {delta_e_max:.6f}")
+
+    return max(entry_errors) <= tolerance
+
+
+def move_stop_values(stops, moves):
+    """
+    Moves exposure values within an ascending list of stops. A stop can't be moved past its neighbors.
+    :param stops: Ascending list of exposure values
+    :param moves: List of tuples with the old and new exposure value of a stop
+    :return: New list of exposure values
+    """
+    targets = dict(moves)
+    for old_stop in targets:
+        if old_stop not in stops:
+            raise ValueError(f"There is no stop at {old_stop}.")
+    moved = [targets.get(stop, stop) for stop in stops]
+    if any(lower >= upper for lower, upper in zip(moved, moved[1:])):
+        raise ValueError("The stops can't be moved past their neighbors.")
+    return moved
+
+
+def move_stops(ev_colormap, moves):
+    """
+    Moves stops of a colormap consisting of exposure values and associated colors, together with all color points at
+    the stop. A stop can't be moved past its neighboring stops.
+    :param ev_colormap: Colormap consisting of exposure values and associated colors
+    :param moves: List of tuples with the old and new exposure value of a stop
+    :return: New colormap, the color points of the given colormap aren't modified
+    """
+    stops = sorted({color_point.coordinate for color_point in ev_colormap})
+    targets = dict(zip(stops, move_stop_values(stops, moves)))
+    return [colors.ColorPoint(targets[color_point.coordinate],
+                              color_point.get_color(0.0),
+                              color_point.replace_with_luminance)
+            for color_point in ev_colormap]
+
+
+def get_changed_interval(old_transfer_function: transfer.EvTransfer, new_transfer_function: transfer.EvTransfer):
+    """
+    Determines the range of luminance in which two transfer functions of exposure value based colormaps can differ.
+    Outside of the color points that differ and their neighbors, both interpolate between the same colors. Segments
+    of constant color towards the neighbors, like the blocks, only differ up to the coordinates of the changed points.
+    :param old_transfer_function: Transfer function before the edit
+    :param new_transfer_function: Transfer function after the edit
+    :return: Tuple of the smallest and largest luminance that can be affected, or None if the colormaps are identical
+    """
+    def describe(tf, idx):
+        color_point = tf.ev_colormap[idx]
+        return tf.coordinates[idx], list(color_point.get_color(0.0)), color_point.replace_with_luminance
+
+    count = len(old_transfer_function.coordinates)
+    if count != len(new_transfer_function.coordinates):
+        return -math.inf, math.inf
+    changed = [idx for idx in range(count)
+               if describe(old_transfer_function, idx) != describe(new_transfer_function, idx)]
+    if not changed:
+        return None
+
+    def is_constant(tf, left, right):
+        return describe(tf, left)[1:] == describe(tf, right)[1:] and not tf.ev_colormap[left].replace_with_luminance
+
+    tfs = (old_transfer_function, new_transfer_function)
+    first, last = changed[0], changed[-1]
+    if first == 0:
+        low = -math.inf
+    elif all(is_constant(tf, first - 1, first) for tf in tfs):
+        low = min(tf.coordinates[first] for tf in tfs)
+    else:
+        low = min(tf.coordinates[first - 1] for tf in tfs)
+    if last == count - 1:
+        high = math.inf
+    elif all(is_constant(tf, last, last + 1) for tf in tfs):
+        high = max(tf.coordinates[last] for tf in tfs)
+    else:
+        high = max(tf.coordinates[last + 1] for tf in tfs)
+    return low, high
+
+
+class Spi3dPatcher:
+    """
+    Keeps the entries of a spi3d file in memory, together with its voxel index and its content, and rewrites only the
+    records of the entries whose color changes. Since the records are rewritten in place, the new records need the
+    same width as the old ones, which is the case for colors within [0.0, 10.0).
+    """
+
+    def __init__(self, file_path, index_path=None):
+        """
+        :param file_path: Path to the spi3d file, the voxel index is built if it is missing or outdated
+        :param index_path: Path to the voxel index, defaults to the file path with an additional `.lum` extension
+        """
+        self.file_path = file_path
+        self.index_path = index_path or file_io.get_voxel_index_path(file_path)
+        self.cube_size, self.table = file_io.load_lut(file_path)
+        # The rewritten records are applied to the content as well, so the SHA-256 doesn't require reading the file
+        with open(file_path, 'rb') as infile:
+            self.content = bytearray(infile.read())
+        if not file_io.is_voxel_index_current(file_path, self.index_path):
+            file_io.build_voxel_index(file_path, transfer.get_luminance_grid(self.cube_size), self.index_path)
+        self.index = file_io.VoxelIndex(file_path, self.index_path)
+
+    def patch(self, transfer_function, low=-math.inf, high=math.inf):
+        """
+        Evaluates a transfer function for the entries within a range of luminance and rewrites the records of the
+        entries whose color has changed. The sidecar index of the file is kept up to date, if it was current before.
+        :param transfer_function: Function that returns the color for the relative luminance of the normalized input
+        :param low: Smallest luminance of the entries that are evaluated
+        :param high: Largest luminance of the entries that are evaluated
+        :return: Tuple of the number of evaluated and rewritten entries
+        """
+        size = self.cube_size
+        table = self.table
+        index = self.index
+        start, end = index.get_range(low, high)
+
+        records = []
+        for pos in range(start, end):
+            entry = index.entries[pos]
+            color = transfer_function(index.luminances[pos])
+            new = f"{color[0]:.8f} {color[1]:.8f} {color[2]:.8f}"
+            old = f"{table[entry * 3]:.8f} {table[entry * 3 + 1]:.8f} {table[entry * 3 + 2]:.8f}"
+            if new != old:
+                record = f"{entry // size ** 2} {entry // size % size} {entry % size} {new}\n".encode("ascii")
+                if len(record) != index.lengths[pos]:
+                    raise ValueError(f"The record of entry {entry} can't be rewritten in place, since its width "
+                                     f"changes. Generate the file again instead.")
+                table[entry * 3:entry * 3 + 3] = array('d', color)
+                records.append((index.offsets[pos], record))
+
+        if records:
+            sidecar_path = file_io.get_spi3d_index_path(self.file_path)
+            sidecar_current = file_io.is_spi3d_index_current(self.file_path, sidecar_path)
+            records.sort()
+            with open(self.file_path, 'r+b') as outfile:
+                for offset, record in records:
+                    outfile.seek(offset)
+                    outfile.write(record)
+                    self.content[offset:offset + len(record)] = record
+            file_io.refresh_index_stat(self.file_path, self.index_path)
+            if sidecar_current:
+                file_io.refresh_index_stat(self.file_path, sidecar_path)
+        return end - start, len(records)
+
+    def get_sha256(self):
+        """
+        :return: SHA-256 of the patched file as hex string
+        """
+        return hashlib.sha256(self.content).hexdigest()
+
+    def apply_edit(self, old_transfer_function: transfer.EvTransfer, new_transfer_function: transfer.EvTransfer):
+        """
+        Patches the entries that are affected by an edit of the color points or stops of an exposure value based
+        colormap. The file has to be generated from the old transfer function.
+        :param old_transfer_function: Transfer function before the edit
+        :param new_transfer_function: Transfer function after the edit
+        :return: Tuple of the number of evaluated and rewritten entries
+        """
+        interval = get_changed_interval(old_transfer_function, new_transfer_function)
+        if interval is None:
+            return 0, 0
+        return self.patch(new_transfer_function, *interval)
+
+
+def patch_spi3d(file_path, old_transfer_function, new_transfer_function):
+    """
+    Patches a spi3d file after an edit of the exposure value based colormap it was generated from and prints how many
+    entries have been rewritten.
+    :param file_path: Path to the spi3d file
+    :param old_transfer_function: Transfer function the file was generated from
+    :param new_transfer_function: Transfer function after the edit
+    :return: SHA-256 of the patched file as hex string
+    """
+    start = time.perf_counter()
+    patcher = Spi3dPatcher(file_path)
+    loaded = time.perf_counter()
+    evaluated, rewritten = patcher.apply_edit(old_transfer_function, new_transfer_function)
+    print(f"Rewrote {rewritten} of {patcher.cube_size ** 3} entries in {os.path.basename(file_path)}, "
+          f"{evaluated} evaluated in {time.perf_counter() - loaded:.2f}s after loading in {loaded - start:.2f}s")
+    return patcher.get_sha256()
@@ -0,0 +1,329 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import colors
+import file_io
+import memo
+import sweep
+import transfer
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Keys of a job that select the colormap, same as the --colormap, --ev-colormap and --viscm arguments
+SOURCE_KEYS = ("colormap", "ev_colormap", "viscm")
+
+JOB_KEYS = SOURCE_KEYS + ("name", "mode", "stops", "input_exp_range", "unclipped_exp_range", "matrix", "cube_size",
+                          "formats", "output")
+
+# Keys of the manifest that are used as defaults for every job
+DEFAULT_KEYS = ("input_exp_range", "cube_size", "formats", "output")
+
+# Memoization of the current process. The worker processes of run_manifest() receive the luminance grids from the
+# parent process, the colormaps of viscm scripts and the transfer functions are memoized by each worker for the jobs
+# it processes. Both are bounded, so watching a manifest doesn't accumulate the results of every saved version.
+_memo = memo.Memo(max_entries=64, max_bytes=64 * 2 ** 20)
+_viscm_colormaps = memo.LruCache(16)
+
+
+def _init_worker(luminance_grids):
+    for config, luminance_grid in luminance_grids:
+        _memo.add_luminance_grid(config, luminance_grid)
+
+
+def _resolve_path(base_dir, path):
+    return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+
+def make_job(entry, defaults=None, base_dir=""):
+    """
+    Validates a job and fills in the defaults.
+    :param entry: Dictionary with the keys of the job, see load_manifest()
+    :param defaults: Dictionary with the values of DEFAULT_KEYS that are used, if the job doesn't set them
+    :param base_dir: Directory against which relative paths are resolved
+    :return: Dictionary with the name, source, variant, matrix, cube size, formats and output directory of the job.
+        The output directory is None, if neither the job nor the defaults set it.
+    """
+    unknown = set(entry) - set(JOB_KEYS)
+    if unknown:
+        raise ValueError(f"unknown keys {sorted(unknown)}")
+    sources = [key for key in SOURCE_KEYS if key in entry]
+    if len(sources) != 1:
+        raise ValueError("exactly one of 'colormap', 'ev_colormap' or 'viscm' is required")
+    source_type = sources[0]
+    source_name = entry[source_type]
+    if source_type == "colormap" and source_name not in colors.colormaps:
+        raise ValueError(f"unknown colormap '{source_name}'")
+    if source_type == "ev_colormap" and source_name not in colors.ev_colormaps:
+        raise ValueError(f"unknown exposure value colormap '{source_name}'")
+    if source_type == "viscm":
+        source_name = _resolve_path(base_dir, source_name)
+
+    job = {**(defaults or {}), **entry}
+    input_exp_range = [float(x) for x in job.get("input_exp_range", (-12.473931189, 4.026068812))]
+    if source_type == "ev_colormap":
+        mode = job.get("mode", "ev-colormap")
+        if mode != "ev-colormap":
+            raise ValueError("exposure value colormaps don't support modes")
+        variant = {"mode": mode, "input_exp_range": input_exp_range}
+    else:
+        mode = job.get("mode", "not-centered")
+        if mode in sweep.CONTINUOUS_MODES:
+            unclipped_exp_range = [float(x) for x in job.get("unclipped_exp_range", input_exp_range)]
+            variant = {"mode": mode, "input_exp_range": input_exp_range, "unclipped_exp_range": unclipped_exp_range}
+        elif mode in sweep.BLOCK_MODES:
+            if not job.get("stops"):
+                raise ValueError(f"the mode '{mode}' requires 'stops'")
+            variant = {"mode": mode, "stops": [float(x) for x in job["stops"]], "input_exp_range": input_exp_range}
+        else:
+            raise ValueError(f"unknown mode '{mode}'")
+
+    formats = job.get("formats", ["spi3d"])
+    for lut_format in formats:
+        if lut_format not in file_io.LUT_FORMATS:
+            raise ValueError(f"unknown format '{lut_format}'")
+    cube_size = int(job.get("cube_size", 65))
+    if cube_size < 2:
+        raise ValueError("'cube_size' has to be at least 2")
+    if "hald" in formats:
+        file_io.get_hald_level(cube_size)
+
+    matrix = job.get("matrix")
+    if matrix is not None:
+        if len(matrix) != 9:
+            raise ValueError("'matrix' requires 9 values")
+        matrix = tuple(tuple(float(x) for x in matrix[idx:idx + 3]) for idx in range(0, 9, 3))
+
+    return {"name": os.path.splitext(job.get("name", os.path.basename(entry[source_type])))[0],
+            "source": (source_type, source_name),
+            "variant": variant,
+            "matrix": matrix,
+            "cube_size": cube_size,
+            "formats": list(formats),
+            "output": _resolve_path(base_dir, job["output"]) if job.get("output") is not None else None}
+
+
+def load_manifest(file_path, output=None):
+    """
+    Loads and validates a manifest, a JSON file with a list of LUT jobs and optional defaults for them:
+    {"output": "luts", "cube_size": 65, "formats": ["spi3d"], "input_exp_range": [-12.473931189, 4.026068812],
+    "workers": 2, "jobs": [{"colormap": "ignis.spi3d", "mode": "centered"}, ...]}
+    Every job selects its colormap with "colormap", "ev_colormap" or "viscm", the other keys are "name", "mode" (one
+    of sweep.CONTINUOUS_MODES or sweep.BLOCK_MODES), "stops", "input_exp_range", "unclipped_exp_range", "matrix",
+    "cube_size", "formats" and "output". Relative paths are resolved against the directory of the manifest.
+    :param file_path: Path to the manifest
+    :param output: Output directory that overrides the one of the manifest
+    :return: Tuple of the list of jobs and the number of workers of the manifest, which is None if it isn't set
+    """
+    with open(file_path, "r") as file:
+        manifest = json.load(file)
+
+    base_dir = os.path.dirname(os.path.abspath(file_path))
+    defaults = {key: manifest[key] for key in DEFAULT_KEYS if key in manifest}
+    if output is not None:
+        defaults["output"] = os.path.abspath(output)
+
+    jobs = []
+    for idx, entry in enumerate(manifest.get("jobs", [])):
+        try:
+            job = make_job(entry, defaults, base_dir)
+            if job["output"] is None:
+                raise ValueError("no output directory, set 'output' in the manifest or use -o/--output")
+            jobs.append(job)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid job {idx} in the manifest {file_path}: {e}") from e
+    return jobs, manifest.get("workers")
+
+
+def get_grid_key(job):
+    """
+    :param job: Job, as returned by make_job()
+    :return: Key of the luminance grid of the job
+    """
+    matrix = job["matrix"]
+    return job["cube_size"], matrix, tuple(job["variant"]["input_exp_range"]) if matrix is not None else None
+
+
+def get_grid_config(job):
+    """
+    :param job: Job, as returned by make_job()
+    :return: memo.GridConfig of the luminance grid of the job
+    """
+    return memo.GridConfig(job["cube_size"], job["matrix"], tuple(job["variant"]["input_exp_range"]))
+
+
+def get_table_key(job):
+    """
+    :param job: Job, as returned by make_job()
+    :return: Key that is identical for all jobs with the same table
+    """
+    return job["source"], json.dumps(job["variant"], sort_keys=True), get_grid_key(job)
+
+
+def get_colormap(source):
+    """
+    Loads the colormap of a job. The colormaps of viscm scripts are only loaded once per process.
+    :param source: Tuple of one of SOURCE_KEYS and the name of the colormap or the path of the viscm script
+    :return: Colormap
+    """
+    source_type, name = source
+    if source_type == "colormap":
+        return colors.colormaps[name]
+    elif source_type == "ev_colormap":
+        return colors.ev_colormaps[name]
+    colormap = _viscm_colormaps.get(name)
+    if colormap is None:
+        colormap = file_io.load_viscm_colormap(name)
+        _viscm_colormaps.put(name, colormap)
+    return colormap
+
+
+def get_luminance_grid(job):
+    """
+    Calculates the luminance grid of a job, see transfer.get_luminance_grid(). Identical grids are only calculated
+    once per process.
+    :param job: Job, as returned by make_job()
+    :return: Flat array with the relative luminance of every entry
+    """
+    return _memo.get_luminance_grid(get_grid_config(job))
+
+
+def get_transfer_function(source, variant):
+    """
+    Creates the transfer function of a job. Identical transfer functions are only created once per process.
+    :param source: Tuple of one of SOURCE_KEYS and the name of the colormap or the path of the viscm script
+    :param variant: Dictionary with the mode and its parameters, as returned by sweep.make_variants()
+    :return: Transfer function
+    """
+    return _memo.get_transfer_function(memo.make_transfer_config(get_colormap(source), variant))
+
+
+def invalidate_source(source):
+    """
+    Removes the cached colormap of a source, e.g. after a viscm script has been saved again. The transfer functions
+    are memoized by the content of the colormap, those of the previous version are evicted once they are no longer
+    used.
+    :param source: Tuple of one of SOURCE_KEYS and the name of the colormap or the path of the viscm script
+    """
+    if source[0] == "viscm":
+        _viscm_colormaps.pop(source[1])
+
+
+def get_viscm_paths(jobs):
+    """
+    :param jobs: List of jobs, as returned by load_manifest()
+    :return: Sorted list of the paths of the viscm scripts used by the jobs
+    """
+    return sorted({job["source"][1] for job in jobs if job["source"][0] == "viscm"})
+
+
+def _run_jobs(jobs):
+    """
+    Runs jobs with identical tables, the table is only generated once and saved for every job.
+    :return: List of the report entries of the jobs
+    """
+    table = None
+    reports = []
+    for job in jobs:
+        start = time.perf_counter()
+        report = {"name": job["name"], "files": [], "sha256": {}, "cached": table is not None}
+        try:
+            if table is None:
+                transfer_function = get_transfer_function(job["source"], job["variant"])
+                luminance_grid = get_luminance_grid(job)
+                table = transfer.evaluate_grid(transfer_function, luminance_grid)
+            os.makedirs(job["output"], exist_ok=True)
+            for lut_format in job["formats"]:
+                file_path = os.path.join(job["output"], job["name"] + file_io.LUT_EXTENSIONS[lut_format])
+                report["sha256"][file_path] = file_io.save_lut(table, job["cube_size"], file_path, lut_format)
+                report["files"].append(file_path)
+            report["status"] = "done"
+        except Exception as e:
+            report["status"] = "failed"
+            report["error"] = f"{type(e).__name__}: {e}"
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        reports.append(report)
+    return reports
+
+
+def run_manifest(jobs, workers=None):
+    """
+    Runs the jobs of a manifest in a pool of worker processes. Jobs with identical tables, that only differ in their
+    name, formats or output directory, are grouped and their table is generated once. The luminance grids are
+    calculated once in the current process and passed to the workers. A failed job doesn't stop the other jobs.
+    :param jobs: List of jobs, as returned by load_manifest()
+    :param workers: Number of worker processes, defaults to the number of processors. If 1, the jobs are run in the
+        current process.
+    :return: List with the status, files, duration and error of every job, in the order of the jobs
+    """
+    groups = {}
+    for idx, job in enumerate(jobs):
+        groups.setdefault(get_table_key(job), []).append(idx)
+    batches = [[jobs[idx] for idx in indices] for indices in groups.values()]
+
+    luminance_grids = {}
+    for job in jobs:
+        key = get_grid_key(job)
+        if key not in luminance_grids:
+            luminance_grids[key] = get_grid_config(job), get_luminance_grid(job)
+    luminance_grids = list(luminance_grids.values())
+
+    if workers == 1:
+        _init_worker(luminance_grids)
+        results = map(_run_jobs, batches)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(luminance_grids,)) as executor:
+            results = list(executor.map(_run_jobs, batches))
+
+    reports = [None] * len(jobs)
+    for indices, batch_reports in zip(groups.values(), results):
+        for idx, report in zip(indices, batch_reports):
+            reports[idx] = report
+    return reports
+
+
+def get_job_parameters(job):
+    """
+    :param job: Job as returned by make_job()
+    :return: Dictionary with the keys of the job that determine its table, in the format of the manifest
+    """
+    source_key, source = job["source"]
+    parameters = {source_key: source, **job["variant"], "cube_size": job["cube_size"]}
+    if job["matrix"] is not None:
+        parameters["matrix"] = [list(row) for row in job["matrix"]]
+    return parameters
+
+
+def print_report(reports):
+    """
+    Prints the status and duration of every job, followed by a summary.
+    :param reports: List of the report entries, as returned by run_manifest()
+    """
+    width = max([len(report["name"]) for report in reports], default=0)
+    for report in reports:
+        details = ", ".join(report["files"]) if report["status"] == "done" else report["error"]
+        cached = " (cached table)" if report["cached"] else ""
+        print(f"{report['status']:<6} {report['name']:<{width}} {report['seconds']:>8.2f}s  {details}{cached}")
+    failed = sum(report["status"] == "failed" for report in reports)
+    total = sum(report["seconds"] for report in reports)
+    print(f"{len(reports) - failed} of {len(reports)} jobs done, {failed} failed, {total:.2f}s in total")
@@ -61,3 +61,16 @@ def map_to_colormap_range(x, exponent_min, exponent_max):
         return map_to_range(x, center - distance_a, center + distance_a, 0.0, 1.0)
     else:
         return map_to_range(x, center - distance_b, center + distance_b, 0.0, 1.0)
+
+
+def map_ev_to_cube_index(ev, cube_size, exponent_min, exponent_max):
+    """
+    Maps an exposure value to the index of the closest grey entry on the diagonal of a LUT cube.
+    :param ev: Exposure value relative to middle grey
+    :param cube_size: Number of entries per channel of the LUT
+    :param exponent_min: Smallest exponent for input values
+    :param exponent_max: Largest exponent for input values
+    :return: Index in [0, cube_size-1], which is used for red, green and blue
+    """
+    x = colors.normalize_value(2 ** ev * 0.18, exponent_min, exponent_max)
+    return int(round(map_to_range(x, 0.0, 1.0, 0.0, cube_size - 1)))
@@ -0,0 +1,279 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import colors
+import transfer
+import threading
+from array import array
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+# Conversions of colormaps with 256 entries to exposure value based colormaps of constant color blocks
+BLOCK_CONVERSIONS = {"blocks-equidistant": lambda colormap, stops, input_exp_range:
+                     colors.colormap_to_ev_blocks_equidistant(colormap, stops),
+                     "blocks-centered": colors.colormap_to_ev_blocks_centered,
+                     "blocks-stretched": colors.colormap_to_ev_blocks_stretched}
+
+
+class LruCache:
+    """
+    Cache that evicts the least recently used entries, once the total size of its entries exceeds the maximum size or
+    the number of entries exceeds the maximum number. The cache isn't thread-safe by itself.
+    """
+    def __init__(self, max_size, get_size=lambda value: 1, max_entries=None):
+        """
+        :param max_size: Largest total size of the entries
+        :param get_size: Function that returns the size of a value, by default every entry has the size 1
+        :param max_entries: Largest number of entries, by default only the size is limited
+        """
+        self.max_size = max_size
+        self.get_size = get_size
+        self.max_entries = max_entries
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """
+        :param key: Key of the entry
+        :param default: Value that is returned, if the key isn't cached
+        :return: Cached value, which becomes the most recently used entry
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        """
+        Adds an entry and evicts the least recently used entries, until the cache fits into the maximum size and
+        number of entries. A value that is larger than the maximum size isn't cached.
+        :param key: Key of the entry
+        :param value: Value of the entry
+        """
+        size = self.get_size(value)
+        if key in self.entries:
+            self.size -= self.get_size(self.entries.pop(key))
+        if size > self.max_size:
+            return
+        self.entries[key] = value
+        self.size += size
+        while self.size > self.max_size or (self.max_entries is not None and len(self.entries) > self.max_entries):
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= self.get_size(evicted)
+
+    def pop(self, key):
+        """
+        Removes an entry, if it is cached.
+        :param key: Key of the entry
+        """
+        if key in self.entries:
+            self.size -= self.get_size(self.entries.pop(key))
+
+    def get_stats(self):
+        """
+        :return: Dictionary with the number of hits, misses and entries and the total size
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "size": self.size}
+
+
+class FrozenColorPoint(NamedTuple):
+    """
+    Hashable representation of a colors.ColorPoint
+    """
+    coordinate: float
+    color: Tuple[float, float, float]
+    replace_with_luminance: bool = False
+
+
+class TransferConfig(NamedTuple):
+    """
+    Hashable description of a transfer function. The colormap is either a tuple of 256 colors or a tuple of
+    FrozenColorPoint for the "ev-colormap" mode, see freeze_colormap().
+    """
+    colormap: tuple
+    mode: str = "not-centered"
+    stops: Tuple[float, ...] = ()
+    input_exp_range: Tuple[float, float] = (-12.473931189, 4.026068812)
+    unclipped_exp_range: Optional[Tuple[float, float]] = None
+
+
+class GridConfig(NamedTuple):
+    """
+    Hashable description of a luminance grid, see transfer.get_luminance_grid()
+    """
+    cube_size: int = 65
+    matrix: Optional[Tuple[Tuple[float, float, float], ...]] = None
+    input_exp_range: Tuple[float, float] = (-12.473931189, 4.026068812)
+
+
+def freeze_colormap(colormap):
+    """
+    Converts a colormap with 256 entries or a colormap consisting of exposure values and associated colors into
+    nested tuples, which can be used as part of a key.
+    :param colormap: Colormap
+    :return: Tuple of colors or tuple of FrozenColorPoint
+    """
+    if colormap and isinstance(colormap[0], colors.ColorPoint):
+        return tuple(FrozenColorPoint(color_point.coordinate, tuple(color_point.get_color(0.0)),
+                                      color_point.replace_with_luminance)
+                     for color_point in colormap)
+    return tuple(tuple(color) for color in colormap)
+
+
+def thaw_ev_colormap(frozen_colormap):
+    """
+    :param frozen_colormap: Tuple of FrozenColorPoint
+    :return: List of colors.ColorPoint
+    """
+    return [colors.ColorPoint(color_point.coordinate, list(color_point.color), color_point.replace_with_luminance)
+            for color_point in frozen_colormap]
+
+
+def make_transfer_config(colormap, variant):
+    """
+    Creates the config of a transfer function from the parameters of a sweep or manifest variant.
+    :param colormap: Colormap with 256 entries, or colormap consisting of exposure values and associated colors
+    :param variant: Dictionary with the mode and its parameters, as returned by sweep.make_variants()
+    :return: TransferConfig
+    """
+    unclipped_exp_range = variant.get("unclipped_exp_range")
+    return TransferConfig(freeze_colormap(colormap),
+                          variant["mode"],
+                          tuple(variant.get("stops", ())),
+                          tuple(variant["input_exp_range"]),
+                          tuple(unclipped_exp_range) if unclipped_exp_range is not None else None)
+
+
+def _normalize_grid_config(config: GridConfig):
+    # The input range only affects grids with a matrix
+    return config._replace(input_exp_range=None) if config.matrix is None else config
+
+
+def _get_array_size(value):
+    return len(value) * value.itemsize
+
+
+class Memo:
+    """
+    Thread-safe memoization of the intermediate results of LUT generations: the exposure value colormaps of the
+    block modes, transfer functions, luminance grids and tables. Transfer functions and exposure value colormaps are
+    limited by their number, luminance grids and tables by the memory of their arrays. The results are shared by all
+    callers and must not be modified, tables are returned as copies.
+    """
+    def __init__(self, max_entries=256, max_bytes=256 * 2 ** 20):
+        """
+        :param max_entries: Largest number of cached exposure value colormaps and transfer functions
+        :param max_bytes: Largest total size of the cached luminance grids and tables in bytes
+        """
+        self.objects = LruCache(max_entries)
+        self.arrays = LruCache(max_bytes, _get_array_size)
+        self.counters = {kind: {"hits": 0, "misses": 0}
+                         for kind in ("ev_colormap", "transfer_function", "luminance_grid", "table")}
+        self.lock = threading.Lock()
+
+    def _lookup(self, cache, kind, key, create):
+        """
+        Returns the cached value or creates it. The value is created outside of the lock, so concurrent callers may
+        create it twice, but never see a partial result.
+        """
+        with self.lock:
+            value = cache.get((kind, key))
+            self.counters[kind]["hits" if value is not None else "misses"] += 1
+        if value is None:
+            value = create()
+            with self.lock:
+                cache.put((kind, key), value)
+        return value
+
+    def get_ev_colormap(self, config: TransferConfig):
+        """
+        :param config: Config with one of the block modes
+        :return: Exposure value based colormap of constant color blocks
+        """
+        def create():
+            convert = BLOCK_CONVERSIONS[config.mode]
+            return convert(config.colormap, config.stops, config.input_exp_range)
+        key = (config.colormap, config.mode, config.stops, config.input_exp_range)
+        return self._lookup(self.objects, "ev_colormap", key, create)
+
+    def get_transfer_function(self, config: TransferConfig):
+        """
+        :param config: Config of the transfer function
+        :return: Transfer function
+        """
+        def create():
+            if config.mode == "ev-colormap":
+                return transfer.EvTransfer(thaw_ev_colormap(config.colormap), config.input_exp_range)
+            elif config.mode in BLOCK_CONVERSIONS:
+                return transfer.EvTransfer(self.get_ev_colormap(config), config.input_exp_range)
+            elif config.mode in ("not-centered", "centered"):
+                return transfer.ColormapTransfer(config.colormap, config.input_exp_range,
+                                                 config.unclipped_exp_range or config.input_exp_range,
+                                                 config.mode == "centered")
+            raise ValueError(f"Unknown mode '{config.mode}'.")
+        return self._lookup(self.objects, "transfer_function", config, create)
+
+    def get_luminance_grid(self, config: GridConfig, progress=None):
+        """
+        :param config: Config of the luminance grid
+        :param progress: Optional progress.ProgressTracker, which only receives events if the grid isn't cached
+        :return: Flat array with the relative luminance of every entry, see transfer.get_luminance_grid()
+        """
+        config = _normalize_grid_config(config)
+        return self._lookup(self.arrays, "luminance_grid", config,
+                            lambda: transfer.get_luminance_grid(config.cube_size, config.matrix,
+                                                                config.input_exp_range, progress))
+
+    def add_luminance_grid(self, config: GridConfig, luminance_grid):
+        """
+        Adds a luminance grid that has been calculated elsewhere, e.g. by the parent of a worker process.
+        :param config: Config of the luminance grid
+        :param luminance_grid: Flat array with the relative luminance of every entry
+        """
+        with self.lock:
+            self.arrays.put(("luminance_grid", _normalize_grid_config(config)), luminance_grid)
+
+    def get_table(self, transfer_config: TransferConfig, grid_config: GridConfig):
+        """
+        :param transfer_config: Config of the transfer function
+        :param grid_config: Config of the luminance grid
+        :return: Copy of the flat array of the LUT entries, see LutGeneratorBase.generate_table()
+        """
+        table = self._lookup(self.arrays, "table", (transfer_config, _normalize_grid_config(grid_config)),
+                             lambda: transfer.evaluate_grid(self.get_transfer_function(transfer_config),
+                                                            self.get_luminance_grid(grid_config)))
+        return array('d', table)
+
+    def get_stats(self):
+        """
+        :return: Dictionary with the hits and misses of every kind of result and the number and size of the entries
+        """
+        with self.lock:
+            return {"counters": {kind: dict(counter) for kind, counter in self.counters.items()},
+                    "objects": self.objects.get_stats(),
+                    "arrays": self.arrays.get_stats()}
@@ -0,0 +1,158 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import file_io
+import progress
+import os
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Prefix of the names of all metrics
+METRIC_PREFIX = "false_color_lut"
+
+
+class MetricsObserver(progress.GenerationObserver):
+    """
+    Collects the wall time of every LUT and of its phases, as well as the total size of the saved files.
+    """
+    def __init__(self):
+        self.luts = []
+        self.current = None
+        self.phase_start = 0.0
+
+    def on_start(self, name, cube_size):
+        self.current = {"name": name, "cube_size": cube_size, "phases": {}}
+        self.phase_start = time.perf_counter()
+
+    def on_phase(self, name, phase, total):
+        self._end_phase()
+        self.current["phase"] = phase
+
+    def on_complete(self, name, file_paths, seconds):
+        self._end_phase()
+        self.current["seconds"] = seconds
+        self.current["bytes"] = sum(os.path.getsize(file_path) for file_path in file_paths)
+        del self.current["phase"]
+        self.luts.append(self.current)
+        self.current = None
+
+    def _end_phase(self):
+        now = time.perf_counter()
+        if "phase" in self.current:
+            phases = self.current["phases"]
+            phases[self.current["phase"]] = phases.get(self.current["phase"], 0.0) + now - self.phase_start
+        self.phase_start = now
+
+
+def get_report_luts(reports, jobs):
+    """
+    Converts the report of a manifest run into the LUT entries of format_metrics().
+    :param reports: Report entries, as returned by manifest.run_manifest()
+    :param jobs: Jobs of the manifest, as returned by manifest.load_manifest()
+    :return: List of dictionaries with the name, cube_size, seconds and bytes of every finished job
+    """
+    cube_sizes = {job["name"]: job["cube_size"] for job in jobs}
+    return [{"name": report["name"],
+             "cube_size": cube_sizes[report["name"]],
+             "seconds": report["seconds"],
+             "bytes": sum(os.path.getsize(file_path) for file_path in report["files"]),
+             "phases": {}}
+            for report in reports if report["status"] == "done"]
+
+
+def get_peak_rss():
+    """
+    :return: Peak resident set size of the process or its largest worker process in bytes, None if the platform
+        doesn't provide it
+    """
+    if resource is None:
+        return None
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports the size in KiB, macOS in bytes
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def _format_labels(labels):
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}" if labels else ""
+
+
+def _format_gauge(name, help_text, samples, unit=None):
+    # Only gauges are used, the textfile collector of the node exporter parses the Prometheus text format, which
+    # doesn't know the info type and the _total suffix of OpenMetrics counters. UNIT is a comment there.
+    lines = [f"# TYPE {name} gauge\n"]
+    if unit is not None:
+        lines.append(f"# UNIT {name} {unit}\n")
+    lines.append(f"# HELP {name} {help_text}\n")
+    lines.extend(f"{name}{_format_labels(labels)} {value!r}\n" for labels, value in samples)
+    return lines
+
+
+def format_metrics(luts, cache_counters=None, peak_rss=None):
+    """
+    Formats the metrics of a run in the OpenMetrics text format, for the textfile collector of the node exporter.
+    :param luts: List of dictionaries with the name, cube_size, seconds, bytes and wall time per phase of every LUT,
+        as collected by MetricsObserver
+    :param cache_counters: Optional dictionary of the hits and misses of every cache, e.g. the counters of
+        memo.Memo.get_stats()
+    :param peak_rss: Optional peak resident set size of the process in bytes
+    :return: List of lines
+    """
+    engine = f"{platform.python_implementation()} {platform.python_version()}"
+    lines = _format_gauge(f"{METRIC_PREFIX}_engine_info", "Engine used for the generation",
+                          [({"engine": engine}, 1)])
+    lines += _format_gauge(f"{METRIC_PREFIX}_generation_seconds", "Wall time of the generation of a LUT",
+                           [({"lut": lut["name"]}, lut["seconds"]) for lut in luts], "seconds")
+    lines += _format_gauge(f"{METRIC_PREFIX}_phase_seconds", "Wall time of a phase of the generation of a LUT",
+                           [({"lut": lut["name"], "phase": phase}, seconds)
+                            for lut in luts for phase, seconds in lut["phases"].items()], "seconds")
+    lines += _format_gauge(f"{METRIC_PREFIX}_voxels_per_second", "Entries of a LUT generated per second",
+                           [({"lut": lut["name"]}, lut["cube_size"] ** 3 / lut["seconds"])
+                            for lut in luts if lut["seconds"] > 0.0])
+    lines += _format_gauge(f"{METRIC_PREFIX}_written_bytes", "Total size of the saved files of the LUT",
+                           [({"lut": lut["name"]}, lut["bytes"]) for lut in luts], "bytes")
+    if cache_counters is not None:
+        lines += _format_gauge(f"{METRIC_PREFIX}_cache_hits", "Lookups that were served from a cache",
+                               [({"cache": cache}, counter["hits"]) for cache, counter in cache_counters.items()])
+        lines += _format_gauge(f"{METRIC_PREFIX}_cache_misses", "Lookups that weren't served from a cache",
+                               [({"cache": cache}, counter["misses"]) for cache, counter in cache_counters.items()])
+    if peak_rss is not None:
+        lines += _format_gauge(f"{METRIC_PREFIX}_peak_rss_bytes", "Peak resident set size of the process",
+                               [({}, peak_rss)], "bytes")
+    lines.append("# EOF\n")
+    return lines
+
+
+def save_metrics(lines, file_path):
+    """
+    Saves the metrics to a textfile. The file is replaced atomically, so the collector never reads a partial file.
+    :param lines: Lines as returned by format_metrics()
+    :param file_path: Path, including filename, where the metrics should be saved. The node exporter only reads
+        files with the .prom extension.
+    """
+    file_io.save_file(lines, file_path)
@@ -0,0 +1,220 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import sys
+import time
+
+# Phases of a generation, in the order they are run
+PHASES = ("luminance", "evaluate", "write")
+
+# Relative durations of the phases of a 65^3 LUT, used to estimate the remaining time until a generation has been timed
+DEFAULT_PHASE_WEIGHTS = {"luminance": 0.1, "evaluate": 1.4, "write": 1.0}
+
+
+class GenerationCancelled(Exception):
+    """
+    Raised within a generation, after its observer has requested the cancellation
+    """
+    pass
+
+
+class GenerationObserver:
+    """
+    Receives the events of LUT generations. All methods are optional, the default implementations do nothing.
+    """
+    def on_start(self, name, cube_size):
+        """
+        :param name: Filename of the LUT
+        :param cube_size: Number of entries per channel
+        """
+        pass
+
+    def on_phase(self, name, phase, total):
+        """
+        :param name: Filename of the LUT
+        :param phase: One of PHASES
+        :param total: Number of steps of the phase, i.e. slabs of the luminance grid, scanlines of the evaluation and
+            planes of the written file
+        """
+        pass
+
+    def on_progress(self, name, phase, done, total):
+        """
+        Called at most once per throttling interval and after the last step of a phase.
+        :param name: Filename of the LUT
+        :param phase: One of PHASES
+        :param done: Number of finished steps
+        :param total: Number of steps of the phase
+        """
+        pass
+
+    def on_complete(self, name, file_paths, seconds):
+        """
+        :param name: Filename of the LUT
+        :param file_paths: Paths of the written files, the LUT first, followed by its shaper LUT if it has been saved
+            as separate file
+        :param seconds: Duration of the generation
+        """
+        pass
+
+    def is_cancelled(self):
+        """
+        Polled after every step. A generation that is cancelled raises GenerationCancelled. Files are written
+        atomically, so the previous version of its file is kept and no partial file remains.
+        :return: True, if the generation shall be cancelled
+        """
+        return False
+
+
+class ObserverGroup(GenerationObserver):
+    """
+    Forwards the events to several observers. The generation is cancelled, if any of them requests it.
+    """
+    def __init__(self, observers):
+        """
+        :param observers: List of GenerationObserver
+        """
+        self.observers = observers
+
+    def on_start(self, name, cube_size):
+        for observer in self.observers:
+            observer.on_start(name, cube_size)
+
+    def on_phase(self, name, phase, total):
+        for observer in self.observers:
+            observer.on_phase(name, phase, total)
+
+    def on_progress(self, name, phase, done, total):
+        for observer in self.observers:
+            observer.on_progress(name, phase, done, total)
+
+    def on_complete(self, name, file_paths, seconds):
+        for observer in self.observers:
+            observer.on_complete(name, file_paths, seconds)
+
+    def is_cancelled(self):
+        return any(observer.is_cancelled() for observer in self.observers)
+
+
+class ProgressTracker:
+    """
+    Counts the steps of the phases of a generation, throttles the progress events and checks for cancellation. The
+    generation functions receive a tracker, instead of the observer.
+    """
+    def __init__(self, observer: GenerationObserver, name, interval=0.1):
+        """
+        :param observer: Observer that receives the events
+        :param name: Filename of the LUT
+        :param interval: Smallest time in seconds between two progress events of a phase
+        """
+        self.observer = observer
+        self.name = name
+        self.interval = interval
+        self.phase = None
+        self.done = 0
+        self.total = 0
+        self.next_event = 0.0
+
+    def start_phase(self, phase, total):
+        """
+        :param phase: One of PHASES
+        :param total: Number of steps of the phase
+        """
+        self.phase = phase
+        self.done = 0
+        self.total = total
+        self.next_event = time.monotonic() + self.interval
+        self.observer.on_phase(self.name, phase, total)
+
+    def advance(self, steps=1):
+        """
+        Counts finished steps of the current phase.
+        :param steps: Number of finished steps
+        """
+        if self.observer.is_cancelled():
+            raise GenerationCancelled(f"The generation of {self.name} has been cancelled.")
+        self.done += steps
+        if self.done >= self.total or time.monotonic() >= self.next_event:
+            self.next_event = time.monotonic() + self.interval
+            self.observer.on_progress(self.name, self.phase, self.done, self.total)
+
+    def iterate(self, iterable):
+        """
+        Counts a step after every item of the iterable has been consumed.
+        :param iterable: Items of the phase, e.g. planes of a LUT file
+        :return: Generator of the items
+        """
+        for item in iterable:
+            yield item
+            self.advance()
+
+
+class ProgressBar(GenerationObserver):
+    """
+    Shows the progress of every generation in the terminal, with an estimate of the remaining time of all its phases.
+    The phases are weighted by their durations in the previous generation, or by DEFAULT_PHASE_WEIGHTS for the first
+    one. Phases that are skipped, e.g. the luminance phase of a memoized grid, don't count.
+    """
+    def __init__(self, stream=sys.stderr, width=30):
+        """
+        :param stream: Text stream to which the progress bar is written
+        :param width: Number of characters of the bar
+        """
+        self.stream = stream
+        self.width = width
+        self.phase_weights = dict(DEFAULT_PHASE_WEIGHTS)
+        self.start = 0.0
+        self.phase = None
+        self.phase_start = 0.0
+        self.phase_seconds = {}
+
+    def _finish_phase(self):
+        if self.phase is not None:
+            self.phase_seconds[self.phase] = time.monotonic() - self.phase_start
+
+    def on_start(self, name, cube_size):
+        self.start = time.monotonic()
+        self.phase = None
+        self.phase_seconds = {}
+
+    def on_phase(self, name, phase, total):
+        self._finish_phase()
+        self.phase = phase
+        self.phase_start = time.monotonic()
+        self.on_progress(name, phase, 0, total)
+
+    def on_progress(self, name, phase, done, total):
+        finished_weight = sum(self.phase_weights[finished] for finished in self.phase_seconds)
+        remaining_weight = sum(self.phase_weights[remaining] for remaining in PHASES[PHASES.index(phase):])
+        done_weight = finished_weight + self.phase_weights[phase] * (done / total if total else 1.0)
+        total_weight = finished_weight + remaining_weight
+        fraction = done_weight / total_weight if total_weight else 1.0
+        filled = int(self.width * fraction)
+        elapsed = time.monotonic() - self.start
+        eta = f"ETA {elapsed * (1.0 - fraction) / fraction:5.1f}s" if fraction > 0.0 else "ETA     ?"
+        self.stream.write(f"\r{name} {phase:<9} [{'#' * filled}{'.' * (self.width - filled)}] {fraction:4.0%} {eta}")
+        self.stream.flush()
+
+    def on_complete(self, name, file_paths, seconds):
+        self._finish_phase()
+        self.phase_weights.update(self.phase_seconds)
+        self.stream.write(f"\r\033[K{name} saved as {' and '.join(file_paths)} in {seconds:.2f}s\n")
+        self.stream.flush()
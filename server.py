@@ -0,0 +1,294 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import file_io
+import manifest
+import memo
+import json
+import os
+import socketserver
+import stat
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# Largest cube size that is generated on request, larger LUTs take minutes and should be generated with the CLI
+MAX_CUBE_SIZE = 129
+
+# Parameters of a request that contain comma separated lists of numbers
+LIST_PARAMETERS = ("stops", "input_exp_range", "unclipped_exp_range", "matrix")
+
+CONTENT_TYPES = {"spi3d": "text/plain; charset=us-ascii", "cube": "text/plain; charset=us-ascii", "hald": "image/png"}
+
+
+class LutService:
+    """
+    Generates LUTs on request and keeps the most recently requested LUTs and intermediate results in memory. Concurrent
+    requests for the same LUT wait for a single generation.
+    """
+    def __init__(self, cache_size=256 * 2 ** 20, memo_size=64 * 2 ** 20, viscm_dir=None):
+        """
+        :param cache_size: Largest total size of the cached LUT files in bytes
+        :param memo_size: Largest total size of the cached luminance grids and tables in bytes, see memo.Memo
+        :param viscm_dir: Directory of the viscm scripts that can be requested. Loading a viscm script runs it, so
+            requests for viscm scripts are rejected if it isn't set, and scripts outside of it are never loaded.
+        """
+        self.viscm_dir = os.path.realpath(viscm_dir) if viscm_dir is not None else None
+        self.luts = memo.LruCache(cache_size, len)
+        # Loaded viscm colormaps, keyed by the path and modification time of the script
+        self.viscm_colormaps = memo.LruCache(16)
+        self.memo = memo.Memo(max_bytes=memo_size)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "hits": 0, "misses": 0, "coalesced": 0}
+
+    def get_stats(self):
+        """
+        :return: Dictionary with the request counters and the number and size of the cached entries
+        """
+        with self.lock:
+            stats = {**self.counters,
+                     "cached_luts": len(self.luts),
+                     "cached_bytes": self.luts.size,
+                     "pending": len(self.pending),
+                     "viscm_colormaps": self.viscm_colormaps.get_stats()}
+        return {**stats, "memo": self.memo.get_stats()}
+
+    def get_lut(self, entry):
+        """
+        Returns the file of a LUT, either from the cache, from a generation that is already running for another
+        request, or by generating it.
+        :param entry: Dictionary with the keys of a manifest job, see manifest.load_manifest(). Exactly one format
+            has to be given, either as "format" or as list "formats".
+        :return: Tuple of the job, as returned by manifest.make_job(), and the bytes of the LUT file
+        """
+        entry = dict(entry)
+        if "format" in entry:
+            entry["formats"] = [entry.pop("format")]
+        if "viscm" in entry:
+            entry["viscm"] = self._resolve_viscm_path(entry["viscm"])
+        job = manifest.make_job(entry)
+        if len(job["formats"]) != 1:
+            raise ValueError("exactly one format is required")
+        if job["cube_size"] > MAX_CUBE_SIZE:
+            raise ValueError(f"the cube size is limited to {MAX_CUBE_SIZE}")
+
+        source_key = self._get_source_key(job)
+        variant_key = json.dumps(job["variant"], sort_keys=True)
+        key = (source_key, variant_key, manifest.get_grid_key(job), job["formats"][0])
+        with self.lock:
+            self.counters["requests"] += 1
+            data = self.luts.get(key)
+            if data is not None:
+                self.counters["hits"] += 1
+                return job, data
+            future = self.pending.get(key)
+            is_owner = future is None
+            if is_owner:
+                self.counters["misses"] += 1
+                future = self.pending[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+        if not is_owner:
+            return job, future.result()
+
+        try:
+            data = self._generate(job, source_key)
+            with self.lock:
+                self.luts.put(key, data)
+                del self.pending[key]
+            future.set_result(data)
+            return job, data
+        except BaseException as e:
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(e)
+            raise
+
+    def _resolve_viscm_path(self, name):
+        """
+        :param name: Path of a viscm script relative to the viscm directory
+        :return: Absolute path of the script
+        """
+        if self.viscm_dir is None:
+            raise ValueError("viscm scripts can't be requested, the service has been started without --viscm-dir")
+        if not isinstance(name, str):
+            raise ValueError("the viscm script has to be given as path relative to the viscm directory")
+        # Symbolic links and ".." are resolved first, so they can't point outside of the directory
+        path = os.path.realpath(os.path.join(self.viscm_dir, name))
+        if os.path.commonpath([self.viscm_dir, path]) != self.viscm_dir or not os.path.isfile(path):
+            raise ValueError(f"unknown viscm script '{name}'")
+        return path
+
+    @staticmethod
+    def _get_source_key(job):
+        source_type, path = job["source"]
+        if source_type == "viscm":
+            # Scripts that have been saved again are loaded again
+            return job["source"] + (os.path.getmtime(path),)
+        return job["source"]
+
+    def _get_viscm_colormap(self, source_key):
+        """
+        Returns the colormap of a viscm script, loading the script only if it hasn't been loaded since it was saved.
+        :param source_key: Key of the source, as returned by _get_source_key()
+        :return: Colormap with 256 entries
+        """
+        with self.lock:
+            colormap = self.viscm_colormaps.get(source_key)
+        if colormap is None:
+            try:
+                colormap = file_io.load_viscm_colormap(source_key[1])
+            except Exception as e:
+                raise ValueError(f"the viscm script couldn't be loaded, {type(e).__name__}: {e}") from e
+            with self.lock:
+                self.viscm_colormaps.put(source_key, colormap)
+        return colormap
+
+    def _generate(self, job, source_key):
+        """
+        Generates the file of a LUT, reusing the cached intermediate results of other requests.
+        """
+        if job["source"][0] == "viscm":
+            colormap = self._get_viscm_colormap(source_key)
+        else:
+            colormap = manifest.get_colormap(job["source"])
+        transfer_config = memo.make_transfer_config(colormap, job["variant"])
+        grid_config = memo.GridConfig(job["cube_size"], job["matrix"], tuple(job["variant"]["input_exp_range"]))
+        table = self.memo.get_table(transfer_config, grid_config)
+        return file_io.serialize_lut(table, job["cube_size"], job["formats"][0])
+
+
+def parse_query(query):
+    """
+    Converts the query string of a request into the keys of a manifest job. Dashes in the parameter names are
+    replaced by underscores, so the names of the CLI arguments can be used as well, e.g.
+    "colormap=ignis.spi3d&mode=blocks-stretched&stops=-10.0,-5.0,0.0,6.5&cube-size=33&format=cube".
+    :param query: Query string
+    :return: Dictionary with the keys of the job
+    """
+    entry = {}
+    for name, value in parse_qsl(query, keep_blank_values=True, strict_parsing=True):
+        name = name.replace("-", "_")
+        if name in LIST_PARAMETERS:
+            entry[name] = [float(x) for x in value.split(",")]
+        elif name == "cube_size":
+            entry[name] = int(value)
+        else:
+            entry[name] = value
+    return entry
+
+
+class LutRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles the requests of the LUT service. GET /lut takes the parameters of the job as query string, POST /lut as
+    JSON object. GET /stats returns the counters and the size of the caches.
+    """
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/stats":
+            self.send_content(json.dumps(self.server.lut_service.get_stats()).encode("ascii"), "application/json")
+        elif url.path == "/lut":
+            try:
+                entry = parse_query(url.query)
+            except ValueError as e:
+                self.send_error(400, explain=str(e))
+                return
+            self.send_lut(entry)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/lut":
+            self.send_error(404)
+            return
+        try:
+            entry = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if not isinstance(entry, dict):
+                raise ValueError("the body has to be a JSON object")
+        except ValueError as e:
+            self.send_error(400, explain=str(e))
+            return
+        self.send_lut(entry)
+
+    def send_lut(self, entry):
+        try:
+            job, data = self.server.lut_service.get_lut(entry)
+        except (ValueError, TypeError, KeyError, OSError) as e:
+            self.send_error(400, explain=f"{type(e).__name__}: {e}")
+            return
+        lut_format = job["formats"][0]
+        self.send_content(data, CONTENT_TYPES[lut_format],
+                          f'attachment; filename="{job["name"]}{file_io.LUT_EXTENSIONS[lut_format]}"')
+
+    def send_content(self, data, content_type, disposition=None):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if disposition is not None:
+            self.send_header("Content-Disposition", disposition)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Clients of Unix sockets don't have an address
+        return self.client_address[0] if self.client_address else "unix socket"
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    HTTP server on a Unix socket, handling every request in its own thread
+    """
+    daemon_threads = True
+
+
+def serve(host="127.0.0.1", port=8765, socket_path=None, cache_size=256 * 2 ** 20, viscm_dir=None):
+    """
+    Runs the LUT service until it is interrupted.
+    :param host: Host name or address to listen on
+    :param port: Port to listen on
+    :param socket_path: Path of a Unix socket to listen on instead of host and port. An existing socket is replaced.
+    :param cache_size: Largest total size of the cached LUT files in bytes
+    :param viscm_dir: Directory of the viscm scripts that can be requested, see LutService
+    """
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            # Only the socket of an earlier run is replaced, never a file that happens to have the path
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                raise FileExistsError(f"{socket_path} already exists and isn't a socket.")
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, LutRequestHandler)
+        address = socket_path
+    else:
+        server = ThreadingHTTPServer((host, port), LutRequestHandler)
+        address = f"http://{host}:{server.server_address[1]}"
+    server.lut_service = LutService(cache_size, viscm_dir=viscm_dir)
+
+    print(f"Serving LUTs on {address}, e.g. /lut?colormap=ignis.spi3d&mode=centered&format=cube")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None:
+            os.remove(socket_path)
@@ -0,0 +1,244 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import colors
+import transfer
+import os
+import re
+
+SHADER_LANGUAGES = ("glsl", "osl")
+
+SHADER_EXTENSIONS = {"glsl": ".glsl", "osl": ".osl"}
+
+
+class ShaderProgram:
+    """
+    Constants of a transfer function that are required for evaluating it in a shader. Calling the program evaluates
+    the same operations as the emitted shader code on the CPU, which serves as reference for checking the shader
+    against the LUTs.
+    """
+
+    def __init__(self, name, transfer_function):
+        """
+        :param name: Name of the colormap, which is used for the names of the shader functions
+        :param transfer_function: Either a transfer.ColormapTransfer or a transfer.EvTransfer
+        """
+        self.identifier = re.sub(r"\W", "_", os.path.splitext(os.path.basename(name))[0])
+        if self.identifier[:1].isdigit():
+            self.identifier = "_" + self.identifier
+        self.input_exp_range = transfer_function.input_exp_range
+
+        if isinstance(transfer_function, transfer.ColormapTransfer):
+            self.kind = "colormap"
+            self.colormap = transfer_function.colormap
+            self.low_clip = transfer_function.low_clip
+            self.high_clip = transfer_function.high_clip
+            self.centered = transfer_function.centered
+            # Input range that mapping.map_to_colormap_range() projects to [0.0, 1.0]
+            center = colors.normalize_value(0.18, self.input_exp_range[0], self.input_exp_range[1])
+            distance = max(center, 1.0 - center)
+            self.center_min = center - distance
+            self.center_max = center + distance
+        elif isinstance(transfer_function, transfer.EvTransfer):
+            self.kind = "ev"
+            self.coordinates = transfer_function.coordinates
+            self.colors = [[0.0, 0.0, 0.0] if point.replace_with_luminance else point.get_color()
+                           for point in transfer_function.ev_colormap]
+            self.luminance_flags = [int(point.replace_with_luminance) for point in transfer_function.ev_colormap]
+        else:
+            raise ValueError(f"Transfer functions of type {type(transfer_function).__name__} can't be compiled into "
+                             f"a shader.")
+
+    def __call__(self, red, green, blue):
+        """
+        Evaluates the shader function for a LUT input.
+        :param red: Red, normalized input value in range [0.0, 1.0]
+        :param green: Green, normalized input value in range [0.0, 1.0]
+        :param blue: Blue, normalized input value in range [0.0, 1.0]
+        :return: Color
+        """
+        y = 0.2126 * red + 0.7512 * blue + 0.0722 * green
+
+        if self.kind == "colormap":
+            if y < self.low_clip:
+                x = 0.0
+            elif y > self.high_clip:
+                x = 1.0
+            elif self.centered:
+                x = (min(self.center_max, max(self.center_min, y)) - self.center_min) / \
+                    (self.center_max - self.center_min)
+            else:
+                x = y
+            position = x * 255.0
+            lower = int(position)
+            upper = lower + 1 if lower < 255 else 255
+            factor = position - lower
+            color_a = self.colormap[lower]
+            color_b = self.colormap[upper]
+        else:
+            count = len(self.coordinates)
+            right = 0
+            for idx in range(count):
+                if self.coordinates[idx] <= y:
+                    right = idx + 1
+            lower = right - 1 if right > 0 else 0
+            upper = right if right < count else count - 1
+            color_a = [y, y, y] if self.luminance_flags[lower] != 0 else self.colors[lower]
+            color_b = [y, y, y] if self.luminance_flags[upper] != 0 else self.colors[upper]
+            if lower == upper:
+                return color_a
+            factor = (y - self.coordinates[lower]) / (self.coordinates[upper] - self.coordinates[lower])
+
+        return [color_a[i] + (color_b[i] - color_a[i]) * factor for i in range(3)]
+
+
+def format_float(value):
+    """
+    Formats a float as literal that is valid in GLSL and OSL, without losing precision.
+    :param value: Value
+    :return: String
+    """
+    return repr(float(value))
+
+
+def format_shader(program: ShaderProgram, language):
+    """
+    Creates the source code of self-contained shader functions for the transfer function. The function
+    `<name>_transfer()` takes the normalized values like the LUT does, `<name>_false_color()` takes scene linear
+    values and applies the `allocation: lg2` transform of the OCIO configuration first. The OSL code also contains a
+    shader that wraps the latter.
+    :param program: Shader program
+    :param language: One of SHADER_LANGUAGES
+    :return: List of strings
+    """
+    if language not in SHADER_LANGUAGES:
+        raise ValueError(f"Unknown shader language '{language}'.")
+
+    name = program.identifier
+    glsl = language == "glsl"
+    vec3 = "vec3" if glsl else "color"
+    exponent_min, exponent_max = program.input_exp_range
+
+    def make_vec3(color):
+        return f"{vec3}({', '.join(format_float(value) for value in color)})"
+
+    def make_array(type_name, array_name, values):
+        # OSL doesn't support global variables, therefore the constants are local arrays of the function
+        if glsl:
+            lines = [f"    const {type_name} {array_name}[{len(values)}] = {type_name}[{len(values)}](\n"]
+            closing = "    );\n"
+        else:
+            lines = [f"    {type_name} {array_name}[{len(values)}] = {{\n"]
+            closing = "    };\n"
+        per_line = 3 if type_name == vec3 else 6
+        rows = [", ".join(values[start:start + per_line]) for start in range(0, len(values), per_line)]
+        lines += [f"        {row}{',' if idx < len(rows) - 1 else ''}\n" for idx, row in enumerate(rows)]
+        lines.append(closing)
+        return lines
+
+    lines = [f"// False color transfer function '{name}', generated by lut_generator.py\n",
+             "// Requires GLSL 1.20 or later.\n" if glsl else "// Requires Open Shading Language 1.8 or later.\n",
+             "\n",
+             "// Takes the normalized input of the LUT. The weights of the green and blue channels are swapped, like\n",
+             "// in the generated spi3d files.\n",
+             f"{vec3} {name}_transfer({vec3} normalized)\n",
+             "{\n"]
+
+    if program.kind == "colormap":
+        lines += make_array(vec3, "colormap", [make_vec3(color) for color in program.colormap])
+        lines += ["    float y = 0.2126 * normalized[0] + 0.7512 * normalized[2] + 0.0722 * normalized[1];\n",
+                  "    float x = y;\n",
+                  f"    if (y < {format_float(program.low_clip)})\n",
+                  "        x = 0.0;\n",
+                  f"    else if (y > {format_float(program.high_clip)})\n",
+                  "        x = 1.0;\n"]
+        if program.centered:
+            center_min = format_float(program.center_min)
+            center_max = format_float(program.center_max)
+            lines += ["    else  // Project middle grey to the center of the colormap\n",
+                      f"        x = (clamp(y, {center_min}, {center_max}) - {center_min}) / "
+                      f"({center_max} - {center_min});\n"]
+        lines += ["    float position = x * 255.0;\n",
+                  "    int lower = int(position);\n",
+                  "    int upper = lower < 255 ? lower + 1 : 255;\n",
+                  "    float factor = position - float(lower);\n",
+                  f"    {vec3} color_a = colormap[lower];\n",
+                  f"    {vec3} color_b = colormap[upper];\n"]
+    else:
+        count = len(program.coordinates)
+        lines += make_array("float", "coordinates", [format_float(value) for value in program.coordinates])
+        lines += make_array(vec3, "point_colors", [make_vec3(color) for color in program.colors])
+        lines += make_array("int", "luminance_flags", [str(flag) for flag in program.luminance_flags])
+        lines += ["    float y = 0.2126 * normalized[0] + 0.7512 * normalized[2] + 0.0722 * normalized[1];\n",
+                  "    // Number of color points at or below the luminance, like bisect.bisect()\n",
+                  "    int right = 0;\n",
+                  f"    for (int idx = 0; idx < {count}; ++idx)\n",
+                  "        if (coordinates[idx] <= y)\n",
+                  "            right = idx + 1;\n",
+                  "    int lower = right > 0 ? right - 1 : 0;\n",
+                  f"    int upper = right < {count} ? right : {count - 1};\n",
+                  f"    {vec3} color_a = luminance_flags[lower] != 0 ? {vec3}(y) : point_colors[lower];\n",
+                  f"    {vec3} color_b = luminance_flags[upper] != 0 ? {vec3}(y) : point_colors[upper];\n",
+                  "    if (lower == upper)\n",
+                  "        return color_a;\n",
+                  "    float factor = (y - coordinates[lower]) / (coordinates[upper] - coordinates[lower]);\n"]
+
+    lines += ["    return color_a + (color_b - color_a) * factor;\n",
+              "}\n",
+              "\n",
+              "// Takes scene linear values and applies the allocation: lg2 transform of the OCIO configuration\n",
+              f"{vec3} {name}_false_color({vec3} scene_linear)\n",
+              "{\n",
+              f"    {vec3} clamped = max(scene_linear, {vec3}({format_float(2 ** exponent_min)}));\n",
+              f"    {vec3} normalized = (log2(clamped) - {vec3}({format_float(exponent_min)})) / "
+              f"{format_float(abs(exponent_max - exponent_min))};\n",
+              f"    return {name}_transfer(clamp(normalized, {vec3}(0.0), {vec3}(1.0)));\n",
+              "}\n"]
+
+    if not glsl:
+        lines += ["\n",
+                  f"shader {name}_shader(\n",
+                  "    color In = color(0.18),\n",
+                  "    output color Out = color(0.0))\n",
+                  "{\n",
+                  f"    Out = {name}_false_color(In);\n",
+                  "}\n"]
+    return lines
+
+
+def check_shader_program(program: ShaderProgram, table, cube_size, tolerance=1e-6):
+    """
+    Evaluates the shader program on the CPU for every entry of a LUT and compares the colors.
+    :param program: Shader program
+    :param table: Flat array of the LUT entries, as returned by file_io.load_lut()
+    :param cube_size: Number of entries per channel
+    :param tolerance: Largest absolute error of a channel that is still considered to be equal
+    :return: Largest absolute error of a channel
+    """
+    inputs = [idx / (cube_size - 1) for idx in range(cube_size)]
+    colors_cpu = [value for red in inputs for green in inputs for blue in inputs
+                  for value in program(red, green, blue)]
+    max_error = max(abs(a - b) for a, b in zip(colors_cpu, table))
+    if max_error > tolerance:
+        raise ValueError(f"The shader for '{program.identifier}' differs from the LUT by {max_error:.8f}, which "
+                         f"exceeds the tolerance of {tolerance}.")
+    return max_error
@@ -0,0 +1,116 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import file_io
+import transfer
+import os
+
+
+def format_ev(ev):
+    """
+    Formats an exposure value for filenames, e.g. -7.5 as `-7_5`.
+    :param ev: Exposure value
+    :return: String
+    """
+    return str(float(ev)).replace(".", "_")
+
+
+def get_constant_bands(transfer_function):
+    """
+    Finds the bands of constant color of a transfer function that is based on an exposure value colormap, e.g. for
+    the block modes or Dante.
+    :param transfer_function: Transfer function
+    :return: List of tuples with the exposure values at the start and end of each band, or None if the colormap isn't
+        constant between all of its color points
+    """
+    if not isinstance(transfer_function, transfer.EvTransfer):
+        return None
+
+    bands = []
+    ev_colormap = transfer_function.ev_colormap
+    for start, end in zip(ev_colormap[:-1], ev_colormap[1:]):
+        if start.coordinate == end.coordinate:
+            continue
+        # Color points that are replaced with the luminance return different colors for different luminance values
+        start_color = start.get_color(0.0)
+        if start_color != start.get_color(1.0) or start_color != end.get_color(0.0) or \
+                start_color != end.get_color(1.0):
+            return None
+        bands.append((start.coordinate, end.coordinate))
+    return bands or None
+
+
+def quantize(color, max_value=255):
+    """
+    Quantizes a color to integer values.
+    :param color: Color with values in the range [0.0, 1.0]
+    :param max_value: Largest integer value
+    :return: List of integers
+    """
+    return [int(round(min(1.0, max(0.0, value)) * max_value)) for value in color]
+
+
+def save_swatches(name, transfer_function, output_dir, exposure_values=None, size=20, strip_width=512,
+                  input_exp_range=(-12.473931189, 4.026068812)):
+    """
+    Saves a PNG swatch for every exposure value, or for every band of constant color, and a legend strip with the
+    gradient from the lowest to the highest exposure value. The images are saved in a directory named after the
+    colormap, e.g. `ignis/ignis_-7_5.png`, `dante/dante_-7_5_to_-5_0.png` and `ignis/ignis_legend.png`.
+    :param name: Name of the colormap
+    :param transfer_function: Transfer function of the colormap
+    :param output_dir: Directory in which the directory for the colormap is created
+    :param exposure_values: Exposure values of the swatches. By default the bands of constant color are used, if the
+        colormap consists of them, otherwise transfer.DEFAULT_EXPOSURE_VALUES.
+    :param size: Width and height of the swatches in pixels
+    :param strip_width: Width of the legend strip in pixels, its height is the swatch size
+    :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+    :return: Dictionary with the SHA-256 of every saved image, keyed by its path
+    """
+    name = os.path.splitext(name)[0]
+    bands = get_constant_bands(transfer_function) if exposure_values is None else None
+    if bands is not None:
+        swatch_evs = [(start + end) / 2.0 for start, end in bands]
+        filenames = [f"{name}_{format_ev(start)}_to_{format_ev(end)}.png" for start, end in bands]
+        ev_min, ev_max = bands[0][0], bands[-1][1]
+    else:
+        swatch_evs = sorted(exposure_values or transfer.DEFAULT_EXPOSURE_VALUES)
+        filenames = [f"{name}_{format_ev(ev)}.png" for ev in swatch_evs]
+        ev_min, ev_max = swatch_evs[0], swatch_evs[-1]
+
+    # Swatches and the columns of the strip are evaluated together
+    strip_evs = [ev_min + (ev_max - ev_min) * column / max(1, strip_width - 1) for column in range(strip_width)]
+    evaluated = [quantize(color)
+                 for color in transfer.get_ev_colors(transfer_function, swatch_evs + strip_evs, input_exp_range)]
+
+    directory = os.path.join(output_dir, name)
+    os.makedirs(directory, exist_ok=True)
+
+    sha256 = {}
+    for filename, color in zip(filenames, evaluated):
+        file_path = os.path.join(directory, filename)
+        sha256[file_path] = file_io.save_png(file_path, size, size, color * (size * size))
+
+    strip_row = [value for color in evaluated[len(swatch_evs):] for value in color]
+    file_path = os.path.join(directory, f"{name}_legend.png")
+    sha256[file_path] = file_io.save_png(file_path, strip_width, size, strip_row * size)
+    print(f"Saved {len(filenames)} swatches and the legend strip of {name} in {directory}")
+    return sha256
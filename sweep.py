@@ -0,0 +1,148 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import file_io
+import memo
+import transfer
+import json
+import os
+import time
+from array import array
+
+# Modes that map the luminance continuously to the colormap, instead of creating blocks of constant color
+CONTINUOUS_MODES = ("not-centered", "centered")
+
+BLOCK_MODES = tuple(memo.BLOCK_CONVERSIONS)
+
+
+def make_variants(input_exp_ranges, unclipped_exp_ranges=(), modes=(), block_stops=(), ev_colormap=False):
+    """
+    Creates the grid of variants of a sweep. The unclipped exposure range and the modes only apply to colormaps with
+    256 entries, combinations that don't differ for the colormap are only created once. Unclipped ranges that exceed
+    the input range are skipped.
+    :param input_exp_ranges: List of ordered tuples of the two exponents defining the input value range
+    :param unclipped_exp_ranges: List of ordered tuples of exponents defining the input value range that won't be
+        clipped. By default the input range isn't clipped.
+    :param modes: List of CONTINUOUS_MODES
+    :param block_stops: List of tuples with one of BLOCK_MODES and the list of exposure values of the blocks
+    :param ev_colormap: True, if the colormap consists of exposure values and associated colors
+    :return: List of dictionaries with the parameters of every variant
+    """
+    variants = []
+    for input_exp_range in input_exp_ranges:
+        if ev_colormap:
+            variants.append({"mode": "ev-colormap", "input_exp_range": list(input_exp_range)})
+            continue
+
+        valid_unclipped_exp_ranges = []
+        for unclipped_exp_range in unclipped_exp_ranges or [input_exp_range]:
+            if unclipped_exp_range[0] < input_exp_range[0] or unclipped_exp_range[1] > input_exp_range[1]:
+                print(f"Skipping the unclipped range {list(unclipped_exp_range)}, which exceeds the input range "
+                      f"{list(input_exp_range)}")
+            else:
+                valid_unclipped_exp_ranges.append(unclipped_exp_range)
+
+        for mode in modes:
+            for unclipped_exp_range in valid_unclipped_exp_ranges:
+                variants.append({"mode": mode,
+                                 "input_exp_range": list(input_exp_range),
+                                 "unclipped_exp_range": list(unclipped_exp_range)})
+
+        for mode, stops in block_stops:
+            variants.append({"mode": mode, "stops": list(stops), "input_exp_range": list(input_exp_range)})
+    return variants
+
+
+def clip_table(base_table, luminance_grid, transfer_function: transfer.ColormapTransfer):
+    """
+    Derives the table of a colormap transfer function from the table of the same colormap and mode without clipping.
+    Only the entries outside of the unclipped range are replaced, the others are identical for both.
+    :param base_table: Flat array of the entries for the unclipped input range
+    :param luminance_grid: Flat array of relative luminance values, as returned by transfer.get_luminance_grid()
+    :param transfer_function: Transfer function with the unclipped range of the variant
+    :return: Flat array of the entries
+    """
+    low_clip = transfer_function.low_clip
+    high_clip = transfer_function.high_clip
+    low_color = transfer_function(low_clip - 1.0)
+    high_color = transfer_function(high_clip + 1.0)
+
+    table = array('d', base_table)
+    for idx, y in enumerate(luminance_grid):
+        if y < low_clip:
+            table[idx * 3:idx * 3 + 3] = array('d', low_color)
+        elif y > high_clip:
+            table[idx * 3:idx * 3 + 3] = array('d', high_color)
+    return table
+
+
+def run_sweep(name, colormap, variants, output_dir, cube_size=65, lut_format="spi3d"):
+    """
+    Generates and saves the LUTs of all variants, followed by a JSON index with the parameters of every LUT. The
+    luminance grid is calculated once for all variants. Variants that only differ in the unclipped range share the
+    evaluation of the colormap, only the clipped entries are replaced.
+    :param name: Name of the colormap, used as prefix for the filenames
+    :param colormap: Colormap with 256 entries, or colormap consisting of exposure values and associated colors
+    :param variants: List of dictionaries with the parameters of every variant, as returned by make_variants()
+    :param output_dir: Directory where the LUTs and the index are saved
+    :param cube_size: Number of entries per channel
+    :param lut_format: One of file_io.LUT_FORMATS
+    :return: Dictionary with the SHA-256 of every saved LUT and of the index, keyed by its path
+    """
+    name = os.path.splitext(os.path.basename(name))[0]
+    sweep_memo = memo.Memo()
+    luminance_grid = sweep_memo.get_luminance_grid(memo.GridConfig(cube_size))
+    base_tables = {}
+
+    sha256 = {}
+    index = []
+    for idx, variant in enumerate(variants):
+        start = time.perf_counter()
+        transfer_function = sweep_memo.get_transfer_function(memo.make_transfer_config(colormap, variant))
+        if variant["mode"] in CONTINUOUS_MODES:
+            key = (variant["mode"], tuple(variant["input_exp_range"]))
+            if key not in base_tables:
+                base_config = memo.make_transfer_config(colormap, {**variant,
+                                                                   "unclipped_exp_range": variant["input_exp_range"]})
+                base_tables[key] = transfer.evaluate_grid(sweep_memo.get_transfer_function(base_config),
+                                                          luminance_grid)
+            table = clip_table(base_tables[key], luminance_grid, transfer_function)
+        else:
+            table = transfer.evaluate_grid(transfer_function, luminance_grid)
+
+        filename = f"{name}_{idx:03d}{file_io.LUT_EXTENSIONS[lut_format]}"
+        file_path = os.path.join(output_dir, filename)
+        sha256[file_path] = file_io.save_lut(table, cube_size, file_path, lut_format)
+        index.append({"file": filename, **variant, "seconds": round(time.perf_counter() - start, 3)})
+
+        ranges = f"input {variant['input_exp_range']}"
+        if "unclipped_exp_range" in variant:
+            ranges += f", unclipped {variant['unclipped_exp_range']}"
+        if "stops" in variant:
+            ranges += f", stops {variant['stops']}"
+        print(f"{filename}: {variant['mode']}, {ranges} ({index[-1]['seconds']:.2f}s)")
+
+    index_path = os.path.join(output_dir, f"{name}_sweep.json")
+    sha256[index_path] = file_io.save_file([json.dumps({"colormap": name, "cube_size": cube_size, "format": lut_format,
+                                                        "variants": index}, indent=2), "\n"], index_path)
+    print(f"Saved {len(index)} LUTs and the index {index_path}")
+    return sha256
@@ -0,0 +1,183 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import colors
+import image_processing
+import mapping
+import bisect
+import itertools
+from array import array
+from typing import List
+
+# Exposure values of the swatches in the README
+DEFAULT_EXPOSURE_VALUES = [-10.0, -7.5, -5.0, -2.5, -1.0, 0.0, 1.0, 2.5, 5.0, 6.5]
+
+
+class ColormapTransfer:
+    """
+    Transfer function from the normalized relative luminance to the color of a colormap with 256 entries
+    """
+
+    def __init__(self, colormap,
+                 input_exp_range=(-12.473931189, 4.026068812),
+                 unclipped_exp_range=(-12.473931189, 4.026068812),
+                 centered=False):
+        """
+        :param colormap: Colormap with 256 entries
+        :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+        :param unclipped_exp_range: Ordered tuple of exponents defining the input value range that won't be
+            clipped
+        :param centered: The input value for middle grey is mapped to the center of the colormap, if set to True
+        """
+        self.colormap = colormap
+        self.input_exp_range = input_exp_range
+        self.unclipped_exp_range = unclipped_exp_range
+        self.centered = centered
+        self.low_clip = colors.normalize_value(2 ** unclipped_exp_range[0], input_exp_range[0], input_exp_range[1])
+        self.high_clip = colors.normalize_value(2 ** unclipped_exp_range[1], input_exp_range[0], input_exp_range[1])
+
+    def __call__(self, y):
+        """
+        :param y: Relative luminance of the normalized input values
+        :return: Color
+        """
+        if y < self.low_clip:
+            return colors.get_color(self.colormap, 0.0)
+        elif y > self.high_clip:
+            return colors.get_color(self.colormap, 1.0)
+        else:
+            if self.centered:
+                mapped = mapping.map_to_colormap_range(y, self.input_exp_range[0], self.input_exp_range[1])
+            else:
+                mapped = y
+            return colors.get_color(self.colormap, mapped)
+
+
+class EvTransfer:
+    """
+    Transfer function from the normalized relative luminance to the color of a colormap based on exposure values
+    """
+
+    def __init__(self, ev_colormap: List[colors.ColorPoint], input_exp_range=(-12.473931189, 4.026068812)):
+        """
+        :param ev_colormap: Colormap consisting of exposure values and associated color
+        :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+        """
+        self.ev_colormap = sorted(ev_colormap, key=lambda x: x.coordinate)
+        self.input_exp_range = input_exp_range
+        # Normalized coordinates of the color points, required for bisect
+        self.coordinates = [colors.normalize_value(2 ** ev_to_color.coordinate * 0.18,
+                                                   input_exp_range[0],
+                                                   input_exp_range[1])
+                            for ev_to_color in self.ev_colormap]
+
+    def __call__(self, y):
+        """
+        :param y: Relative luminance of the normalized input values
+        :return: Color
+        """
+        coordinates = self.coordinates
+        idx_right_neighbor = bisect.bisect(coordinates, y)
+
+        if idx_right_neighbor == 0:
+            return self.ev_colormap[idx_right_neighbor].get_color(y)
+        elif idx_right_neighbor == len(coordinates):
+            return self.ev_colormap[idx_right_neighbor - 1].get_color(y)
+        else:
+            idx_left_neighbor = idx_right_neighbor - 1
+            factor = ((y - coordinates[idx_left_neighbor]) /
+                      (coordinates[idx_right_neighbor] - coordinates[idx_left_neighbor]))
+
+            return colors.interpolate(self.ev_colormap[idx_left_neighbor].get_color(y),
+                                      self.ev_colormap[idx_right_neighbor].get_color(y),
+                                      factor)
+
+
+def get_ev_colors(transfer_function, exposure_values, input_exp_range=(-12.473931189, 4.026068812)):
+    """
+    Evaluates a transfer function at exposure values relative to middle grey.
+    :param transfer_function: Function that returns the color for the relative luminance of the normalized input
+    :param exposure_values: Exposure values
+    :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+    :return: List of colors
+    """
+    return [transfer_function(colors.normalize_value(2 ** ev * 0.18, input_exp_range[0], input_exp_range[1]))
+            for ev in exposure_values]
+
+
+def get_luminance_grid(cube_size=65, matrix=None, input_exp_range=(-12.473931189, 4.026068812), progress=None):
+    """
+    Calculates the relative luminance, that determines the color, for every entry of a LUT. The grid only depends on
+    the cube size and the matrix, therefore it can be shared by all transfer functions.
+    :param cube_size: [0, cube_size-1] is the range of input samples per channel in the LUT
+    :param matrix: Optional 3x3 matrix, given as list of rows. The normalized input of every entry is converted
+        back to scene linear values, transformed by the matrix and normalized again.
+    :param input_exp_range: Ordered tuple of the two exponents defining the input value range
+    :param progress: Optional progress.ProgressTracker, which counts a step for every slab of constant red
+    :return: Flat array with the relative luminance of every entry, in the order of the entries of file_io.load_lut()
+    """
+    inputs = [idx / (cube_size - 1) for idx in range(cube_size)]
+    grid = array('d')
+    if progress is not None:
+        progress.start_phase("luminance", cube_size)
+    if matrix is None:
+        for red in inputs:
+            grid.extend([colors.lut_entry_luminance(red, green, blue) for green in inputs for blue in inputs])
+            if progress is not None:
+                progress.advance()
+    else:
+        exponent_min, exponent_max = input_exp_range
+        linear = [colors.denormalize_value(x, exponent_min, exponent_max) for x in inputs]
+        (m00, m01, m02), (m10, m11, m12), (m20, m21, m22) = matrix
+        for red in linear:
+            transformed = [(m00 * red + m01 * green + m02 * blue,
+                            m10 * red + m11 * green + m12 * blue,
+                            m20 * red + m21 * green + m22 * blue)
+                           for green in linear for blue in linear]
+            allocated = image_processing.allocate_lg2(itertools.chain.from_iterable(transformed),
+                                                      exponent_min, exponent_max)
+            grid.extend([colors.lut_entry_luminance(*allocated[idx:idx + 3]) for idx in range(0, len(allocated), 3)])
+            if progress is not None:
+                progress.advance()
+    return grid
+
+
+def evaluate_grid(transfer_function, luminance_grid, progress=None, scanline_size=65):
+    """
+    Evaluates a transfer function for every entry of a luminance grid.
+    :param transfer_function: Function that returns the color for the relative luminance of the normalized input
+    :param luminance_grid: Flat array of relative luminance values, as returned by get_luminance_grid()
+    :param progress: Optional progress.ProgressTracker, which counts a step for every scanline
+    :param scanline_size: Number of entries per scanline, i.e. the cube size
+    :return: Flat array with the red, green and blue values of every entry
+    """
+    table = array('d')
+    if progress is None:
+        table.extend(itertools.chain.from_iterable(map(transfer_function, luminance_grid)))
+        return table
+
+    progress.start_phase("evaluate", len(luminance_grid) // scanline_size)
+    for start in range(0, len(luminance_grid), scanline_size):
+        table.extend(itertools.chain.from_iterable(map(transfer_function,
+                                                       luminance_grid[start:start + scanline_size])))
+        progress.advance()
+    return table
@@ -0,0 +1,73 @@
+# MIT License
+#
+# Copyright (c) 2019 Robert Gützkow
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+import time
+
+
+def get_snapshot(paths):
+    """
+    :param paths: Paths of the watched files
+    :return: Dictionary with the modification time and size of every file, None for missing files
+    """
+    snapshot = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            snapshot[path] = None
+    return snapshot
+
+
+def watch_files(get_paths, on_change, interval=0.1, debounce=0.3):
+    """
+    Polls the modification times of files and calls a function, once they have changed. A burst of changes, e.g. an
+    editor that saves a file in several steps or several files that are saved at once, is coalesced into one call
+    after no further change has been seen for the debounce time. Runs until it is interrupted.
+    :param get_paths: Function that returns the paths of the watched files, it is called again after every change
+    :param on_change: Function that is called with the list of changed paths
+    :param interval: Time between polls in seconds
+    :param debounce: Time in seconds without further changes, before the function is called
+    """
+    snapshot = get_snapshot(get_paths())
+    while True:
+        time.sleep(interval)
+        current = get_snapshot(snapshot)
+        if current == snapshot:
+            continue
+
+        last_change = time.monotonic()
+        changed = set()
+        while True:
+            changed.update(path for path in current if current[path] != snapshot.get(path))
+            snapshot = current
+            if time.monotonic() - last_change >= debounce:
+                break
+            time.sleep(interval)
+            current = get_snapshot(snapshot)
+            if current != snapshot:
+                last_change = time.monotonic()
+
+        on_change(sorted(changed))
+        # Files that are saved while the function runs are detected by the next poll, since their state is compared
+        # with the snapshot from before the call
+        snapshot = {path: snapshot[path] if path in snapshot else get_snapshot([path])[path] for path in get_paths()}